@@ -1,7 +1,11 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, pre_save
 
-from mapentity.signals import migrate_tiles
+from mapentity.signals import (
+    is_mapentity_model,
+    migrate_tiles,
+    update_generalized_geometries,
+)
 
 
 class MapEntityConfig(AppConfig):
@@ -12,3 +16,7 @@ class MapEntityConfig(AppConfig):
         from . import checks  # noqa: F401
 
         post_migrate.connect(migrate_tiles, sender=self)
+        # Generalized geometries are stored data, kept whether models are registered or not
+        for model in self.apps.get_models():
+            if is_mapentity_model(model) and model.generalized_geom_fields:
+                pre_save.connect(update_generalized_geometries, sender=model)
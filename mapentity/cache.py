@@ -0,0 +1,449 @@
+import datetime
+import decimal
+import gzip
+import hashlib
+import json
+import logging
+import time
+import zlib
+
+import mercantile
+from django import forms
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
+from django_filters.widgets import SuffixedMultiWidget
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+from .settings import API_SRID, app_settings
+
+logger = logging.getLogger(__name__)
+
+# Web mercator latitude limits, tiles do not exist beyond
+MERCATOR_MAX_LATITUDE = 85.051129
+LL_EPSILON = 1e-11
+# Brotli compression of layers is done on cache misses, in requests: higher
+# qualities are much slower for a few percents of size
+BROTLI_QUALITY = 5
+
+
+def get_layers_cache():
+    return caches[app_settings["GEOJSON_LAYERS_CACHE_BACKEND"]]
+
+
+def make_content_entry(content, content_type):
+    """
+    Return layers cache entry of rendered content, with its compressed variants,
+    so that cache hits do not render nor compress anything.
+    """
+    content = bytes(content)
+    entry = {
+        "content": content,
+        "content_type": content_type,
+        "etag": hashlib.md5(content).hexdigest(),
+        "gzip": gzip.compress(content, mtime=0),
+    }
+    if brotli is not None:
+        entry["br"] = brotli.compress(content, quality=BROTLI_QUALITY)
+    return entry
+
+
+def get_content_entry(lookup):
+    """Return layers cache entry stored with ``make_content_entry``, or None"""
+    entry = get_layers_cache().get(lookup)
+    # Ignore entries stored in a former format
+    return entry if isinstance(entry, dict) else None
+
+
+class ContentEntryBuilder:
+    """
+    Build a layers cache entry like ``make_content_entry``, from chunks of content
+    compressed as they come, instead of compressing the whole content at the end.
+    """
+
+    def __init__(self, content_type):
+        self.content_type = content_type
+        self.size = 0
+        self.md5 = hashlib.md5()
+        self.chunks = {"content": [], "gzip": []}
+        # Gzip container (wbits=31), with a null modification time
+        self.compressors = {"gzip": zlib.compressobj(wbits=31)}
+        if brotli is not None:
+            self.chunks["br"] = []
+            self.compressors["br"] = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def write(self, chunk):
+        chunk = bytes(chunk)
+        self.size += len(chunk)
+        self.md5.update(chunk)
+        self.chunks["content"].append(chunk)
+        self.chunks["gzip"].append(self.compressors["gzip"].compress(chunk))
+        if "br" in self.compressors:
+            self.chunks["br"].append(self.compressors["br"].process(chunk))
+
+    def finish(self):
+        self.chunks["gzip"].append(self.compressors["gzip"].flush())
+        if "br" in self.compressors:
+            self.chunks["br"].append(self.compressors["br"].finish())
+        entry = {"content_type": self.content_type, "etag": self.md5.hexdigest()}
+        for name in list(self.chunks):
+            # Chunks are released as soon as they are joined
+            entry[name] = b"".join(self.chunks.pop(name))
+        return entry
+
+
+def iter_content_entry(lookup, content, content_type):
+    """
+    Yield chunks of streamed content, and store them in layers cache once all of
+    them were sent. Interrupted streams are not stored, neither are contents
+    larger than ``GEOJSON_STREAMING_CACHE_MAX_SIZE``.
+    """
+    max_size = app_settings["GEOJSON_STREAMING_CACHE_MAX_SIZE"]
+    builder = ContentEntryBuilder(content_type)
+    for chunk in content:
+        if builder is not None:
+            builder.write(chunk)
+            if max_size is not None and builder.size > max_size:
+                # Too large to be cached, memory is released right now
+                builder = None
+        yield chunk
+    if builder is not None:
+        get_layers_cache().set(lookup, builder.finish())
+
+
+def _get_quality(params):
+    """Quality value of Accept-Encoding item parameters, 0 if invalid"""
+    for param in params:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0
+    return 1
+
+
+def _get_accepted_encodings(request):
+    accepted = set()
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        encoding, *params = (part.strip() for part in item.split(";"))
+        if _get_quality(params) <= 0:
+            continue
+        accepted.add(encoding.lower())
+    return accepted
+
+
+def get_content_entry_response(request, entry, with_etag=True):
+    """Response of cached content, compressed according to Accept-Encoding"""
+    accepted = _get_accepted_encodings(request)
+    response = HttpResponse(entry["content"], content_type=entry["content_type"])
+    for encoding in ("br", "gzip"):
+        if encoding in entry and (encoding in accepted or "*" in accepted):
+            response.content = entry[encoding]
+            response["Content-Encoding"] = encoding
+            break
+    patch_vary_headers(response, ("Accept-Encoding",))
+    if with_etag:
+        # Weak, since content may be served with different encodings
+        response["ETag"] = f"W/{quote_etag(entry['etag'])}"
+    return response
+
+
+def _model_label(model):
+    return f"{model._meta.app_label}.{model._meta.model_name}"
+
+
+def _epoch_key(model):
+    return f"mapentity_tile_epoch_{_model_label(model)}"
+
+
+def _tile_key(model, z, x, y):
+    return f"mapentity_tile_version_{_model_label(model)}_{z}_{x}_{y}"
+
+
+def _new_version():
+    """
+    Missing or evicted counters restart from a never used value, so a
+    version can not be reused for a different content.
+    """
+    return time.time_ns()
+
+
+def _bump(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Key does not exist (never set, evicted or cache flushed)
+        cache.add(key, _new_version(), timeout=None)
+
+
+def index_tile(z, x, y):
+    """Return the tile holding the version of tile z/x/y in the index.
+
+    Tiles above ``MVT_TILE_INDEX_MAX_ZOOM`` share the version of their parent tile
+    at this zoom level.
+    """
+    z, x, y = int(z), int(x), int(y)
+    max_zoom = app_settings["MVT_TILE_INDEX_MAX_ZOOM"]
+    if z > max_zoom:
+        shift = z - max_zoom
+        return max_zoom, x >> shift, y >> shift
+    return z, x, y
+
+
+def get_tile_version(model, z, x, y):
+    """Return freshness version of tile z/x/y for model, from cache only."""
+    cache = get_layers_cache()
+    keys = [_epoch_key(model), _tile_key(model, *index_tile(z, x, y))]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return "{}-{}".format(*[versions[key] for key in keys])
+
+
+def get_tile_cache_key(model, language, z, x, y, filters_key=""):
+    """
+    Cache key of tile z/x/y content for model, changes with tile version.
+    Tiles of filtered layers are keyed by their filters hash too.
+    """
+    version = get_tile_version(model, z, x, y)
+    suffix = f"_{filters_key}" if filters_key else ""
+    return f"{language}_{model._meta.model_name}_{version}_{z}_{x}_{y}{suffix}_mvt_tile"
+
+
+def get_geometry_tile_ranges(geom):
+    """
+    Return list of (z, xmin, ymin, xmax, ymax) tile ranges covered by geometry
+    bounding box, for every zoom level of the tile index.
+    """
+    if geom is None or geom.empty:
+        return []
+    if geom.srid and geom.srid != API_SRID:
+        geom = geom.transform(API_SRID, clone=True)
+    west, south, east, north = geom.extent
+    west = max(-180.0, west)
+    east = min(180.0 - LL_EPSILON, east)
+    south = max(-MERCATOR_MAX_LATITUDE, south)
+    north = min(MERCATOR_MAX_LATITUDE, north)
+    if west > east or south > north:
+        return []
+    ranges = []
+    for z in range(app_settings["MVT_TILE_INDEX_MAX_ZOOM"] + 1):
+        upper_left = mercantile.tile(west, north, z)
+        lower_right = mercantile.tile(east, south, z)
+        ranges.append((z, upper_left.x, upper_left.y, lower_right.x, lower_right.y))
+    return ranges
+
+
+def bump_model_tiles(model):
+    """Invalidate all tiles of model"""
+    _bump(get_layers_cache(), _epoch_key(model))
+
+
+def bump_geometry_tiles(model, geometries):
+    """
+    Bump version of every tile of model covered by geometries.
+
+    When geometries cover too many tiles, the whole model tiles are invalidated instead.
+    """
+    ranges = []
+    for geom in geometries:
+        ranges.extend(get_geometry_tile_ranges(geom))
+    nb_tiles = sum(
+        (xmax - xmin + 1) * (ymax - ymin + 1) for z, xmin, ymin, xmax, ymax in ranges
+    )
+    if nb_tiles > app_settings["MVT_TILE_INDEX_MAX_TILES"]:
+        bump_model_tiles(model)
+        return
+    # Versions are only compared for equality: a new unique value replaces them all
+    # in a single round trip, instead of one increment per tile
+    version = _new_version()
+    get_layers_cache().set_many(
+        {
+            _tile_key(model, z, x, y): version
+            for z, xmin, ymin, xmax, ymax in ranges
+            for x in range(xmin, xmax + 1)
+            for y in range(ymin, ymax + 1)
+        },
+        timeout=None,
+    )
+
+
+def get_tile_index_geom_field(model):
+    """Return name of the concrete geometry field used in tile index, or None"""
+    name = model.get_main_geom()
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    if not isinstance(field, GeometryField) or not field.concrete:
+        return None
+    return name
+
+
+def _generation_key(model):
+    return f"mapentity_generation_{_model_label(model)}"
+
+
+def _last_modified_key(model):
+    return f"mapentity_last_modified_{_model_label(model)}"
+
+
+def _get_or_add(cache, key):
+    value = cache.get(key)
+    if value is None:
+        value = _new_version()
+        if not cache.add(key, value, timeout=None):
+            value = cache.get(key, value)
+    return value
+
+
+def get_model_generation(model):
+    """
+    Return generation of model objects, from cache only. It is a counter started
+    from a nanoseconds timestamp, incremented by every save or delete of model
+    objects.
+    """
+    return _get_or_add(get_layers_cache(), _generation_key(model))
+
+
+def get_model_last_modified(model):
+    """
+    Last modification date of model objects, from cache only. Unknown dates
+    (evicted from cache) start from now, so that clients revalidate.
+    """
+    timestamp = _get_or_add(get_layers_cache(), _last_modified_key(model))
+    return datetime.datetime.fromtimestamp(timestamp / 1e9, tz=datetime.timezone.utc)
+
+
+def bump_model_generation(model):
+    cache = get_layers_cache()
+    # Atomic increment, concurrent bumps are never lost
+    _bump(cache, _generation_key(model))
+    cache.set(_last_modified_key(model), _new_version(), timeout=None)
+
+
+def invalidate_layer(model, geometries=None):
+    """
+    Invalidate cached layers of model: its generation, and its tiles covered by
+    geometries, or all its tiles if geometries are not known or model has
+    no geometry field.
+
+    Versions are bumped right now for the current connection, and once again on commit,
+    so that layers rendered concurrently from not yet committed data are not kept.
+    """
+    if geometries is None or get_tile_index_geom_field(model) is None:
+
+        def bump():
+            bump_model_generation(model)
+            bump_model_tiles(model)
+    else:
+
+        def bump():
+            bump_model_generation(model)
+            bump_geometry_tiles(model, geometries)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def _canonical_filter_value(value):
+    """Return a JSON serializable value, equal for equivalent filter values"""
+    if isinstance(value, models.Model):
+        return value.pk
+    if isinstance(value, models.QuerySet):
+        return sorted(str(pk) for pk in value.values_list("pk", flat=True))
+    if isinstance(value, GEOSGeometry):
+        return value.ewkt
+    if isinstance(value, slice):
+        return [
+            _canonical_filter_value(value.start),
+            _canonical_filter_value(value.stop),
+        ]
+    if isinstance(value, (list, tuple, set, frozenset)):
+        # Order of multiple choices does not change results
+        return sorted(
+            (_canonical_filter_value(item) for item in value),
+            key=lambda item: json.dumps(item, sort_keys=True),
+        )
+    if isinstance(value, (datetime.date, datetime.time, decimal.Decimal)):
+        return str(value)
+    return value
+
+
+def get_filter_params(query, ignored=("format",)):
+    """Query parameters which may filter results, with their sorted values"""
+    return {
+        key: sorted(query.getlist(key))
+        for key in query
+        if not key.startswith("_") and key not in ignored
+    }
+
+
+def get_widget_param_names(name, widget):
+    """Names of query parameters read by widget of field name"""
+    if isinstance(widget, SuffixedMultiWidget):
+        return [widget.suffixed(name, suffix) for suffix in widget.suffixes]
+    if isinstance(widget, forms.MultiWidget):
+        return [f"{name}{widget_name}" for widget_name in widget.widgets_names]
+    return [name]
+
+
+def get_filters_cache_key(view):
+    """
+    Return a canonical hash of filters applied by view on its queryset, an empty
+    string without filters, or None if filters are invalid.
+
+    Equivalent query strings (parameters order, repeated or empty values, ...)
+    share the same hash, since it is built from filtersets cleaned data.
+    """
+    request = view.request
+    if not get_filter_params(request.GET):
+        return ""
+    filtersets = []
+    queryset = view.get_queryset()
+    for backend in view.filter_backends:
+        if not hasattr(backend, "get_filterset"):
+            continue
+        filterset = backend().get_filterset(request, queryset, view)
+        if filterset is not None:
+            filtersets.append(filterset)
+    return get_filtersets_cache_key(request.GET, filtersets)
+
+
+def get_filtersets_cache_key(query, filtersets, ignored=("format",)):
+    """
+    Same as ``get_filters_cache_key``, from query parameters and bound filtersets.
+    Parameters of ignored are not part of the hash.
+    """
+    params = get_filter_params(query, ignored)
+    if not params:
+        return ""
+    filters = {}
+    for filterset in filtersets:
+        if not filterset.is_valid():
+            return None
+        for name, value in filterset.form.cleaned_data.items():
+            widget = filterset.form.fields[name].widget
+            for key in get_widget_param_names(name, widget):
+                params.pop(key, None)
+            value = _canonical_filter_value(value)
+            if value not in (None, "", []):
+                filters[name] = value
+    # Parameters unknown from filtersets are kept as is
+    filters.update({f"_{key}": values for key, values in params.items()})
+    if not filters:
+        return ""
+    raw = json.dumps(filters, sort_keys=True, default=str)
+    return hashlib.md5(raw.encode()).hexdigest()
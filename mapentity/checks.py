@@ -1,5 +1,11 @@
 from django.conf import settings
-from django.core.checks import Warning, register
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+from .search import get_missing_search_indexes
+from .settings import app_settings
 
 
 @register()
@@ -15,3 +21,38 @@ def check_old_config(app_configs, **kwargs):
         ]
 
     return []
+
+
+@register(Tags.database)
+def check_search_indexes(app_configs, databases=None, **kwargs):
+    # Models are registered along with URLs, loaded by URLs checks beforehand: they
+    # are not imported as a side effect of this check
+    errors = []
+    for alias in databases or []:
+        for model, index in get_missing_search_indexes(alias):
+            errors.append(
+                Warning(
+                    f"Search index {index.name} of {model._meta.label} does not exist.",
+                    hint="Run ./manage.py create_search_indexes",
+                    obj=model,
+                    id="mapentity.W002",
+                )
+            )
+    return errors
+
+
+@register(Tags.caches)
+def check_layers_cache(app_configs, **kwargs):
+    alias = app_settings["GEOJSON_LAYERS_CACHE_BACKEND"]
+    if not isinstance(caches[alias], (LocMemCache, DummyCache)):
+        return []
+    return [
+        Warning(
+            f"Layers cache '{alias}' (GEOJSON_LAYERS_CACHE_BACKEND) is not shared between processes.",
+            hint="Vector tiles versions, models generations (layers Last-Modified, "
+            "cached layers and counts, background exports reuse) and selections of objects "
+            "are stored in this cache: changes and selections made by a process are not "
+            "seen by the others. Use a shared cache (Redis, Memcached, database, files).",
+            id="mapentity.W003",
+        )
+    ]
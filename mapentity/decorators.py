@@ -3,7 +3,6 @@ from functools import wraps
 
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
-from django.core.cache import caches
 from django.core.exceptions import PermissionDenied
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
@@ -11,9 +10,22 @@ from django.views.decorators.cache import cache_control
 from django.views.decorators.http import last_modified as cache_last_modified
 from django.views.generic.detail import BaseDetailView
 from django.views.generic.edit import BaseUpdateView
+from rest_framework.response import Response
 from vectortiles.rest_framework.renderers import MVTRenderer
 
 from . import models as mapentity_models
+from .cache import (
+    get_content_entry,
+    get_content_entry_response,
+    get_filters_cache_key,
+    get_layers_cache,
+    get_model_generation,
+    get_model_last_modified,
+    get_tile_cache_key,
+    get_tile_version,
+    iter_content_entry,
+    make_content_entry,
+)
 from .helpers import user_has_perm
 from .renderers import GeoJSONRenderer
 from .settings import app_settings
@@ -83,7 +95,10 @@ def view_cache_latest():
                 # don't cache dataTables
                 return view_func(self, request, *args, **kwargs)
             view_model = self.model
-            cache_latest = cache_last_modified(lambda x: view_model.latest_updated())
+            # Generation is a cache lookup, no database query here
+            cache_latest = cache_last_modified(
+                lambda x: get_model_last_modified(view_model)
+            )
             cbv_cache_latest = method_decorator(cache_latest)
 
             @method_decorator(cache_control(max_age=0, must_revalidate=True))
@@ -105,81 +120,76 @@ def view_cache_response_content():
             # Check if this is an MVT endpoint (has z, x, y parameters)
             is_mvt = all(k in kwargs for k in ["z", "x", "y"])
 
-            # Do not cache if filters presents of datatables format
-            params = self.request.GET.keys()
-            with_filters = all([not p.startswith("_") for p in params])
+            # Do not cache datatables format
             if (
-                (len(params) > 0 and with_filters)
-                or kwargs.get("format") == "datatables"
+                kwargs.get("format") == "datatables"
                 or "datatables" in self.request.build_absolute_uri()
             ):
                 return view_func(self, *args, **kwargs)
 
+            # FlatGeobuf files are kept on disk by the view
+            if kwargs.get("format") == "fgb":
+                return view_func(self, *args, **kwargs)
+
+            # Responses are cached per set of filters
+            filters_key = get_filters_cache_key(self)
+            if filters_key is None:
+                # Invalid filters, let the view report errors
+                return view_func(self, *args, **kwargs)
+
             # Restore from cache or store view result
             geojson_lookup = ""
-            if hasattr(self, "view_cache_key"):
-                geojson_lookup = self.view_cache_key()
-
-            if (
-                is_mvt or not self.request.GET
-            ):  # For MVT, always cache; for others, do not cache filtered responses
-                view_model = self.model
-                language = self.request.LANGUAGE_CODE
+            view_model = self.model
+            # Layers without translated values are shared by all languages
+            language = self.get_cache_language(vector_tiles=is_mvt)
+            if is_mvt:
+                # Tile version is a cache lookup, no database query here
                 z, x, y = kwargs.get("z"), kwargs.get("x"), kwargs.get("y")
-                latest_saved, count = view_model.latest_updated_with_count(
-                    z=z, x=x, y=y
+                geojson_lookup = get_tile_cache_key(
+                    view_model, language, z, x, y, filters_key
                 )
+            else:
+                model_name = view_model._meta.model_name
+                generation = get_model_generation(view_model)
+                suffix = f"_{filters_key}" if filters_key else ""
+                geojson_lookup = (
+                    f"{language}_{model_name}_{generation}{suffix}_json_layer"
+                )
+            if geojson_lookup and hasattr(self, "view_cache_key"):
+                geojson_lookup = self.view_cache_key() + geojson_lookup
+
+            if not geojson_lookup:
+                return view_func(self, *args, **kwargs)
 
-                if latest_saved:
-                    # Add MVT-specific cache key with tile coordinates
-                    if is_mvt:
-                        geojson_lookup += "{}_{}_{}_{}_{}_{}_{}_mvt_tile".format(
-                            language,
-                            view_model._meta.model_name,
-                            latest_saved.strftime("%y%m%d%H%M%S%f"),
-                            count,
-                            z,
-                            x,
-                            y,
-                        )
-                    else:
-                        geojson_lookup += "{}_{}_{}_{}_json_layer".format(
-                            language,
-                            view_model._meta.model_name,
-                            latest_saved.strftime("%y%m%d%H%M%S%f"),
-                            count,
-                        )
-
-            geojson_cache = caches[app_settings["GEOJSON_LAYERS_CACHE_BACKEND"]]
-            if geojson_lookup:
-                content = geojson_cache.get(geojson_lookup)
-                if content:
-                    return content
+            # ETag of vector tiles is set by the endpoint, from tile version
+            with_etag = not is_mvt
+            entry = get_content_entry(geojson_lookup)
+            if entry is not None:
+                return get_content_entry_response(self.request, entry, with_etag)
 
             response = view_func(self, *args, **kwargs)
-            if geojson_lookup:
-                if not is_mvt:
-                    # Set renderer for GeoJSON
+            if response.status_code != 200:
+                return response
+            if response.streaming:
+                # Stored in cache once fully sent
+                response.streaming_content = iter_content_entry(
+                    geojson_lookup, response.streaming_content, response["Content-Type"]
+                )
+                return response
+            if isinstance(response, Response):
+                if is_mvt:
+                    response.accepted_renderer = MVTRenderer()
+                    response.accepted_media_type = "application/vnd.mapbox-vector-tile"
+                else:
                     response.accepted_renderer = GeoJSONRenderer()
                     response.accepted_media_type = "application/json"
-                    response.renderer_context = {}
-                    # Render the response before caching (required for pickling)
-                    if not response.is_rendered:
-                        response.render()
-                    geojson_cache.set(geojson_lookup, response)
-                else:
-                    # Set renderer for MVT
-                    if MVTRenderer:
-                        response.accepted_renderer = MVTRenderer()
-                        response.accepted_media_type = (
-                            "application/vnd.mapbox-vector-tile"
-                        )
-                        response.renderer_context = {}
-                        # Render the response before caching (required for pickling)
-                        if not response.is_rendered:
-                            response.render()
-                        geojson_cache.set(geojson_lookup, response)
-            return response
+                response.renderer_context = {}
+                if not response.is_rendered:
+                    response.render()
+            # Store rendered bytes only, cache hits are served without DRF
+            entry = make_content_entry(response.content, response["Content-Type"])
+            get_layers_cache().set(geojson_lookup, entry)
+            return get_content_entry_response(self.request, entry, with_etag)
 
         return _wrapped_method
 
@@ -232,10 +242,6 @@ def mvt_etag(request, *args, **kwargs):
     if not all([z, x, y]):
         return None
 
-    try:
-        qs = view.filter_queryset(view.get_queryset())
-    except Exception:
-        return None
-    max_updated, count = qs.model.latest_updated_with_count(z=z, x=x, y=y)
-    raw = f"{max_updated.timestamp() if max_updated else '0'}:{count}"
+    model = view.model or view.queryset.model
+    raw = f"{model._meta.label}:{get_tile_version(model, z, x, y)}"
     return hashlib.md5(raw.encode()).hexdigest()
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from importlib import import_module
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File
+from django.db import connections, transaction
+from django.db.models import Q
+from django.http import HttpRequest, QueryDict
+from django.urls import reverse
+from django.utils import timezone, translation
+from django.utils.translation import get_language
+
+from .cache import get_filtersets_cache_key, get_model_generation
+from .models import ExportJob
+from .settings import app_settings
+
+logger = logging.getLogger(__name__)
+
+# Parameters of export requests which are not filters
+EXPORT_PARAMS = ("format", "async")
+
+
+def get_export_key(view, fmt, query):
+    """
+    Hash of export of view in format: model, format, language, columns and
+    filters of query. Exports of users are shared, unless
+    ``share_background_exports`` is False on view.
+    """
+    # Filterset is bound with request parameters by view queryset
+    view.get_queryset()
+    filters_key = get_filtersets_cache_key(query, [view._filterform])
+    raw = [
+        view.get_model()._meta.label_lower,
+        fmt,
+        get_language(),
+        list(view.get_columns()),
+        query.urlencode() if filters_key is None else filters_key,
+    ]
+    if not view.share_background_exports:
+        raw.append(view.request.user.pk)
+    return hashlib.md5(json.dumps(raw, default=str).encode()).hexdigest()
+
+
+def create_export_job(view, fmt):
+    """
+    Create export job of view request in format. It is already done if an export
+    of same key and model generation exists.
+    """
+    request = view.request
+    model = view.get_model()
+    query = request.GET.copy()
+    for param in EXPORT_PARAMS:
+        query.pop(param, None)
+    job = ExportJob(
+        content_type=ContentType.objects.get_for_model(model),
+        user=request.user if request.user.is_authenticated else None,
+        format=fmt,
+        query_string=query.urlencode(),
+        columns=list(view.get_columns()),
+        language=get_language() or "",
+        key=get_export_key(view, fmt, query),
+        generation=get_model_generation(model),
+    )
+    reusable = job.get_reusable_job()
+    if reusable is not None:
+        job.file.name = reusable.file.name
+        job.status = ExportJob.DONE
+    job.save()
+    return job
+
+
+def get_export_job_status(job):
+    status = {
+        "id": job.pk,
+        "status": job.status,
+        "format": job.format,
+        "url": reverse("mapentity:export_job", args=[job.pk]),
+        "download_url": None,
+    }
+    if job.status == ExportJob.DONE:
+        status["download_url"] = reverse("mapentity:export_job_download", args=[job.pk])
+    return status
+
+
+def get_format_view(model):
+    """Export view class of registered model"""
+    from .registry import registry
+
+    # Models are registered along with URLs
+    import_module(settings.ROOT_URLCONF)
+    view = getattr(registry.registry.get(model), "format_view", None)
+    if view is None:
+        msg = f"Model {model._meta.label} has no export view"
+        raise ValueError(msg)
+    return view
+
+
+def claim_export_jobs(limit):
+    """
+    Mark up to limit pending jobs as running, and return their primary keys.
+    Running jobs not updated for ``EXPORT_JOBS_RUNNING_TIMEOUT`` seconds (their
+    worker was killed) are claimed again.
+    """
+    timeout = timedelta(seconds=app_settings["EXPORT_JOBS_RUNNING_TIMEOUT"])
+    stale = Q(status=ExportJob.RUNNING, date_update__lt=timezone.now() - timeout)
+    with transaction.atomic():
+        pks = list(
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=ExportJob.PENDING) | stale)
+            .order_by("date_insert")
+            .values_list("pk", flat=True)[:limit]
+        )
+        ExportJob.objects.filter(pk__in=pks).update(
+            status=ExportJob.RUNNING, date_update=timezone.now()
+        )
+    return pks
+
+
+def touch_export_jobs(pks):
+    """Keep jobs still run by a worker from being claimed again"""
+    ExportJob.objects.filter(pk__in=pks, status=ExportJob.RUNNING).update(
+        date_update=timezone.now()
+    )
+
+
+def fail_export_jobs(pks):
+    """Mark jobs still running as failed, when their process was lost"""
+    ExportJob.objects.filter(pk__in=pks, status=ExportJob.RUNNING).update(
+        status=ExportJob.FAILED, date_update=timezone.now()
+    )
+
+
+@contextmanager
+def heartbeat_export_jobs(pks, interval):
+    """Touch jobs every interval seconds from a thread, while they are run inline"""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                touch_export_jobs(pks)
+        finally:
+            # Connection of this thread
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def write_export_file(job):
+    """Render export of job with its model export view, into job file"""
+    model = job.content_type.model_class()
+    view_class = get_format_view(model)
+    request = HttpRequest()
+    request.method = "GET"
+    request.GET = QueryDict(job.query_string, mutable=True)
+    request.GET["format"] = job.format
+    request.user = job.user or AnonymousUser()
+    with translation.override(job.language or None):
+        view = view_class()
+        view.setup(request)
+        response = view.render_to_response({})
+        with tempfile.TemporaryFile(dir=app_settings["TEMP_DIR"]) as output:
+            for chunk in response:
+                output.write(chunk)
+            output.seek(0)
+            job.file.save(
+                view.get_export_filename(job.format), File(output), save=False
+            )
+
+
+def run_export_job(pk):
+    """Run export job, or reuse file of an equivalent job. Return job status."""
+    job = ExportJob.objects.select_related("content_type", "user").get(pk=pk)
+    try:
+        # Generation of exported objects, read before them
+        job.generation = get_model_generation(job.content_type.model_class())
+        reusable = job.get_reusable_job()
+        if reusable is not None:
+            job.file.name = reusable.file.name
+        else:
+            write_export_file(job)
+        job.status = ExportJob.DONE
+    except Exception:
+        msg = f"Export job {job.pk} failed"
+        logger.exception(msg)
+        job.status = ExportJob.FAILED
+    job.save()
+    return job.status
+
+
+def init_worker_process():
+    """Set up Django in export worker processes, whatever their start method"""
+    django.setup()
@@ -3,6 +3,7 @@ from django.conf import settings
 from django.contrib.gis import forms
 from django.contrib.gis.geos import Polygon
 from django.db import models
+from django.db.models import Q
 from django.db.models.fields.related import ManyToOneRel
 from django.forms import widgets
 from django_filters import (
@@ -15,7 +16,10 @@ from django_filters import (
 from django_filters.filterset import remote_queryset
 from django_filters.rest_framework import FilterSet
 from django_filters.utils import get_model_field
+from rest_framework_datatables.filters import DatatablesFilterBackend, f_search_q
 
+from mapentity.pagination import get_queryset_count
+from mapentity.search import get_search_backend
 from mapentity.settings import API_SRID, app_settings
 from mapentity.widgets import HiddenGeometryWidget
 
@@ -201,3 +205,59 @@ class MapEntityFilterSet(BaseMapEntityFilterSet):
                 },
             },
         }
+
+
+class MapEntityDatatablesFilterBackend(DatatablesFilterBackend):
+    """
+    Datatables search and ordering. Unfiltered total is counted according to
+    ``DATATABLES_COUNT_STRATEGY``, filtered count is left to pagination, which
+    counts once all filter backends were applied. Searches are built by
+    ``SEARCH_BACKEND``.
+    """
+
+    def get_search_q(self, backend, field, value, regex=False):
+        if regex:
+            return f_search_q(field, value, regex)
+        if value == "false":
+            # Sent by datatables for empty column searches
+            return Q()
+        return backend.get_q(field["name"], value)
+
+    def get_q(self, datatables_query):
+        backend = get_search_backend()
+        q = Q()
+        initial_q = Q()
+        for field in datatables_query["fields"]:
+            if not field["searchable"]:
+                continue
+            q |= self.get_search_q(
+                backend,
+                field,
+                datatables_query["search_value"],
+                datatables_query["search_regex"],
+            )
+            initial_q &= self.get_search_q(
+                backend,
+                field,
+                field.get("search_value"),
+                field.get("search_regex", False),
+            )
+        return q & initial_q
+
+    def filter_queryset(self, request, queryset, view):
+        if not self.check_renderer_format(request):
+            return queryset
+
+        total_count, approximate = get_queryset_count(view.get_queryset())
+        self.set_count_before(view, total_count)
+        view._datatables_total_count_approximate = approximate
+
+        datatables_query = self.parse_datatables_query(request, view)
+        q = self.get_q(datatables_query)
+        if q:
+            queryset = queryset.filter(q).distinct()
+
+        ordering = self.get_ordering(request, view, datatables_query["fields"])
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
@@ -0,0 +1,37 @@
+from django.contrib.gis.db.models.functions import GeoFunc, GeomOutputGeoFunc
+from django.db.models import CharField
+
+
+class SimplifyPreserveTopology(GeomOutputGeoFunc):
+    """Simplify geometry with tolerance expressed in geometry SRID units"""
+
+    arity = 2
+
+
+class GeometryType(GeoFunc):
+    """
+    Upper case geometry type (``POINT``, ``MULTIPOLYGON``...), suffixed by its
+    dimensions with SpatiaLite (``POINT Z``) or measure with PostGIS (``POINTM``)
+    """
+
+    # Same name with PostGIS and SpatiaLite (not ST_GeometryType)
+    function = "GeometryType"
+    arity = 1
+    output_field = CharField()
+
+
+class CollectionExtract(GeomOutputGeoFunc):
+    """Multi-geometry of parts of type (1: points, 2: lines, 3: polygons) of collection"""
+
+    arity = 2
+
+
+def geometry_type_names(geom_type):
+    """Values of ``GeometryType`` for geometries of geom_type, whatever their dimensions"""
+    return [
+        geom_type,
+        f"{geom_type}M",
+        f"{geom_type} Z",
+        f"{geom_type} M",
+        f"{geom_type} ZM",
+    ]
@@ -1,6 +1,8 @@
 import json
 import logging
 import math
+import os
+import re
 import string
 import time
 from mimetypes import types_map
@@ -14,6 +16,8 @@ from django.contrib.gis.geos import GEOSException, fromstr
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import IntegerField
+from django.http import FileResponse, HttpResponse
 from django.template.exceptions import TemplateDoesNotExist
 from django.template.loader import get_template
 from django.urls import resolve
@@ -22,6 +26,9 @@ from django.utils.translation import get_language
 from .settings import API_SRID, app_settings
 from .tokens import TokenManager
 
+if "modeltranslation" in settings.INSTALLED_APPS:
+    from modeltranslation.translator import NotRegistered, translator
+
 logger = logging.getLogger(__name__)
 
 
@@ -225,6 +232,87 @@ def extract_attributes_html(url, request):
     return cooked
 
 
+def get_file_range_response(request, path, content_type):
+    """
+    Response of file at path, or of a single bytes range of it when requested
+    with a ``Range`` header (206 Partial Content).
+    """
+    size = os.path.getsize(path)
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", request.headers.get("Range", "").strip())
+    if not match or match.groups() == ("", ""):
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+        response["Accept-Ranges"] = "bytes"
+        return response
+    start, end = match.groups()
+    if not start:
+        # Suffix range: last bytes of file
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    with open(path, "rb") as f:
+        f.seek(start)
+        content = f.read(end - start + 1)
+    response = HttpResponse(content, status=206, content_type=content_type)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = str(len(content))
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def get_translated_fields(model):
+    """Names of model fields translated with modeltranslation (e.g. ``name``)"""
+    if "modeltranslation" not in settings.INSTALLED_APPS:
+        return set()
+    try:
+        return set(translator.get_options_for_model(model).all_fields)
+    except NotRegistered:
+        return set()
+
+
+def encode_pk_ranges(pks):
+    """
+    Encode sorted integer primary keys as a flat list of (gap, length) pairs of
+    consecutive keys, gap being the difference between the first key of a range
+    and the last key of the previous range (or 0).
+    ``[1, 2, 3, 7, 9, 10]`` is encoded as ``[1, 3, 4, 1, 2, 2]``.
+    """
+    ranges = []
+    last = 0
+    start = previous = None
+    for pk in pks:
+        if previous is not None and pk == previous + 1:
+            previous = pk
+            continue
+        if start is not None:
+            ranges += [start - last, previous - start + 1]
+            last = previous
+        start = previous = pk
+    if start is not None:
+        ranges += [start - last, previous - start + 1]
+    return ranges
+
+
+def iter_pk_ranges(ranges):
+    """Yield (first, last) primary keys of ranges encoded by ``encode_pk_ranges``"""
+    last = 0
+    for gap, length in zip(ranges[::2], ranges[1::2]):
+        first = last + gap
+        last = first + length - 1
+        yield first, last
+
+
+def has_integer_pk(model):
+    """Whether primary keys of model are integers, which can be encoded as ranges"""
+    pk_field = model._meta.pk
+    if pk_field.is_relation:
+        pk_field = pk_field.target_field
+    return isinstance(pk_field, IntegerField)
+
+
 def user_has_perm(user, perm):
     # First check if the user has the permission (even anon user)
     if user.has_perm(perm):
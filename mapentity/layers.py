@@ -0,0 +1,120 @@
+from django.contrib.gis.db.models.functions import Centroid, SnapToGrid, Transform
+from django.contrib.gis.geos import Polygon
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+
+from .functions import SimplifyPreserveTopology
+
+GENERALIZED_GEOM_FIELD = "generalized_geom"
+CLUSTER_GEOM_FIELD = "cluster_geom"
+
+
+class GeneralizedVectorLayerMixin:
+    """
+    Simplify vector tiles geometries according to zoom level.
+
+    ``generalization`` maps a zoom level to the generalization used from this zoom on,
+    until the next defined zoom level. It is either a simplification tolerance in
+    meters (web mercator units), computed on the fly, or the name of a model field
+    holding a precomputed geometry (see ``BaseMapEntityMixin.generalized_geom_fields``).
+    A tolerance of ``0`` or ``None`` disables simplification::
+
+        generalization = {0: 1000, 8: "geom_simplified", 14: None}
+    """
+
+    generalization = None
+
+    def get_generalization(self, z):
+        generalization = self.generalization or {}
+        zooms = [zoom for zoom in generalization if zoom <= z]
+        return generalization[max(zooms)] if zooms else None
+
+    def get_tile(self, x, y, z):
+        source_geom_field = self.geom_field
+        generalization = self.get_generalization(z)
+        if isinstance(generalization, str):
+            self.geom_field = generalization
+        elif generalization:
+            self.geom_field = GENERALIZED_GEOM_FIELD
+        try:
+            return super().get_tile(x, y, z)
+        finally:
+            self.geom_field = source_geom_field
+
+    def get_vector_tile_queryset(self, z, x, y):
+        qs = super().get_vector_tile_queryset(z, x, y)
+        if self.geom_field != GENERALIZED_GEOM_FIELD:
+            return qs
+        source_geom_field = self.__class__.geom_field
+        # Pre-filter on source geometry, so that its spatial index is used
+        extent = Polygon.from_bbox(self.get_bounds(x, y, z))
+        extent.srid = 3857
+        qs = qs.filter(**{f"{source_geom_field}__intersects": extent})
+        return qs.annotate(
+            **{
+                GENERALIZED_GEOM_FIELD: SimplifyPreserveTopology(
+                    Transform(source_geom_field, 3857), self.get_generalization(z)
+                )
+            }
+        )
+
+
+class ClusteredVectorLayerMixin:
+    """
+    Aggregate features in a regular grid at low zoom levels.
+
+    Up to ``cluster_max_zoom``, each tile is divided in cells of ``cluster_size``
+    pixels (for a 256 pixels tile), and one point feature is emitted per non empty
+    cell, at its center, with the number of features of the cell in ``count``
+    attribute. Clustering is computed in database, with window functions.
+    """
+
+    cluster_max_zoom = None
+    cluster_size = 64
+
+    def is_clustered(self, z):
+        return self.cluster_max_zoom is not None and z <= self.cluster_max_zoom
+
+    def get_generalization(self, z):
+        if self.is_clustered(z):
+            return None
+        return super().get_generalization(z)
+
+    def get_tile(self, x, y, z):
+        if not self.is_clustered(z):
+            return super().get_tile(x, y, z)
+        source_geom_field, source_tile_fields = self.geom_field, self.tile_fields
+        self.geom_field, self.tile_fields = CLUSTER_GEOM_FIELD, ("count",)
+        try:
+            return super().get_tile(x, y, z)
+        finally:
+            self.geom_field, self.tile_fields = source_geom_field, source_tile_fields
+
+    def get_vector_tile_queryset(self, z, x, y):
+        qs = super().get_vector_tile_queryset(z, x, y)
+        if self.geom_field != CLUSTER_GEOM_FIELD:
+            return qs
+        source_geom_field = self.__class__.geom_field
+        xmin, ymin, xmax, ymax = self.get_bounds(x, y, z)
+        extent = Polygon.from_bbox((xmin, ymin, xmax, ymax))
+        extent.srid = 3857
+        qs = qs.filter(**{f"{source_geom_field}__intersects": extent})
+        # Grid nodes are cells centers, cells are aligned on tile boundaries
+        size = (xmax - xmin) * min(self.cluster_size, 256) / 256
+        cell = SnapToGrid(
+            Centroid(Transform(source_geom_field, 3857)),
+            size,
+            size,
+            xmin + size / 2,
+            ymin + size / 2,
+        )
+        qs = qs.annotate(**{CLUSTER_GEOM_FIELD: cell}).annotate(
+            count=Window(Count("pk"), partition_by=F(CLUSTER_GEOM_FIELD)),
+            cluster_rank=Window(
+                RowNumber(),
+                partition_by=F(CLUSTER_GEOM_FIELD),
+                order_by=F("pk").asc(),
+            ),
+        )
+        # Keep one row per cell
+        return qs.filter(cluster_rank=1)
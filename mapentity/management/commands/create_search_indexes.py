@@ -0,0 +1,82 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from mapentity.registry import registry
+from mapentity.search import get_missing_search_indexes, get_search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Create database indexes used by SEARCH_BACKEND to search registered "
+        "models from list views and autocomplete"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            action="append",
+            dest="models",
+            default=[],
+            help="Model label (app_label.model_name), all registered models by default",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only verify that indexes exist, exit with an error if some are missing",
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def get_models(self, labels):
+        models = []
+        for label in labels:
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError) as exc:
+                raise CommandError(exc) from exc
+            if model not in registry.registry:
+                msg = f"Model {label} is not registered in mapentity"
+                raise CommandError(msg)
+            models.append(model)
+        return models
+
+    def handle(self, *args, **options):
+        # Make sure models are registered at this point
+        import_module(settings.ROOT_URLCONF)
+
+        models = self.get_models(options["models"])
+        connection = connections[options["database"]]
+        backend = get_search_backend()
+        if connection.vendor != "postgresql":
+            self.stdout.write(
+                f"Search indexes are only supported with PostgreSQL, "
+                f"not {connection.vendor}."
+            )
+            return
+        missing = get_missing_search_indexes(options["database"], models)
+        if options["check"]:
+            if missing:
+                names = ", ".join(index.name for model, index in missing)
+                msg = f"Missing search indexes: {names}"
+                raise CommandError(msg)
+            self.stdout.write("All search indexes exist.")
+            return
+        if not missing:
+            self.stdout.write("All search indexes exist.")
+            return
+
+        extension = getattr(backend, "extension", None)
+        if extension:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE EXTENSION IF NOT EXISTS {connection.ops.quote_name(extension)}"
+                )
+        # Tables stay writable while concurrent indexes are built
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for model, index in missing:
+                self.stdout.write(f"Creating index {index.name} on {model._meta.label}")
+                schema_editor.add_index(model, index, concurrently=True)
+        self.stdout.write(f"{len(missing)} search index(es) created.")
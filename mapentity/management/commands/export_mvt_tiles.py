@@ -0,0 +1,80 @@
+import os
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from mapentity.tiles import export_mbtiles, export_pmtiles, get_archive_path
+
+from .seed_mvt_tiles import Command as SeedCommand
+
+
+class Command(SeedCommand):
+    help = "Export vector tiles of registered models into MBTiles or PMTiles archives"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--format",
+            choices=("mbtiles", "pmtiles"),
+            default="mbtiles",
+            help="Archive format",
+        )
+        parser.add_argument(
+            "--output-dir",
+            help="Directory of archives, MVT_ARCHIVES_DIR by default",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Render all tiles again, instead of tiles changed since last export",
+        )
+
+    def get_path(self, model, language, fmt, output_dir):
+        if not output_dir:
+            return get_archive_path(model, language, fmt)
+        os.makedirs(output_dir, exist_ok=True)
+        return os.path.join(output_dir, f"{model._meta.label_lower}-{language}.{fmt}")
+
+    def handle(self, *args, **options):
+        # Make sure models are registered at this point
+        import_module(settings.ROOT_URLCONF)
+
+        models = self.get_models(options["models"])
+        bbox = self.get_bbox(options["bbox"])
+        zooms = range(options["min_zoom"], options["max_zoom"] + 1)
+        if not zooms:
+            msg = "max-zoom must be greater than or equal to min-zoom"
+            raise CommandError(msg)
+        languages = options["languages"] or [code for code, name in settings.LANGUAGES]
+        processes = max(1, options["processes"] or 1)
+        fmt = options["format"]
+
+        for model in models:
+            for language in languages:
+                start = time.monotonic()
+                # PMTiles archives can not be updated, they are built from MBTiles
+                path = self.get_path(model, language, "mbtiles", options["output_dir"])
+                rendered, reused = export_mbtiles(
+                    model,
+                    path,
+                    language,
+                    bbox,
+                    zooms,
+                    processes=processes,
+                    chunk_size=options["chunk_size"],
+                    full=options["full"],
+                )
+                if fmt == "pmtiles":
+                    mbtiles_path = path
+                    path = self.get_path(model, language, fmt, options["output_dir"])
+                    try:
+                        export_pmtiles(mbtiles_path, path)
+                    except ValueError as exc:
+                        raise CommandError(exc) from exc
+                elapsed = time.monotonic() - start
+                self.stdout.write(
+                    f"{model._meta.label_lower} ({language}): {rendered} tiles "
+                    f"rendered, {reused} unchanged tiles kept in {elapsed:.1f}s: {path}"
+                )
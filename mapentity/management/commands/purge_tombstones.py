@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from mapentity.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete records of deleted objects older than GEOJSON_DELTA_MAX_AGE, "
+        "to be run periodically"
+    )
+
+    def handle(self, *args, **options):
+        deleted = Tombstone.purge()
+        self.stdout.write(f"{deleted} outdated tombstones deleted")
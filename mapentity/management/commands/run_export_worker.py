@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from mapentity.exports import (
+    claim_export_jobs,
+    fail_export_jobs,
+    heartbeat_export_jobs,
+    init_worker_process,
+    run_export_job,
+    touch_export_jobs,
+)
+from mapentity.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Run list exports requested in background (?async=1) with a pool of processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=2,
+            help="Number of exports run at the same time, 0 to run them in this process",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there is no pending export",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Seconds between checks of pending exports",
+        )
+        parser.add_argument(
+            "--purge-interval",
+            type=float,
+            default=600.0,
+            help="Seconds between deletions of outdated export jobs",
+        )
+
+    def write_status(self, pk, status):
+        self.stdout.write(f"Export job {pk}: {status}")
+
+    def handle(self, *args, **options):
+        # Make sure models are registered at this point
+        import_module(settings.ROOT_URLCONF)
+
+        processes = options["processes"]
+        executor = None
+        if processes > 0:
+            executor = ProcessPoolExecutor(processes, initializer=init_worker_process)
+        # Primary keys of jobs run by the pool, by future
+        futures = {}
+        next_purge = 0
+        try:
+            while True:
+                if time.monotonic() >= next_purge:
+                    ExportJob.purge()
+                    next_purge = time.monotonic() + options["purge_interval"]
+                # A job is claimed as soon as a process is free
+                pks = claim_export_jobs(max(processes, 1) - len(futures))
+                for pk in pks:
+                    if executor is None:
+                        with heartbeat_export_jobs([pk], options["sleep"]):
+                            status = run_export_job(pk)
+                        self.write_status(pk, status)
+                        continue
+                    # Database connections must not be shared with worker processes
+                    connections.close_all()
+                    futures[executor.submit(run_export_job, pk)] = pk
+                if futures:
+                    done, _ = wait(
+                        futures, timeout=options["sleep"], return_when=FIRST_COMPLETED
+                    )
+                    lost = []
+                    for future in done:
+                        pk = futures.pop(future)
+                        try:
+                            self.write_status(pk, future.result())
+                        except BrokenProcessPool:
+                            lost.append(pk)
+                    if lost:
+                        # A process died abruptly, running jobs of the pool are lost
+                        lost.extend(futures.values())
+                        fail_export_jobs(lost)
+                        for pk in lost:
+                            self.write_status(pk, ExportJob.FAILED)
+                        futures = {}
+                        executor.shutdown(wait=False)
+                        executor = ProcessPoolExecutor(
+                            processes, initializer=init_worker_process
+                        )
+                    touch_export_jobs(list(futures.values()))
+                elif pks:
+                    continue
+                elif options["once"]:
+                    break
+                else:
+                    time.sleep(options["sleep"])
+        finally:
+            if executor is not None:
+                executor.shutdown()
@@ -0,0 +1,167 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib import import_module
+
+import mercantile
+from django.apps import apps
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import translation
+
+from mapentity.cache import get_layers_cache
+from mapentity.registry import registry
+from mapentity.settings import app_settings
+from mapentity.tiles import (
+    cache_tile,
+    get_tile_lookup,
+    get_tile_viewset,
+    init_worker,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def seed_tiles(model_label, language, tiles):
+    """Render tiles of model and store them in layers cache. Empty tiles are skipped."""
+    model = apps.get_model(model_label)
+    viewset = get_tile_viewset(model)
+    rendered = 0
+    with translation.override(language):
+        for z, x, y in tiles:
+            # Version read before rendering: a tile rendered before a change is
+            # not stored under the version of this change
+            lookup = get_tile_lookup(viewset, model, language, z, x, y)
+            content = viewset.get_layer_tiles(z, x, y)
+            if not content:
+                continue
+            cache_tile(lookup, content)
+            rendered += 1
+    return rendered, len(tiles)
+
+
+class Command(BaseCommand):
+    help = "Pre-render vector tiles of registered models into layers cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            action="append",
+            dest="models",
+            default=[],
+            help="Model label to seed (app_label.model_name), all layers by default",
+        )
+        parser.add_argument(
+            "--bbox",
+            help="Bounding box xmin,ymin,xmax,ymax in WGS84, map bounds by default",
+        )
+        parser.add_argument("--min-zoom", type=int, default=0)
+        parser.add_argument("--max-zoom", type=int, default=10)
+        parser.add_argument(
+            "--language",
+            action="append",
+            dest="languages",
+            default=[],
+            help="Language to seed, all available languages by default",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=64,
+            help="Number of tiles rendered by each worker task",
+        )
+
+    def get_models(self, labels):
+        layers = [
+            model
+            for model, options in registry.registry.items()
+            if model._meta.app_label != "mapentity" and options.layer
+        ]
+        if not labels:
+            return layers
+        models = []
+        for label in labels:
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError) as exc:
+                raise CommandError(exc) from exc
+            if model not in registry.registry:
+                msg = f"Model {label} is not registered in mapentity"
+                raise CommandError(msg)
+            models.append(model)
+        return models
+
+    def get_bbox(self, bbox):
+        if not bbox:
+            (xmin, ymin), (xmax, ymax) = app_settings["MAPLIBRE_CONFIG"]["BOUNDS"]
+            return xmin, ymin, xmax, ymax
+        try:
+            xmin, ymin, xmax, ymax = (float(v) for v in bbox.split(","))
+        except ValueError as exc:
+            msg = "bbox must be xmin,ymin,xmax,ymax"
+            raise CommandError(msg) from exc
+        return xmin, ymin, xmax, ymax
+
+    def get_tasks(self, models, languages, bbox, zooms, chunk_size):
+        tiles = [(t.z, t.x, t.y) for t in mercantile.tiles(*bbox, zooms)]
+        for model in models:
+            model_languages = languages
+            if not registry.registry[model].vector_tiles_translated:
+                # Tiles are shared by all languages
+                model_languages = languages[:1]
+            for language in model_languages:
+                for i in range(0, len(tiles), chunk_size):
+                    yield model._meta.label_lower, language, tiles[i : i + chunk_size]
+
+    def handle(self, *args, **options):
+        # Make sure models are registered at this point
+        import_module(settings.ROOT_URLCONF)
+
+        models = self.get_models(options["models"])
+        bbox = self.get_bbox(options["bbox"])
+        zooms = range(options["min_zoom"], options["max_zoom"] + 1)
+        if not zooms:
+            msg = "max-zoom must be greater than or equal to min-zoom"
+            raise CommandError(msg)
+        languages = options["languages"] or [code for code, name in settings.LANGUAGES]
+        processes = max(1, options["processes"] or 1)
+        tasks = self.get_tasks(models, languages, bbox, zooms, options["chunk_size"])
+
+        if isinstance(get_layers_cache(), LocMemCache):
+            self.stderr.write(
+                "Layers cache backend is local memory: seeded tiles will not be "
+                "shared with web server processes."
+            )
+
+        start = time.monotonic()
+        rendered = total = 0
+        if processes == 1:
+            for task in tasks:
+                nb_rendered, nb_tiles = seed_tiles(*task)
+                rendered += nb_rendered
+                total += nb_tiles
+        else:
+            # Database connections can not be shared with worker processes
+            connections.close_all()
+            with ProcessPoolExecutor(processes, initializer=init_worker) as executor:
+                futures = [executor.submit(seed_tiles, *task) for task in tasks]
+                for future in as_completed(futures):
+                    nb_rendered, nb_tiles = future.result()
+                    rendered += nb_rendered
+                    total += nb_tiles
+        elapsed = time.monotonic() - start
+
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(
+            f"{rendered} tiles cached, {total - rendered} empty tiles skipped "
+            f"in {elapsed:.1f}s ({rate:.1f} tiles/s)"
+        )
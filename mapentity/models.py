@@ -1,5 +1,6 @@
 import math
 import os
+from datetime import timedelta
 
 import mercantile
 from django.conf import settings
@@ -8,6 +9,7 @@ from django.contrib.admin.models import ADDITION, CHANGE, DELETION
 from django.contrib.admin.models import LogEntry as BaseLogEntry
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.gis.db.models.functions import Transform
 from django.contrib.gis.geos import Polygon
 from django.core.exceptions import FieldError, ObjectDoesNotExist
 from django.core.files.storage import default_storage
@@ -15,6 +17,7 @@ from django.db import models, transaction
 from django.db.models import Count, Max
 from django.db.utils import OperationalError
 from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
 from django.utils.formats import localize
 from django.utils.translation import gettext_lazy as _
 from paperclip.settings import get_attachment_model
@@ -23,6 +26,7 @@ from rest_framework import permissions as rest_permissions
 
 from mapentity.templatetags.mapentity_tags import humanize_timesince
 
+from .functions import SimplifyPreserveTopology
 from .helpers import (
     capture_map_image,
     clone_attachment,
@@ -96,6 +100,15 @@ class MapEntityRestPermissions(rest_permissions.DjangoModelPermissions):
     }
 
 
+class MapEntitySelectionPermissions(MapEntityRestPermissions):
+    """Selections are created (POST) from objects the user can read"""
+
+    perms_map = {
+        **MapEntityRestPermissions.perms_map,
+        "POST": ["%(app_label)s.read_%(model_name)s"],
+    }
+
+
 class DuplicateMixin:
     can_duplicate = True
 
@@ -167,6 +180,9 @@ class DuplicateMixin:
 
 class BaseMapEntityMixin(DuplicateMixin, models.Model):
     _entity = None
+    # {field name: tolerance in meters}, generalized copies of main geometry kept
+    # in sync on save, that can be used in vector tiles generalization
+    generalized_geom_fields = None
     capture_map_image_waitfor = ".maplibre-tile-loaded"  # faire attention à ceci au moment de mettre en place le control de capture
 
     class Meta:
@@ -241,6 +257,37 @@ class BaseMapEntityMixin(DuplicateMixin, models.Model):
         latest, count = cls.latest_updated_with_count(**kwargs)
         return latest
 
+    def update_generalized_geometries(self):
+        """Compute generalized copies of main geometry"""
+        geom = self.get_geom()
+        for field_name, tolerance in (self.generalized_geom_fields or {}).items():
+            generalized = None
+            if geom is not None:
+                srid = self._meta.get_field(field_name).srid
+                generalized = geom.transform(3857, clone=True).simplify(
+                    tolerance, preserve_topology=True
+                )
+                generalized.transform(srid)
+            setattr(self, field_name, generalized)
+
+    @classmethod
+    def refresh_generalized_geometries(cls, queryset=None):
+        """Compute generalized copies of main geometry in database, for all objects"""
+        if not cls.generalized_geom_fields:
+            return 0
+        if queryset is None:
+            queryset = cls._base_manager.all()
+        geom_field = app_settings["GEOM_FIELD_NAME"]
+        return queryset.update(
+            **{
+                field_name: Transform(
+                    SimplifyPreserveTopology(Transform(geom_field, 3857), tolerance),
+                    cls._meta.get_field(field_name).srid,
+                )
+                for field_name, tolerance in cls.generalized_geom_fields.items()
+            }
+        )
+
     def get_date_update(self):
         try:
             fname = app_settings["DATE_UPDATE_FIELD_NAME"]
@@ -556,3 +603,113 @@ class LogEntry(BaseMapEntityMixin, BaseLogEntry):
     def latest_updated(cls, **kwargs):
         latest, count = cls.latest_updated_with_count(**kwargs)
         return latest
+
+
+class Tombstone(models.Model):
+    """Primary key of a deleted object, kept for delta layers"""
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.TextField()
+    deletion_time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        app_label = "mapentity"
+        indexes = [models.Index(fields=["content_type", "deletion_time"])]
+
+    def __str__(self):
+        return f"{self.content_type} {self.object_id}"
+
+    @classmethod
+    def from_instance(cls, instance):
+        """Unsaved tombstone of instance, to be recorded in bulk"""
+        return cls(
+            content_type=ContentType.objects.get_for_model(type(instance)),
+            object_id=str(instance.pk),
+        )
+
+    @classmethod
+    def record(cls, instance):
+        """Record deletion of instance"""
+        cls.from_instance(instance).save()
+
+    @classmethod
+    def purge(cls):
+        """Delete tombstones older than ``GEOJSON_DELTA_MAX_AGE``, return their number"""
+        max_age = timedelta(seconds=app_settings["GEOJSON_DELTA_MAX_AGE"])
+        deleted, _ = cls.objects.filter(
+            deletion_time__lt=timezone.now() - max_age
+        ).delete()
+        return deleted
+
+    @classmethod
+    def get_deleted_ids(cls, model, since):
+        """Primary keys of model objects deleted since date"""
+        ids = cls.objects.filter(
+            content_type=ContentType.objects.get_for_model(model),
+            deletion_time__gt=since,
+        ).values_list("object_id", flat=True)
+        return [model._meta.pk.to_python(pk) for pk in ids.distinct()]
+
+
+class ExportJob(models.Model):
+    """List export run in background by ``run_export_worker`` command"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, _("Pending")),
+        (RUNNING, _("Running")),
+        (DONE, _("Done")),
+        (FAILED, _("Failed")),
+    )
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.CASCADE
+    )
+    format = models.CharField(max_length=10)
+    query_string = models.TextField(blank=True)
+    columns = models.JSONField(default=list)
+    language = models.CharField(max_length=10, blank=True)
+    # Hash of model, format, language, columns and filters, see exports.py
+    key = models.CharField(max_length=32)
+    generation = models.BigIntegerField(null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    file = models.FileField(upload_to="mapentity/exports/", blank=True)
+    date_insert = models.DateTimeField(default=timezone.now)
+    date_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = "mapentity"
+        indexes = [
+            models.Index(fields=["status", "date_insert"]),
+            models.Index(fields=["key", "generation"]),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type} {self.format} ({self.status})"
+
+    def get_reusable_job(self):
+        """Finished job with same key and model generation, whose file can be reused"""
+        return (
+            ExportJob.objects.filter(
+                key=self.key, generation=self.generation, status=self.DONE
+            )
+            .exclude(pk=self.pk)
+            .exclude(file="")
+            .order_by("-date_update")
+            .first()
+        )
+
+    @classmethod
+    def purge(cls):
+        """Delete jobs older than ``EXPORT_JOBS_MAX_AGE``, and their unshared files"""
+        max_age = timedelta(seconds=app_settings["EXPORT_JOBS_MAX_AGE"])
+        outdated = cls.objects.filter(date_insert__lt=timezone.now() - max_age)
+        names = set(outdated.exclude(file="").values_list("file", flat=True))
+        outdated.delete()
+        names -= set(cls.objects.filter(file__in=names).values_list("file", flat=True))
+        for name in names:
+            default_storage.delete(name)
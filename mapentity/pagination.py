@@ -1,17 +1,289 @@
+import hashlib
+
+from django.apps import apps
+from django.core import signing
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import (
+    EmptyResultSet,
+    FieldDoesNotExist,
+    ImproperlyConfigured,
+)
+from django.db import connections
+from django.db.models import Q
 from rest_framework_datatables.pagination import DatatablesPageNumberPagination
+from rest_framework_datatables.utils import get_param
+
+from .cache import get_layers_cache, get_model_generation
+from .settings import app_settings
+from .signals import layer_models
+
+COUNT_STRATEGIES = ("exact", "cached", "estimate")
+
+
+def get_estimated_count(queryset):
+    """
+    Return number of rows of queryset estimated by PostgreSQL planner, from table
+    statistics for whole tables, or None with other databases.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    query = queryset.query
+    try:
+        sql, params = query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    with connection.cursor() as cursor:
+        if not query.where and not query.distinct and len(query.alias_map) <= 1:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+            # Never analyzed tables have no statistics (-1)
+            if row and row[0] >= 0:
+                return int(row[0])
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def get_query_models(queryset, sql):
+    """Models whose tables are read by SQL of queryset (joins and subqueries)"""
+    quote_name = connections[queryset.db].ops.quote_name
+    models = {queryset.model}
+    models.update(
+        model for model in apps.get_models() if quote_name(model._meta.db_table) in sql
+    )
+    return sorted(models, key=lambda model: model._meta.label_lower)
+
+
+def get_cached_count(queryset):
+    """
+    Return exact number of rows of queryset, kept in layers cache until objects
+    of the models it reads change. Changes of models without generation (not
+    registered MapEntity models) are not tracked: counts reading them are kept for
+    ``DATATABLES_COUNT_CACHE_TIMEOUT`` seconds only.
+    """
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    generations = []
+    timeout = DEFAULT_TIMEOUT
+    for model in get_query_models(queryset, sql):
+        if model in layer_models:
+            generations.append(
+                f"{model._meta.label_lower}:{get_model_generation(model)}"
+            )
+        else:
+            timeout = app_settings["DATATABLES_COUNT_CACHE_TIMEOUT"]
+    raw = "\n".join([sql, *generations])
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    key = f"mapentity_count_{queryset.model._meta.label_lower}_{digest}"
+    cache = get_layers_cache()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout=timeout)
+    return count
+
+
+def get_queryset_count(queryset, strategy=None):
+    """
+    Return (count, approximate) of queryset rows, according to
+    ``DATATABLES_COUNT_STRATEGY`` setting:
+
+    * ``exact``: counted on every request
+    * ``cached``: counted once per query and generations of models it reads
+    * ``estimate``: planner estimate, above ``DATATABLES_COUNT_ESTIMATE_THRESHOLD``
+      rows, counted below
+    """
+    strategy = strategy or app_settings["DATATABLES_COUNT_STRATEGY"]
+    if strategy not in COUNT_STRATEGIES:
+        msg = f"DATATABLES_COUNT_STRATEGY must be one of {', '.join(COUNT_STRATEGIES)}"
+        raise ImproperlyConfigured(msg)
+    if strategy == "cached":
+        return get_cached_count(queryset), False
+    if strategy == "estimate":
+        estimate = get_estimated_count(queryset)
+        threshold = app_settings["DATATABLES_COUNT_ESTIMATE_THRESHOLD"]
+        if estimate is not None and estimate >= threshold:
+            return estimate, True
+    return queryset.count(), False
+
+
+def get_keyset_ordering(queryset):
+    """
+    Return (field, descending) of queryset ordering, or None if keyset pagination
+    can not be used for it. Ordering must be the primary key, or a single not null
+    indexed column (or ``DATE_UPDATE_FIELD_NAME``) then the primary key.
+    Unordered querysets are ordered by primary key.
+    """
+    query = queryset.query
+    opts = queryset.model._meta
+    terms = query.order_by or (opts.ordering if query.default_ordering else ())
+    if not terms:
+        return opts.pk, False
+    ordering = []
+    for term in terms:
+        if not isinstance(term, str) or term == "?":
+            return None
+        descending = term.startswith("-")
+        name = term.lstrip("-")
+        try:
+            field = opts.pk if name == "pk" else opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        ordering.append((field, descending))
+        if field.primary_key:
+            break
+    if not ordering or len(ordering) > 2:
+        return None
+    if ordering[-1][0].primary_key:
+        if len(ordering) == 2 and ordering[0][1] != ordering[1][1]:
+            # Mixed directions
+            return None
+        field, descending = ordering[0]
+    elif len(ordering) == 1:
+        field, descending = ordering[0]
+    else:
+        return None
+    if field.primary_key:
+        return field, descending
+    indexed = (
+        field.unique
+        or field.db_index
+        or field.name == app_settings["DATE_UPDATE_FIELD_NAME"]
+    )
+    if field.is_relation or field.null or not field.concrete or not indexed:
+        return None
+    return field, descending
 
 
 class MapentityDatatablePagination(DatatablesPageNumberPagination):
     """Custom datatable pagination for Mapentity list views."""
 
+    approximate = False
+    # Seek pages from a cursor instead of OFFSET, see DATATABLES_KEYSET_PAGINATION
+    keyset_pagination = None
+    cursor_query_param = "cursor"
+    next_cursor = previous_cursor = None
+
     def get_count_and_total_count(self, queryset, view):
         """Handle count for all filters"""
-        count = (
-            queryset.count()
-        )  # replace count by real count - not only drf-datatables count
+        # replace count by real count - not only drf-datatables count
+        count, self.approximate = get_queryset_count(queryset)
         if hasattr(view, "_datatables_total_count"):
             total_count = view._datatables_total_count
             del view._datatables_total_count
+            if getattr(view, "_datatables_total_count_approximate", False):
+                self.approximate = True
         else:  # pragma: no cover
             total_count = count
         return count, total_count
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.is_datatable_request and self.approximate:
+            # Told to the list view, which displays it
+            response.data["recordsApproximate"] = True
+        if self.is_datatable_request and self.next_cursor:
+            response.data["nextCursor"] = self.next_cursor
+        if self.is_datatable_request and self.previous_cursor:
+            response.data["previousCursor"] = self.previous_cursor
+        return response
+
+    def paginate_queryset(self, queryset, request, view=None):
+        keyset_pagination = self.keyset_pagination
+        if keyset_pagination is None:
+            keyset_pagination = app_settings["DATATABLES_KEYSET_PAGINATION"]
+        if (
+            not keyset_pagination
+            or request.accepted_renderer.format != "datatables"
+            or get_param(request, "length") == "-1"
+        ):
+            return super().paginate_queryset(queryset, request, view)
+        keyset = get_keyset_ordering(queryset)
+        if keyset is None:
+            # Arbitrary ordering
+            return super().paginate_queryset(queryset, request, view)
+        field, descending = keyset
+        pk_name = queryset.model._meta.pk.name
+        prefix = "-" if descending else ""
+        queryset = queryset.order_by(
+            *dict.fromkeys([f"{prefix}{field.name}", f"{prefix}{pk_name}"])
+        )
+        try:
+            digest = hashlib.md5(str(queryset.query).encode()).hexdigest()
+        except EmptyResultSet:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.count, self.total_count = self.get_count_and_total_count(queryset, view)
+        self.is_datatable_request = True
+        self.page_query_param = "start"
+        self.page_size_query_param = "length"
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            start = max(0, int(get_param(request, "start", 0)))
+        except ValueError:
+            start = 0
+
+        cursor = self.decode_cursor(request, digest, start)
+        if cursor is None:
+            rows = list(queryset[start : start + page_size])
+        else:
+            backwards, value, pk = cursor
+            value, pk = field.to_python(value), queryset.model._meta.pk.to_python(pk)
+            after = descending == backwards
+            lookup = "gt" if after else "lt"
+            seek = Q(**{f"{field.name}__{lookup}": value})
+            if not field.primary_key:
+                seek |= Q(**{field.name: value, f"{pk_name}__{lookup}": pk})
+            page = queryset.filter(seek)
+            if backwards:
+                page = page.reverse()
+            rows = list(page[:page_size])
+            if backwards:
+                rows.reverse()
+
+        if rows and start + page_size < self.count:
+            self.next_cursor = self.encode_cursor(
+                rows[-1], field, digest, start + page_size, False
+            )
+        if rows and start >= page_size:
+            self.previous_cursor = self.encode_cursor(
+                rows[0], field, digest, start - page_size, True
+            )
+        return rows
+
+    def encode_cursor(self, obj, field, digest, start, backwards):
+        """Opaque cursor of page at start, seeking from obj in a query"""
+        data = {
+            "q": digest,
+            "s": start,
+            "b": backwards,
+            "v": field.value_to_string(obj),
+            "k": obj._meta.pk.value_to_string(obj),
+        }
+        return signing.dumps(data, salt=__name__, compress=True)
+
+    def decode_cursor(self, request, digest, start):
+        """
+        Return (backwards, value, pk) of request cursor, or None if there is no
+        valid cursor for this query and page.
+        """
+        cursor = request.GET.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            data = signing.loads(cursor, salt=__name__)
+        except signing.BadSignature:
+            return None
+        if data.get("q") != digest or data.get("s") != start:
+            # Filters, ordering or page changed since
+            return None
+        return data["b"], data["v"], data["k"]
@@ -0,0 +1,89 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+def get_relation(model, name):
+    """Return relation of model named name (as read on instances), or None"""
+    opts = model._meta
+    try:
+        field = opts.get_field(name)
+    except FieldDoesNotExist:
+        # Reverse relations are read from their accessor (e.g. ``road_set``)
+        for rel in opts.related_objects:
+            if rel.get_accessor_name() == name:
+                return rel
+        return None
+    if not field.is_relation:
+        return None
+    if field.auto_created and not field.concrete and field.get_accessor_name() != name:
+        # Query name of a reverse relation, not readable on instances
+        return None
+    return field
+
+
+def get_related_lookups(model, paths):
+    """
+    Return (select_related, prefetch_related) lookups of relations read through
+    paths (``field`` or ``field__subfield``) on objects of model. Parts of paths
+    which are not relations (columns, properties...) are ignored.
+    """
+    select_related, prefetch_related = set(), set()
+    for path in paths:
+        current, lookup, single = model, [], True
+        for name in path.split("__"):
+            field = get_relation(current, name)
+            if field is None:
+                break
+            lookup.append(name)
+            if field.related_model is None:
+                # Generic foreign keys can only be prefetched
+                single = False
+                break
+            if field.many_to_many or field.one_to_many:
+                single = False
+            elif single:
+                select_related.add("__".join(lookup))
+            current = field.related_model
+        if lookup and not single:
+            prefetch_related.add("__".join(lookup))
+    # Shorter lookups are followed by longer ones
+    select_related = {
+        lookup
+        for lookup in select_related
+        if not any(other.startswith(f"{lookup}__") for other in select_related)
+    }
+    return sorted(select_related), sorted(prefetch_related)
+
+
+def get_serializer_paths(serializer, prefix=""):
+    """Return paths of relations which may be read by serializer fields"""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    paths = []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*":
+            continue
+        source_attrs = field.source_attrs
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            # Primary key is read from foreign key column
+            source_attrs = source_attrs[:-1]
+        if not source_attrs:
+            continue
+        path = prefix + "__".join(source_attrs)
+        paths.append(path)
+        if isinstance(field, serializers.BaseSerializer):
+            paths.extend(get_serializer_paths(field, f"{path}__"))
+    return paths
+
+
+def plan_queryset(queryset, paths):
+    """
+    Join or prefetch relations read through paths, so that serializing objects of
+    queryset does not query database for every object.
+    """
+    select_related, prefetch_related = get_related_lookups(queryset.model, paths)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
@@ -19,6 +19,7 @@ from rest_framework.serializers import ModelSerializer
 from mapentity import models as mapentity_models
 from mapentity.serializers import MapentityGeojsonModelSerializer
 from mapentity.settings import app_settings
+from mapentity.signals import connect_layer_signals
 from mapentity.utils import get_internal_user
 
 logger = logging.getLogger(__name__)
@@ -35,6 +36,17 @@ class MapEntityOptions:
     icon_small = ""
     icon_big = ""
     dynamic_views = None
+    rest_viewset = None
+    vector_tiles_generalization = None  # {zoom: tolerance or field}, see layers.py
+    vector_tiles_cluster_max_zoom = None
+    vector_tiles_cluster_size = None
+    # Whether layers may change with language, detected from rest_viewset
+    geojson_translated = True
+    vector_tiles_translated = True
+    # Fields searched by list view and autocomplete, see search.py
+    search_fields = None
+    # Export view, used by background exports, see exports.py
+    format_view = None
 
     def __init__(self, model):
         self.model = model
@@ -111,6 +123,15 @@ class MapEntityOptions:
 
                 picked.append(dynamic_view)
 
+        self.format_view = next(
+            (
+                view
+                for view in picked
+                if issubclass(view, mapentity_views.MapEntityFormat)
+            ),
+            None,
+        )
+
         # Dynamically define REST missing viewset
         if rest_viewset is None:
             _queryset = self.get_queryset()
@@ -123,6 +144,16 @@ class MapEntityOptions:
                 geojson_serializer_class = _geojson_serializer
 
             rest_viewset = dynamic_viewset
+        self.rest_viewset = rest_viewset
+        self.geojson_translated = self.is_translated("is_geojson_translated")
+        self.vector_tiles_translated = self.is_translated("is_vector_tiles_translated")
+        searchable_columns = (
+            list_view or mapentity_views.MapEntityList
+        ).searchable_columns
+        autocomplete_fields = getattr(rest_viewset, "autocomplete_search_fields", None)
+        self.search_fields = list(
+            dict.fromkeys([*searchable_columns, *(autocomplete_fields or [])])
+        )
         self.rest_router.register(
             r"api/" + self.modelname + "/drf/" + self.modelname + "s",
             rest_viewset,
@@ -132,6 +163,21 @@ class MapEntityOptions:
         # Returns Django URL patterns
         return self.__view_classes_to_url(*picked)
 
+    def is_translated(self, method_name):
+        """
+        Result of viewset method telling whether its layer may change with
+        language. Viewsets may need a request, which does not exist while URLs
+        are loaded: layers are then considered translated.
+        """
+        try:
+            viewset = self.rest_viewset()
+            if viewset.model is None:
+                viewset.model = self.model
+            return getattr(viewset, method_name)()
+        except Exception:
+            logger.debug("Can not inspect %s without request", self.rest_viewset)
+            return True
+
     def get_serializer(self):
         _model = self.model
 
@@ -147,7 +193,7 @@ class MapEntityOptions:
         _model = self.model
 
         class Serializer(MapentityGeojsonModelSerializer):
-            class Meta(MapentityGeojsonModelSerializer):
+            class Meta(MapentityGeojsonModelSerializer.Meta):
                 model = _model
 
         return Serializer
@@ -233,6 +279,7 @@ class Registry:
             options.menu = menu
 
         self.registry[model] = options
+        connect_layer_signals(model)
 
         try:
             self.content_type_ids.append(model.get_content_type_id())
@@ -1,6 +1,18 @@
-from rest_framework.renderers import JSONRenderer
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 
 
 class GeoJSONRenderer(JSONRenderer):
     format = "geojson"
     media_type = "application/geo+json"
+
+
+class FlatGeobufRenderer(BaseRenderer):
+    """FlatGeobuf files are written by the view, rendered content is returned as is"""
+
+    format = "fgb"
+    media_type = "application/flatgeobuf"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
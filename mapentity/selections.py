@@ -0,0 +1,124 @@
+import json
+import secrets
+from copy import copy
+from itertools import chain
+
+from django.apps import apps
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Expression, Q
+from django.http import QueryDict
+
+from .cache import get_layers_cache
+from .helpers import encode_pk_ranges, has_integer_pk, iter_pk_ranges
+from .settings import app_settings
+
+
+def _selection_key(token):
+    return f"mapentity_selection_{token}"
+
+
+class PrimaryKeys(Expression):
+    """
+    Primary keys of model bound as one parameter, whatever their number, to be
+    used as ``pk__in`` value: an array on PostgreSQL, a JSON array on SQLite,
+    instead of a parameter per key.
+    """
+
+    def __init__(self, model, pks):
+        super().__init__(output_field=model._meta.pk)
+        self.pks = list(pks)
+
+    def as_sql(self, compiler, connection):
+        if not self.pks:
+            raise EmptyResultSet
+        if connection.vendor == "postgresql":
+            db_type = self.output_field.db_type(connection)
+            return f"SELECT unnest(%s::{db_type}[])", [self.pks]
+        if connection.vendor == "sqlite":
+            return "SELECT value FROM json_each(%s)", [json.dumps(self.pks)]
+        return ", ".join(["%s"] * len(self.pks)), self.pks
+
+
+def create_selection(queryset, user=None, filters=None):
+    """
+    Store a selection of queryset objects in layers cache for
+    ``SELECTION_TIMEOUT`` seconds, and return (token, count). Selections made
+    by filters are stored as their query string, applied again when used (see
+    ``get_selection_q``). Otherwise primary keys are stored, integer keys as
+    ranges (see ``encode_pk_ranges``).
+    """
+    model = queryset.model
+    entry = {
+        "model": model._meta.label_lower,
+        "user": getattr(user, "pk", None),
+    }
+    if filters is not None:
+        entry["filters"] = filters
+        entry["count"] = queryset.count()
+    else:
+        pks = list(
+            queryset.order_by("pk")
+            .values_list("pk", flat=True)
+            .iterator(chunk_size=app_settings["GEOJSON_STREAMING_CHUNK_SIZE"])
+        )
+        entry["count"] = len(pks)
+        if has_integer_pk(model):
+            entry["ranges"] = encode_pk_ranges(pks)
+        else:
+            entry["pks"] = [str(pk) for pk in pks]
+    token = secrets.token_urlsafe(16)
+    get_layers_cache().set(
+        _selection_key(token), entry, timeout=app_settings["SELECTION_TIMEOUT"]
+    )
+    return token, entry["count"]
+
+
+def get_selection(token, model, user=None):
+    """Return stored selection of token, or None if expired or not of model and user"""
+    entry = get_layers_cache().get(_selection_key(token))
+    if not isinstance(entry, dict):
+        return None
+    if entry["model"] != model._meta.label_lower:
+        return None
+    if entry["user"] != getattr(user, "pk", None):
+        return None
+    return entry
+
+
+def get_filtered_queryset(model, request, filters):
+    """Objects of model filtered by query string, as by its registered API viewset"""
+    from .registry import registry
+
+    http_request = copy(request)
+    http_request.method = "GET"
+    http_request.GET = QueryDict(filters)
+    viewset = registry.registry[model].rest_viewset()
+    if viewset.model is None:
+        viewset.model = model
+    viewset.action_map = {}
+    viewset.args, viewset.kwargs = (), {}
+    # As the selection.json endpoint
+    viewset.format_kwarg = "json"
+    viewset.request = viewset.initialize_request(http_request)
+    negotiated = viewset.perform_content_negotiation(viewset.request)
+    viewset.request.accepted_renderer, viewset.request.accepted_media_type = negotiated
+    # Objects are not serialized, see MapEntityViewSet.filter_queryset
+    viewset.action = "selection"
+    return viewset.filter_queryset(viewset.get_queryset())
+
+
+def get_selection_q(selection, request=None):
+    """
+    Q of objects of selection: filters of request are applied again in a
+    subquery, primary keys are bound as one parameter (see ``PrimaryKeys``).
+    """
+    model = apps.get_model(selection["model"])
+    if "filters" in selection:
+        queryset = get_filtered_queryset(model, request, selection["filters"])
+        return Q(pk__in=queryset.values("pk"))
+    if "pks" in selection:
+        return Q(pk__in=PrimaryKeys(model, selection["pks"]))
+    pks = chain.from_iterable(
+        range(first, last + 1) for first, last in iter_pk_ranges(selection["ranges"])
+    )
+    return Q(pk__in=PrimaryKeys(model, pks))
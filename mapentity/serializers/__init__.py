@@ -1,9 +1,20 @@
 from .commasv import CSVSerializer
 from .datatables import MapentityDatatableSerializer
+from .flatgeobuf import (
+    FlatGeobufSerializer,
+    get_flatgeobuf_geom_type,
+    get_flatgeobuf_path,
+    get_flatgeobuf_property_type,
+    remove_outdated_flatgeobuf,
+    write_flatgeobuf,
+)
 from .geojson import (
     MapentityGeojsonModelListSerializer,
     MapentityGeojsonModelSerializer,
+    iter_geojson_collection,
+    render_database_geojson_collection,
 )
+from .geopackage import GeoPackageSerializer, get_geopackage_property_type
 from .gpx import GPXSerializer
 from .helpers import field_as_string, json_django_dumps, plain_text, smart_plain_text
 from .shapefile import ZipShapeSerializer
@@ -13,10 +24,20 @@ __all__ = [
     "smart_plain_text",
     "field_as_string",
     "CSVSerializer",
+    "FlatGeobufSerializer",
+    "get_flatgeobuf_geom_type",
+    "get_flatgeobuf_path",
+    "get_flatgeobuf_property_type",
+    "remove_outdated_flatgeobuf",
+    "write_flatgeobuf",
+    "GeoPackageSerializer",
+    "get_geopackage_property_type",
     "GPXSerializer",
     "MapentityDatatableSerializer",
     "MapentityGeojsonModelSerializer",
     "MapentityGeojsonModelListSerializer",
+    "iter_geojson_collection",
+    "render_database_geojson_collection",
     "ZipShapeSerializer",
     "json_django_dumps",
 ]
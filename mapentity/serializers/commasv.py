@@ -1,8 +1,10 @@
 import csv
 from functools import partial
+from io import StringIO
 
 from django.core.exceptions import FieldDoesNotExist
 from django.core.serializers.base import Serializer
+from django.db.models import QuerySet
 from django.db.models.fields.related import ForeignKey, ManyToManyField
 from django.utils.encoding import smart_str
 from django.utils.translation import gettext as _
@@ -11,6 +13,8 @@ from .helpers import field_as_string, smart_plain_text
 
 
 class CSVSerializer(Serializer):
+    chunk_size = 2000
+
     def getters_csv(self, columns, model, ascii):
         getters = {}
         for field in columns:
@@ -47,24 +51,44 @@ class CSVSerializer(Serializer):
             headers.append(smart_str(c))
         return headers
 
-    def serialize(self, queryset, **options):
+    def iter_chunks(self, queryset, **options):
         """
-        Uses self.columns, containing fieldnames to produce the CSV.
-        The header of the csv is made of the verbose name of each field.
+        Yield CSV content by chunks: header first, then rows by ``chunk_size``.
+        Objects are read from a server side cursor, their prefetched relations
+        are fetched for every chunk.
         """
         model = options.pop("model", None) or queryset.model
         columns = options.pop("fields")
-        stream = options.pop("stream")
         ascii = options.get("ensure_ascii", True)
-
-        headers = self.get_csv_header(columns, model)
+        chunk_size = options.get("chunk_size") or self.chunk_size
 
         getters = self.getters_csv(columns, model, ascii)
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+
+        def flush():
+            content = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return content
 
-        def get_lines():
-            yield headers
-            for obj in queryset:
-                yield [getters[field](obj, field) for field in columns]
+        writer.writerow(self.get_csv_header(columns, model))
+        yield flush()
+        if isinstance(queryset, QuerySet):
+            queryset = queryset.iterator(chunk_size=chunk_size)
+        for i, obj in enumerate(queryset, start=1):
+            writer.writerow([getters[field](obj, field) for field in columns])
+            if i % chunk_size == 0:
+                yield flush()
+        content = flush()
+        if content:
+            yield content
 
-        writer = csv.writer(stream)
-        writer.writerows(get_lines())
+    def serialize(self, queryset, **options):
+        """
+        Uses self.columns, containing fieldnames to produce the CSV.
+        The header of the csv is made of the verbose name of each field.
+        """
+        stream = options.pop("stream")
+        for chunk in self.iter_chunks(queryset, **options):
+            stream.write(chunk)
@@ -0,0 +1,174 @@
+import glob
+import json
+import os
+import uuid
+
+import fiona
+from django.contrib.gis.db.models.fields import (
+    GeometryCollectionField,
+    GeometryField,
+)
+from django.core.serializers.base import Serializer
+from fiona.crs import CRS
+from rest_framework import serializers
+
+from ..settings import API_SRID, app_settings
+from .helpers import field_as_string
+from .shapefile import geo_field_from_model
+
+FLATGEOBUF_PROPERTY_TYPES = {
+    "AutoField": "int",
+    "BigAutoField": "int",
+    "BigIntegerField": "int",
+    "BooleanField": "bool",
+    "FloatField": "float",
+    "IntegerField": "int",
+    "PositiveBigIntegerField": "int",
+    "PositiveIntegerField": "int",
+    "PositiveSmallIntegerField": "int",
+    "SmallAutoField": "int",
+    "SmallIntegerField": "int",
+}
+
+PROPERTY_CONVERTERS = {"int": int, "float": float, "bool": bool}
+
+SERIALIZER_PROPERTY_TYPES = (
+    (serializers.BooleanField, "bool"),
+    (serializers.IntegerField, "int"),
+    (serializers.FloatField, "float"),
+)
+
+
+def get_flatgeobuf_geom_type(model):
+    """FlatGeobuf geometry type of model main geometry field"""
+    geo_field = geo_field_from_model(model, model.get_main_geom())
+    if geo_field.geom_type in (
+        GeometryField.geom_type,
+        GeometryCollectionField.geom_type,
+    ):
+        # Mixed geometry types
+        return "Unknown"
+    return geo_field.geom_class().geom_type
+
+
+def get_flatgeobuf_property_type(field):
+    """FlatGeobuf type of property, from the serializer field producing its values"""
+    for field_class, property_type in SERIALIZER_PROPERTY_TYPES:
+        if isinstance(field, field_class):
+            return property_type
+    return "str"
+
+
+def convert_property(value, property_type):
+    if value is None:
+        return None
+    if property_type in PROPERTY_CONVERTERS:
+        return PROPERTY_CONVERTERS[property_type](value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def write_flatgeobuf(path, features, geom_type, properties_schema):
+    """
+    Write GeoJSON features (in API_SRID) into a FlatGeobuf file at path, with its
+    packed Hilbert R-tree spatial index. The file is replaced atomically.
+
+    Features are consumed one by one, features without geometry are skipped.
+    """
+    # GDAL writes a directory of layers when extension is not .fgb
+    tmp_path = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.fgb")
+    schema = {"geometry": geom_type, "properties": properties_schema}
+    try:
+        with fiona.open(
+            tmp_path,
+            mode="w",
+            driver="FlatGeobuf",
+            schema=schema,
+            crs=CRS.from_epsg(API_SRID),
+            SPATIAL_INDEX="YES",
+        ) as layer:
+            layer.writerecords(
+                {
+                    "geometry": feature["geometry"],
+                    "properties": {
+                        name: convert_property(
+                            feature["properties"].get(name), property_type
+                        )
+                        for name, property_type in properties_schema.items()
+                    },
+                }
+                for feature in features
+                if feature["geometry"]
+            )
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_flatgeobuf_path(model, language, filters_key, version):
+    """Path of cached FlatGeobuf file of model layer, for a freshness version"""
+    directory = os.path.join(app_settings["TEMP_DIR"], "flatgeobuf")
+    os.makedirs(directory, exist_ok=True)
+    prefix = f"{model._meta.label_lower}-{language}-{filters_key or 'all'}"
+    return os.path.join(directory, f"{prefix}-{version}.fgb")
+
+
+def remove_flatgeobuf(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        # Removed concurrently
+        pass
+
+
+def remove_outdated_flatgeobuf(path):
+    """
+    Remove files of the same layer as path, for other freshness versions, and the
+    least recently used files beyond ``FLATGEOBUF_CACHE_MAX_FILES``
+    """
+    prefix = path.rsplit("-", 1)[0]
+    for outdated in glob.glob(glob.escape(prefix) + "-*.fgb"):
+        if outdated != path:
+            remove_flatgeobuf(outdated)
+    others = []
+    for other in glob.glob(os.path.join(os.path.dirname(path), "*.fgb")):
+        if other != path:
+            try:
+                others.append((os.path.getmtime(other), other))
+            except FileNotFoundError:
+                pass
+    others.sort(reverse=True)
+    for _, other in others[app_settings["FLATGEOBUF_CACHE_MAX_FILES"] - 1 :]:
+        remove_flatgeobuf(other)
+
+
+class FlatGeobufSerializer(Serializer):
+    """Export queryset columns as strings into a FlatGeobuf file, in API_SRID"""
+
+    def serialize(self, queryset, **options):
+        columns = options.pop("fields")
+        path = options.pop("path")
+        model = options.pop("model", None) or queryset.model
+        geo_field_name = model.get_main_geom()
+
+        def get_features():
+            for obj in queryset.iterator(chunk_size=2000):
+                geom = getattr(obj, geo_field_name)
+                if geom is None:
+                    continue
+                geom = geom.transform(API_SRID, clone=True)
+                yield {
+                    "geometry": json.loads(geom.json),
+                    "properties": {
+                        column: field_as_string(obj, column) for column in columns
+                    },
+                }
+
+        write_flatgeobuf(
+            path,
+            get_features(),
+            get_flatgeobuf_geom_type(model),
+            {column: "str" for column in columns},
+        )
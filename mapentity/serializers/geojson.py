@@ -1,9 +1,15 @@
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.db import connections
+from django.db.models import F
+from rest_framework import serializers
+from rest_framework.settings import api_settings
 from rest_framework_gis.fields import GeometryField
 from rest_framework_gis.serializers import (
     GeoFeatureModelListSerializer,
     GeoFeatureModelSerializer,
 )
 
+from ..renderers import GeoJSONRenderer
 from ..settings import app_settings
 
 
@@ -19,6 +25,33 @@ class MapentityGeojsonModelListSerializer(GeoFeatureModelListSerializer):
         return representation
 
 
+def iter_geojson_collection(serializer, queryset, chunk_size=2000):
+    """
+    Yield the FeatureCollection of a GeoJSON list serializer as encoded chunks.
+
+    Features are read from a server side cursor and encoded one by one, so that
+    the whole collection is never held in memory. The output is the same as
+    the one of the list serializer rendered with ``GeoJSONRenderer``.
+    """
+    renderer = GeoJSONRenderer()
+    collection = {"type": "FeatureCollection", "features": []}
+    if isinstance(serializer, MapentityGeojsonModelListSerializer):
+        collection["model"] = serializer.child.Meta.model._meta.label_lower
+    head, tail = renderer.render(collection).split(b"[]", 1)
+    separator = b"," if api_settings.COMPACT_JSON else b", "
+
+    yield head + b"["
+    prefix, batch = b"", []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        batch.append(renderer.render(serializer.child.to_representation(obj)))
+        if len(batch) == chunk_size:
+            yield prefix + separator.join(batch)
+            prefix, batch = separator, []
+    if batch:
+        yield prefix + separator.join(batch)
+    yield b"]" + tail
+
+
 class MapentityGeojsonModelSerializer(GeoFeatureModelSerializer):
     api_geom = GeometryField(
         read_only=True, precision=app_settings.get("GEOJSON_PRECISION")
@@ -31,3 +64,126 @@ class MapentityGeojsonModelSerializer(GeoFeatureModelSerializer):
         fields = [
             "id",
         ]
+
+
+# Serializer fields whose representation is the raw column value
+DATABASE_GEOJSON_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.FloatField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+DATABASE_GEOJSON_MODEL_FIELDS = (
+    "AutoField",
+    "BigAutoField",
+    "BigIntegerField",
+    "BooleanField",
+    "CharField",
+    "FloatField",
+    "IntegerField",
+    "PositiveBigIntegerField",
+    "PositiveIntegerField",
+    "PositiveSmallIntegerField",
+    "SlugField",
+    "SmallAutoField",
+    "SmallIntegerField",
+    "TextField",
+)
+
+
+def get_database_geojson_columns(serializer, queryset):
+    """
+    Return list of (property name, model field attname) of GeoJSON serializer
+    properties, or None if some of them can not be read as is from database.
+    """
+    cls = type(serializer)
+    if (
+        cls.to_representation is not GeoFeatureModelSerializer.to_representation
+        or cls.get_properties is not GeoFeatureModelSerializer.get_properties
+    ):
+        return None
+    meta = serializer.Meta
+    if meta.id_field or meta.bbox_geo_field or meta.auto_bbox:
+        return None
+    if meta.geo_field not in queryset.query.annotations:
+        # Geometry must be transformed into API_SRID by get_queryset()
+        return None
+    model_opts = meta.model._meta
+    columns = []
+    for name, field in serializer.fields.items():
+        if name == meta.geo_field or field.write_only:
+            continue
+        # Declared fields may change representation of values
+        if name in cls._declared_fields or not isinstance(
+            field, DATABASE_GEOJSON_FIELDS
+        ):
+            return None
+        try:
+            model_field = model_opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not model_field.concrete or model_field.many_to_many:
+            return None
+        # Foreign keys are serialized as their column value
+        value_field = (
+            model_field.target_field if model_field.many_to_one else model_field
+        )
+        if value_field.get_internal_type() not in DATABASE_GEOJSON_MODEL_FIELDS:
+            return None
+        columns.append((name, model_field.attname))
+    return columns
+
+
+def get_database_geojson_sql(serializer, queryset):
+    """
+    Return (sql, params) of the query building the FeatureCollection of a GeoJSON
+    list serializer in PostGIS, or None if it can not be built in database.
+    """
+    child = serializer.child
+    columns = get_database_geojson_columns(child, queryset)
+    if columns is None:
+        return None
+    geo_field = child.Meta.geo_field
+    precision = child.fields[geo_field].precision
+    aliases = {f"_geojson_{i}": F(attname) for i, (name, attname) in enumerate(columns)}
+    inner = queryset.values(geo_field, **aliases)
+    try:
+        inner_sql, inner_params = inner.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+
+    qn = connections[queryset.db].ops.quote_name
+    properties = ", ".join(f"%s::text, sub.{qn(alias)}" for alias in aliases)
+    params = [15 if precision is None else precision]
+    params += [name for name, attname in columns]
+    sql = (
+        "SELECT json_build_object('type', 'FeatureCollection', 'features', "
+        # Aggregates of a sorted subquery keep its order
+        "COALESCE(json_agg(json_build_object('type', 'Feature', 'geometry', "
+        f"ST_AsGeoJSON(sub.{qn(geo_field)}, %s)::json, "
+        f"'properties', json_build_object({properties}))), '[]'::json)"
+    )
+    if isinstance(serializer, MapentityGeojsonModelListSerializer):
+        sql += ", 'model', %s::text"
+        params.append(child.Meta.model._meta.label_lower)
+    sql += f")::text FROM ({inner_sql}) sub"
+    return sql, params + list(inner_params)
+
+
+def render_database_geojson_collection(serializer, queryset):
+    """
+    Return the FeatureCollection of a GeoJSON list serializer encoded by PostGIS,
+    or None if not possible (other database, or properties not pushed down).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    query = get_database_geojson_sql(serializer, queryset)
+    if query is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(*query)
+        return cursor.fetchone()[0].encode()
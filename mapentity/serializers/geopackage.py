@@ -0,0 +1,107 @@
+import json
+from itertools import islice
+
+import fiona
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.base import Serializer
+from fiona.crs import CRS
+
+from ..settings import app_settings
+from .flatgeobuf import FLATGEOBUF_PROPERTY_TYPES, convert_property
+from .helpers import field_as_string
+from .shapefile import GeometryLayersMixin, geo_field_from_model
+
+GEOPACKAGE_PROPERTY_TYPES = {
+    **FLATGEOBUF_PROPERTY_TYPES,
+    "DateField": "date",
+    "DateTimeField": "datetime",
+    "DecimalField": "float",
+}
+
+
+def get_geopackage_property_type(model, name):
+    """
+    GeoPackage type of column, from model field of the same name.
+    Relations and fields with choices are exported as their display value,
+    like in other formats.
+    """
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return "str"
+    if not field.concrete or field.is_relation or field.choices:
+        return "str"
+    return GEOPACKAGE_PROPERTY_TYPES.get(field.get_internal_type(), "str")
+
+
+def get_geopackage_property(obj, column, property_type):
+    """Value of column of obj: typed from model field, display value for strings"""
+    if property_type == "str":
+        return field_as_string(obj, column)
+    value = obj._meta.get_field(column).value_from_object(obj)
+    if property_type in ("date", "datetime"):
+        # Written by fiona from date objects
+        return value
+    return convert_property(value, property_type)
+
+
+class GeoPackageSerializer(GeometryLayersMixin, Serializer):
+    """
+    Export queryset columns into a GeoPackage file, with one layer per geometry
+    type, typed columns and spatial indexes
+    """
+
+    #: Features written per transaction
+    batch_size = 10000
+
+    def serialize(self, queryset, **options):
+        columns = options.pop("fields")
+        path = options.pop("path")
+        model = options.pop("model", None) or queryset.model
+        properties_schema = {
+            column: get_geopackage_property_type(model, column) for column in columns
+        }
+        layers = self.get_layers(queryset, model)
+        written = False
+        for iterable, get_geom, geom_type, srid in layers:
+            features = (
+                {
+                    "geometry": json.loads(get_geom(obj).json),
+                    "properties": {
+                        column: get_geopackage_property(obj, column, property_type)
+                        for column, property_type in properties_schema.items()
+                    },
+                }
+                for obj in iterable
+                if get_geom(obj)
+            )
+            layer_name = f"{model._meta.model_name}_{geom_type.lower()}"
+            with self.open_layer(
+                path, layer_name, geom_type, properties_schema, srid
+            ) as layer:
+                # Each call is written in its own transaction
+                while batch := list(islice(features, self.batch_size)):
+                    layer.writerecords(batch)
+            written = True
+        if not written:
+            # No object with geometry, file still holds an empty layer
+            geo_field = geo_field_from_model(model, app_settings["GEOM_FIELD_NAME"])
+            self.open_layer(
+                path,
+                model._meta.model_name,
+                "Unknown",
+                properties_schema,
+                geo_field.srid,
+            ).close()
+
+    def open_layer(self, path, name, geom_type, properties_schema, srid):
+        """Create layer in GeoPackage file at path, which is created if needed"""
+        return fiona.open(
+            path,
+            mode="w",
+            driver="GPKG",
+            layer=name,
+            schema={"geometry": geom_type, "properties": properties_schema},
+            crs=CRS.from_epsg(srid),
+            SPATIAL_INDEX="YES",
+        )
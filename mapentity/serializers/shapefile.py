@@ -1,10 +1,11 @@
 import json
 import os
-import shutil
 import unicodedata
 import uuid
 import zipfile
 from io import BytesIO
+from itertools import chain
+from operator import attrgetter
 
 import fiona
 from django.contrib.gis.db.models.fields import (
@@ -17,6 +18,7 @@ from django.contrib.gis.db.models.fields import (
     PointField,
     PolygonField,
 )
+from django.contrib.gis.db.models.functions import NumGeometries
 from django.contrib.gis.geos import (
     LineString,
     MultiLineString,
@@ -28,98 +30,175 @@ from django.contrib.gis.geos import (
 from django.contrib.gis.geos.collections import GeometryCollection
 from django.core.exceptions import FieldDoesNotExist
 from django.core.serializers.base import Serializer
+from django.db.models import Case, F, Q, QuerySet, When
 from django.db.models.fields.related import ForeignKey, ManyToManyField
 from django.utils.encoding import smart_str
 from django.utils.translation import gettext as _
 from fiona.crs import from_epsg
 
+from ..functions import CollectionExtract, GeometryType, geometry_type_names
 from ..settings import app_settings
 from .helpers import field_as_string, smart_plain_text
 
 os.environ["SHAPE_ENCODING"] = "UTF-8"
 
 
-class ZipShapeSerializer(Serializer):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.path_directory = os.path.join(app_settings["TEMP_DIR"], str(uuid.uuid4()))
-        os.mkdir(self.path_directory)
+class ZipStream:
+    """Write-only file object whose content is emptied each time it is read"""
 
-    def serialize(self, queryset, **options):
-        columns = options.pop("fields")
-        stream = options.pop("stream")
-        model = options.pop("model", None) or queryset.model
-        delete = options.pop("delete", True)
-        filename = options.pop("filename", "shp_download")
-        # Zip all shapefiles created temporarily
-        self._create_shape(self.path_directory, queryset, model, columns)
-        self.zip_shapefiles(self.path_directory, stream, filename)
-        if delete:
-            shutil.rmtree(self.path_directory)
+    def __init__(self):
+        self.chunks = []
 
-    def zip_shapefiles(self, shape_directory, stream, filename):
-        buffr = BytesIO()
-        zipf = zipfile.ZipFile(buffr, "w", compression=zipfile.ZIP_DEFLATED)
-        path = os.path.normpath(shape_directory)
-        if path != os.curdir and path != shape_directory:
-            zipf.write(path, os.path.relpath(path, shape_directory))
-        for dirpath, dirnames, filenames in os.walk(shape_directory):
-            for name in sorted(dirnames):
-                path = os.path.normpath(os.path.join(dirpath, name))
-                zipf.write(path, os.path.relpath(path, shape_directory))
-            for name in filenames:
-                path = os.path.normpath(os.path.join(dirpath, name))
-                if os.path.isfile(path):
-                    zipf.write(path, os.path.relpath(path, shape_directory))
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
 
-        zipf.close()
-        buffr.flush()  # zip.close() writes stuff.
-        stream.write(buffr.getvalue())
-        buffr.close()
+    def flush(self):
+        pass
 
-    def _create_shape(self, shape_directory, queryset, model, columns):
-        """Split a test_shapes into one or more test_shapes (one for point and one for linestring)"""
+    def read(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class MemoryShapefile:
+    """
+    Shapefile files (``.shp``, ``.shx``, ``.dbf``...) written uncompressed in
+    memory, by name. Used as fiona ``opener``.
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def __call__(self, path, mode="rb"):
+        name = os.path.basename(path)
+        if "w" in mode:
+            self.files[name] = MemoryShapefileBuffer()
+        elif name not in self.files:
+            raise FileNotFoundError(path)
+        buffer = self.files[name]
+        buffer.seek(0)
+        return buffer
+
+
+class MemoryShapefileBuffer(BytesIO):
+    """Buffer kept once closed by GDAL, freed with its ``MemoryShapefile``"""
+
+    def close(self):
+        pass
+
+
+class GeometryLayersMixin:
+    """Split objects of a serializer into layers of a single geometry type"""
+
+    #: Objects read per query when layers are read from database
+    chunk_size = 2000
+
+    def get_layers(self, queryset, model):
+        """
+        Return iterable of (iterable, get_geom, geom_type, srid) layers: one per
+        geometry type if model geometry field is generic
+        """
         geo_field = geo_field_from_model(model, app_settings["GEOM_FIELD_NAME"])
         get_geom, geom_type, srid = info_from_geo_field(geo_field)
-        if geom_type.upper() in (
+        if geom_type.upper() not in (
             GeometryField.geom_type,
             GeometryCollectionField.geom_type,
         ):
-            (
-                by_points,
-                by_linestrings,
-                by_polygons,
-                multipoints,
-                multilinestrings,
-                multipolygons,
-            ) = self.split_bygeom(queryset, geom_getter=get_geom)
-
-            for split_qs, split_geom_field in (
-                (by_points, PointField),
-                (by_linestrings, LineStringField),
-                (by_polygons, PolygonField),
-                (multipoints, MultiPointField),
-                (multilinestrings, MultiLineStringField),
-                (multipolygons, MultiPolygonField),
-            ):
-                if len(split_qs) == 0:
-                    continue
-                split_geom_type = split_geom_field.geom_class().geom_type
-                shape_write(
-                    shape_directory,
-                    split_qs,
-                    model,
-                    columns,
-                    get_geom,
-                    split_geom_type,
-                    srid,
-                )
-
-        else:
             geom_type = geo_field.geom_class().geom_type
-            shape_write(
-                shape_directory, queryset, model, columns, get_geom, geom_type, srid
+            return [(self._iterator(queryset), get_geom, geom_type, srid)]
+        if not self.can_split_in_database(queryset, geo_field.name):
+            return self._split_layers(queryset, get_geom, srid)
+        return self._iter_database_layers(queryset, geo_field.name, get_geom, srid)
+
+    def can_split_in_database(self, queryset, field_name):
+        if not isinstance(queryset, QuerySet):
+            return False
+        if field_name in queryset.query.annotations:
+            return True
+        return any(
+            field.name == field_name for field in queryset.model._meta.concrete_fields
+        )
+
+    def get_layer_queryset(
+        self, queryset, field_name, geom_type, srid, collection_type=None
+    ):
+        """
+        Objects of queryset with a geometry of geom_type. With collection_type
+        (1: points, 2: lines, 3: polygons), objects with parts of this type in
+        their geometry collection are added, and geometries are read from
+        ``layer_geom`` annotation.
+        """
+        queryset = queryset.alias(layer_geom_type=GeometryType(field_name))
+        geom_types = geometry_type_names(geom_type)
+        if collection_type is None:
+            return queryset.filter(layer_geom_type__in=geom_types)
+        collection_types = geometry_type_names(GeometryCollectionField.geom_type)
+        queryset = queryset.annotate(
+            layer_geom=Case(
+                When(
+                    layer_geom_type__in=collection_types,
+                    then=CollectionExtract(field_name, collection_type),
+                ),
+                default=F(field_name),
+                output_field=GeometryField(srid=srid),
+            )
+        ).alias(layer_geom_parts=NumGeometries("layer_geom"))
+        return queryset.filter(
+            Q(layer_geom_type__in=geom_types)
+            | Q(layer_geom_type__in=collection_types, layer_geom_parts__gt=0)
+        )
+
+    def _iter_database_layers(self, queryset, field_name, get_geom, srid):
+        """Layers split by geometry type in database, one query per layer"""
+        for split_geom_field, collection_type in (
+            (PointField, None),
+            (LineStringField, None),
+            (PolygonField, None),
+            (MultiPointField, 1),
+            (MultiLineStringField, 2),
+            (MultiPolygonField, 3),
+        ):
+            layer_queryset = self.get_layer_queryset(
+                queryset, field_name, split_geom_field.geom_type, srid, collection_type
             )
+            iterator = self._iterator(layer_queryset)
+            first = next(iterator, None)
+            if first is None:
+                continue
+            split_geom_type = split_geom_field.geom_class().geom_type
+            yield (
+                chain([first], iterator),
+                get_geom if collection_type is None else attrgetter("layer_geom"),
+                split_geom_type,
+                srid,
+            )
+
+    def _split_layers(self, iterable, get_geom, srid):
+        """Layers split by geometry type in Python, for geometries not in database"""
+        layers = []
+        for split_qs, split_geom_field in zip(
+            self.split_bygeom(iterable, geom_getter=get_geom),
+            (
+                PointField,
+                LineStringField,
+                PolygonField,
+                MultiPointField,
+                MultiLineStringField,
+                MultiPolygonField,
+            ),
+        ):
+            if len(split_qs) == 0:
+                continue
+            split_geom_type = split_geom_field.geom_class().geom_type
+            layers.append((split_qs, get_geom, split_geom_type, srid))
+        return layers
+
+    def _iterator(self, iterable):
+        if isinstance(iterable, QuerySet):
+            return iterable.iterator(chunk_size=self.chunk_size)
+        return iter(iterable)
 
     def split_bygeom(self, iterable, geom_getter=lambda x: x.geom):
         """Split an iterable in two list (points, linestring)"""
@@ -182,11 +261,97 @@ class ZipShapeSerializer(Serializer):
         )
 
 
+class ZipShapeSerializer(GeometryLayersMixin, Serializer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Only used to keep shapefiles on disk (``delete=False``)
+        self.path_directory = os.path.join(app_settings["TEMP_DIR"], str(uuid.uuid4()))
+
+    def serialize(self, queryset, **options):
+        columns = options.pop("fields")
+        stream = options.pop("stream")
+        model = options.pop("model", None) or queryset.model
+        delete = options.pop("delete", True)
+        filename = options.pop("filename", "shp_download")
+        if delete:
+            for chunk in self.iter_zip(queryset, model, columns):
+                stream.write(chunk)
+            return
+        # Zip all shapefiles kept in path_directory
+        layers = self.get_layers(queryset, model)
+        os.makedirs(self.path_directory, exist_ok=True)
+        for iterable, get_geom, geom_type, srid in layers:
+            shape_write(
+                self.path_directory, iterable, model, columns, get_geom, geom_type, srid
+            )
+        self.zip_shapefiles(self.path_directory, stream, filename)
+
+    def iter_zip(self, queryset, model, columns):
+        """
+        Return iterator of ZIP archive of shapefiles, sent one layer after the
+        other. Layers are written uncompressed in memory (``MemoryShapefile``),
+        nothing is written on disk.
+        """
+        # Fail before response starts if model has no geometry
+        layers = self.get_layers(queryset, model)
+        return self._iter_zip(layers, model, columns)
+
+    def _iter_zip(self, layers, model, columns):
+        output = ZipStream()
+        # Output is not seekable: entries are written with data descriptors
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zipf:
+            for iterable, get_geom, geom_type, srid in layers:
+                memory_shapefile = MemoryShapefile()
+                shape_write(
+                    memory_shapefile,
+                    iterable,
+                    model,
+                    columns,
+                    get_geom,
+                    geom_type,
+                    srid,
+                )
+                # Each file is compressed once, and freed once in the archive
+                for name in list(memory_shapefile.files):
+                    buffer = memory_shapefile.files.pop(name)
+                    zipf.writestr(name, buffer.getbuffer())
+                    yield output.read()
+        yield output.read()
+
+    def zip_shapefiles(self, shape_directory, stream, filename):
+        buffr = BytesIO()
+        zipf = zipfile.ZipFile(buffr, "w", compression=zipfile.ZIP_DEFLATED)
+        path = os.path.normpath(shape_directory)
+        if path != os.curdir and path != shape_directory:
+            zipf.write(path, os.path.relpath(path, shape_directory))
+        for dirpath, dirnames, filenames in os.walk(shape_directory):
+            for name in sorted(dirnames):
+                path = os.path.normpath(os.path.join(dirpath, name))
+                zipf.write(path, os.path.relpath(path, shape_directory))
+            for name in filenames:
+                path = os.path.normpath(os.path.join(dirpath, name))
+                if os.path.isfile(path):
+                    zipf.write(path, os.path.relpath(path, shape_directory))
+
+        zipf.close()
+        buffr.flush()  # zip.close() writes stuff.
+        stream.write(buffr.getvalue())
+        buffr.close()
+
+    def _create_shape(self, shape_directory, queryset, model, columns):
+        """Split a test_shapes into one or more test_shapes (one for point and one for linestring)"""
+        for iterable, get_geom, geom_type, srid in self.get_layers(queryset, model):
+            shape_write(
+                shape_directory, iterable, model, columns, get_geom, geom_type, srid
+            )
+
+
 def shape_write(
     shape_directory, iterable, model, columns, get_geom, geom_type, srid, srid_out=None
 ):
     """
-    Write tempfile with shape layer.
+    Write tempfile with shape layer. Shape directory may also be a
+    ``MemoryShapefile``.
     """
 
     headers = []
@@ -222,19 +387,19 @@ def shape_write(
         def transform(ogr_geom):
             return ogr_geom
 
-    for item in iterable:
-        geom = get_geom(item)
-        if geom:
-            geom = transform(geom)
-            shape.write(
-                {
-                    "geometry": json.loads(geom.json),
-                    "properties": get_serialized_properties(
-                        model, item, columns, columns_headers
-                    ),
-                }
-            )
-    shape.close()
+    with shape:
+        for item in iterable:
+            geom = get_geom(item)
+            if geom:
+                geom = transform(geom)
+                shape.write(
+                    {
+                        "geometry": json.loads(geom.json),
+                        "properties": get_serialized_properties(
+                            model, item, columns, columns_headers
+                        ),
+                    }
+                )
 
 
 def get_serialized_properties(model, item, columns, columns_headers):
@@ -275,15 +440,18 @@ def create_shape_format_layer(directory, headers, geom_type, srid, srid_out=None
         "geometry": geom_type,
         "properties": properties_schema,
     }
-    shape = fiona.open(
-        os.path.join(directory, f"{geom_type}.shp"),
-        layer=geom_type,
-        mode="w",
-        driver="ESRI Shapefile",
-        schema=schema,
-        encoding="UTF-8",
-        crs=from_epsg(srid),
-    )
+    options = {
+        "layer": geom_type,
+        "mode": "w",
+        "driver": "ESRI Shapefile",
+        "schema": schema,
+        "encoding": "UTF-8",
+        "crs": from_epsg(srid),
+    }
+    if isinstance(directory, MemoryShapefile):
+        shape = fiona.open(f"{geom_type}.shp", opener=directory, **options)
+    else:
+        shape = fiona.open(os.path.join(directory, f"{geom_type}.shp"), **options)
     return shape, headers
 
 
@@ -115,6 +115,24 @@ app_settings = dict(
         "ANONYMOUS_VIEWS_PERMS": tuple(),
         "GEOJSON_LAYERS_CACHE_BACKEND": "default",
         "GEOJSON_PRECISION": None,
+        "GEOJSON_STREAMING": False,
+        "GEOJSON_STREAMING_CHUNK_SIZE": 2000,
+        "GEOJSON_STREAMING_CACHE_MAX_SIZE": 64 * 1024 * 1024,
+        "GEOJSON_DATABASE_RENDERING": False,
+        "GEOJSON_DELTA_MAX_AGE": 7 * 24 * 3600,
+        "GEOJSON_DELTA_MARGIN": 300,
+        "FLATGEOBUF_CACHE_MAX_FILES": 100,
+        "DATATABLES_COUNT_STRATEGY": "exact",
+        "DATATABLES_COUNT_ESTIMATE_THRESHOLD": 100000,
+        "DATATABLES_COUNT_CACHE_TIMEOUT": 60,
+        "DATATABLES_KEYSET_PAGINATION": False,
+        "SEARCH_BACKEND": "mapentity.search.SearchBackend",
+        "SELECTION_TIMEOUT": 3600,
+        "EXPORT_JOBS_MAX_AGE": 24 * 3600,
+        "EXPORT_JOBS_RUNNING_TIMEOUT": 3600,
+        "MVT_TILE_INDEX_MAX_ZOOM": 16,
+        "MVT_TILE_INDEX_MAX_TILES": 4096,
+        "MVT_ARCHIVES_DIR": None,
         "SERVE_MEDIA_AS_ATTACHMENT": True,
         "SENDFILE_HTTP_HEADER": None,
         "DRF_API_URL_PREFIX": r"^api/",
@@ -1,10 +1,151 @@
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+
+from .cache import get_tile_index_geom_field, invalidate_layer
 
 logger = logging.getLogger(__name__)
 
 
+# Registered models whose cached layers are kept up to date, see connect_layer_signals
+layer_models = set()
+
+
+def is_mapentity_model(model):
+    from .models import BaseMapEntityMixin
+
+    return issubclass(model, BaseMapEntityMixin)
+
+
+def get_m2m_through_models(model):
+    """Intermediate models of many to many relations of model, on both sides"""
+    throughs = {field.remote_field.through for field in model._meta.many_to_many}
+    throughs.update(
+        rel.through for rel in model._meta.related_objects if rel.many_to_many
+    )
+    return throughs
+
+
+def connect_layer_signals(model):
+    """
+    Invalidate cached layers of model on changes. Receivers are connected per
+    registered model: other models keep fast deletes and cheap saves.
+    """
+    layer_models.add(model)
+    pre_save.connect(store_previous_geometry, sender=model)
+    post_save.connect(invalidate_layer_on_save, sender=model)
+    post_delete.connect(invalidate_layer_on_delete, sender=model)
+    post_delete.connect(record_tombstone, sender=model)
+    for through in get_m2m_through_models(model):
+        m2m_changed.connect(invalidate_layer_on_m2m_changed, sender=through)
+
+
+def store_previous_geometry(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep geometry stored in database before save, to invalidate its tiles too"""
+    geom_field = get_tile_index_geom_field(sender)
+    if geom_field is None or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and geom_field not in update_fields:
+        instance._mapentity_previous_geom = getattr(instance, geom_field)
+        return
+    instance._mapentity_previous_geom = (
+        sender._base_manager.filter(pk=instance.pk)
+        .values_list(geom_field, flat=True)
+        .first()
+    )
+
+
+def update_generalized_geometries(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance.update_generalized_geometries()
+
+
+def invalidate_layer_on_save(sender, instance, **kwargs):
+    geom_field = get_tile_index_geom_field(sender)
+    geometries = []
+    if geom_field is not None:
+        geom = getattr(instance, geom_field)
+        previous_geom = instance.__dict__.pop("_mapentity_previous_geom", None)
+        geometries = [geom]
+        if previous_geom is not None and previous_geom != geom:
+            geometries.append(previous_geom)
+    invalidate_layer(sender, geometries)
+
+
+class BulkDeletion:
+    """Objects deleted in a ``bulk_deletion`` block, and their models"""
+
+    def __init__(self):
+        self.models = set()
+        self.tombstones = []
+
+
+_bulk_deletion = ContextVar("mapentity_bulk_deletion", default=None)
+
+
+@contextmanager
+def bulk_deletion():
+    """
+    Record tombstones of objects deleted in block with one query, and invalidate
+    layers of their models once, instead of once per object::
+
+        with bulk_deletion():
+            queryset.delete()
+    """
+    from .models import Tombstone
+
+    deletion = BulkDeletion()
+    token = _bulk_deletion.set(deletion)
+    try:
+        yield deletion
+    finally:
+        _bulk_deletion.reset(token)
+    Tombstone.objects.bulk_create(deletion.tombstones)
+    for model in deletion.models:
+        invalidate_layer(model)
+
+
+def invalidate_layer_on_delete(sender, instance, **kwargs):
+    deletion = _bulk_deletion.get()
+    if deletion is not None:
+        deletion.models.add(sender)
+        return
+    geom_field = get_tile_index_geom_field(sender)
+    geometries = [getattr(instance, geom_field)] if geom_field is not None else []
+    invalidate_layer(sender, geometries)
+
+
+def record_tombstone(sender, instance, **kwargs):
+    """Keep primary key of deleted object for delta layers"""
+    from .models import Tombstone
+
+    if sender._meta.proxy:
+        return
+    deletion = _bulk_deletion.get()
+    if deletion is not None:
+        deletion.tombstones.append(Tombstone.from_instance(instance))
+        return
+    Tombstone.record(instance)
+
+
+def invalidate_layer_on_m2m_changed(sender, instance, action, model, **kwargs):
+    """Both sides of a many to many relation may be serialized in layers"""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    sender = type(instance)
+    if sender in layer_models:
+        geom_field = get_tile_index_geom_field(sender)
+        geometries = [getattr(instance, geom_field)] if geom_field is not None else []
+        invalidate_layer(sender, geometries)
+    if model in layer_models:
+        # Related objects are not known after clear
+        invalidate_layer(model)
+
+
 def migrate_tiles(sender, **kwargs):
     BaseLayer = sender.apps.get_model("mapbox_baselayer.BaseLayer")
     BaseLayerTile = sender.apps.get_model("mapbox_baselayer.BaseLayerTile")
@@ -134,7 +134,9 @@ class MaplibreMapListSync {
         this._loading = true;
 
         try {
-            const response = await fetch(`${this.options.filter.form.getAttribute('action').replace('.datatables', '/filter_infos.json')}?${new URLSearchParams(formData)}`);
+            const params = new URLSearchParams(formData);
+            params.set('pk_encoding', 'ranges');
+            const response = await fetch(`${this.options.filter.form.getAttribute('action').replace('.datatables', '/filter_infos.json')}?${params}`);
             if (!response.ok) {
                 throw new Error('Network response was not ok');
             }
@@ -142,7 +144,7 @@ class MaplibreMapListSync {
 
             document.getElementById('nbresults').textContent = data.count;
 
-            this.layer.updateFromPks(data.pk_list);
+            this.layer.updateFromPks(data.pk_ranges ? decodePkRanges(data.pk_ranges) : data.pk_list);
 
         } catch (error) {
             console.error('Error:', error);
@@ -53,6 +53,24 @@
         return window.crypto.randomUUID?.() || `${Math.random().toString(36).substring(2, 9)}`;
     }
 
+    /**
+     * Decodes primary keys of a filter_infos response requested with pk_encoding=ranges.
+     * @param ranges {number[]} - Flat list of (gap from previous range, length) pairs
+     * @returns {number[]} - The sorted primary keys
+     */
+    function decodePkRanges(ranges) {
+        const pks = [];
+        let last = 0;
+        for (let i = 0; i < ranges.length; i += 2) {
+            const start = last + ranges[i];
+            for (let j = 0; j < ranges[i + 1]; j++) {
+                pks.push(start + j);
+            }
+            last = start + ranges[i + 1] - 1;
+        }
+        return pks;
+    }
+
     /**
      * Calculates the bounds of a GeoJSON object or a collection of geometries.
      * @param geojson {Object} - A GeoJSON object or a collection of geometries from which to calculate the bounds.
@@ -48,6 +48,9 @@ document.addEventListener('DOMContentLoaded', function() {
         // Initialization of the DataTable
         const canSelect = !!window.USER_CAN_SELECT;
 
+        // cursors of next and previous pages, by start offset (keyset pagination)
+        let pageCursors = {};
+
         const mainDatatable = new DataTable('#objects-list', {
             processing: true,
             serverSide: true,
@@ -65,7 +68,12 @@ document.addEventListener('DOMContentLoaded', function() {
                 { visible: false, targets: [1] }
             ],
             ajax: {
-                url: `/api/${modelname}/drf/${modelname}s.datatables`
+                url: `/api/${modelname}/drf/${modelname}s.datatables`,
+                data: function (d) {
+                    if (pageCursors[d.start]) {
+                        d.cursor = pageCursors[d.start];
+                    }
+                }
             },
             responsive: true,
             pageLength: 7,
@@ -112,6 +120,22 @@ document.addEventListener('DOMContentLoaded', function() {
         paging.classList.add('d-flex', 'flex-row-reverse');
         document.getElementById('list-download-toolbar').appendChild(paging);
 
+        // keep cursors of adjacent pages, and show estimated counts (DATATABLES_COUNT_STRATEGY)
+        mainDatatable.on('xhr', function (e, settings, json) {
+            const params = mainDatatable.ajax.params();
+            pageCursors = {};
+            if (json && json.nextCursor) {
+                pageCursors[params.start + params.length] = json.nextCursor;
+            }
+            if (json && json.previousCursor) {
+                pageCursors[params.start - params.length] = json.previousCursor;
+            }
+
+            const approximate = !!(json && json.recordsApproximate);
+            paging.classList.toggle('approximate-count', approximate);
+            paging.title = approximate ? tr("Approximate number of pages") : '';
+        });
+
         // custom search field
         const searchInput = document.getElementById('object-list-search');
 
@@ -177,38 +201,42 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         }
 
-        // delete / edit buttons
+        // delete / edit buttons, operating on a selection stored server side
         document.querySelectorAll("#btn-delete, #btn-edit").forEach(btn => {
             btn.addEventListener("click", async (event) => {
-                const selectedPks = await getSelectedPks();
+                const token = await createSelection();
                 const url = new URL(btn.dataset.url, window.location.origin);
-                url.searchParams.set("pks", selectedPks);
+                url.searchParams.set("selection", token);
                 window.location.href = url;
             });
         });
 
-        async function getSelectedPks() {
-            let pksList = [];
+        async function createSelection() {
+            const form = document.getElementById("mainfilter");
+            const url = new URL(form.action.replace(".datatables", "/selection.json"), window.location.origin);
+            const body = new FormData();
 
             const anyChecked = document.querySelector(".dt-scroll-headInner .dt-select-checkbox:checked");
 
             if (anyChecked) {
-                const form = document.getElementById("mainfilter");
-                const url = form.action.replace(".datatables", "/filter_infos.json");
-                const params = new URLSearchParams(new FormData(form)).toString();
-
-                const response = await fetch(url + "?" + params);
-                const data = await response.json();
-                pksList = data.pk_list;
+                // all objects matching filters
+                url.search = new URLSearchParams(new FormData(form)).toString();
             } else {
-                pksList = window.MapEntity.dt
+                const pksList = window.MapEntity.dt
                     .rows({ selected: true })
                     .data()
                     .pluck("id")
                     .toArray();
+                body.append("pks", pksList.join(","));
             }
 
-            return pksList.join(",");
+            const response = await fetch(url, {
+                method: "POST",
+                body: body,
+                headers: { "X-CSRFToken": document.querySelector("[name=csrfmiddlewaretoken]").value },
+            });
+            const data = await response.json();
+            return data.token;
         }
     });
 
@@ -189,7 +189,7 @@ class MapEntityTest(TestCase):
 
         # Read the csv
         lines = list(
-            csv.reader(StringIO(response.content.decode("utf-8")), delimiter=",")
+            csv.reader(StringIO(response.getvalue().decode("utf-8")), delimiter=",")
         )
 
         # There should be one more line in the csv than in the items: this is the header line
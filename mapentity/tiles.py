@@ -0,0 +1,328 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+
+import django
+import mercantile
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.utils import translation
+from pmtiles.convert import mbtiles_to_pmtiles
+
+from .cache import (
+    get_content_entry,
+    get_layers_cache,
+    get_tile_cache_key,
+    get_tile_version,
+    make_content_entry,
+)
+from .registry import registry
+from .settings import app_settings
+
+logger = logging.getLogger(__name__)
+
+MBTILES_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS metadata (name text, value text)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name)",
+    "CREATE TABLE IF NOT EXISTS tiles "
+    "(zoom_level integer, tile_column integer, tile_row integer, tile_data blob)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS tile_index "
+    "ON tiles (zoom_level, tile_column, tile_row)",
+    # Tiles versions at export time, empty tiles included, for incremental refresh
+    "CREATE TABLE IF NOT EXISTS mapentity_tiles (zoom_level integer, "
+    "tile_column integer, tile_row integer, version text, empty integer, run integer)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS mapentity_tile_index "
+    "ON mapentity_tiles (zoom_level, tile_column, tile_row)",
+)
+
+
+def get_tile_viewset(model):
+    """Instantiate the registered viewset of model, used to render its tiles"""
+    viewset = registry.registry[model].rest_viewset()
+    if viewset.model is None:
+        viewset.model = model
+    return viewset
+
+
+def init_worker():
+    django.setup()
+    # Make sure models are registered in worker process
+    import_module(settings.ROOT_URLCONF)
+
+
+def get_tile_lookup(viewset, model, language, z, x, y):
+    """Cache key of tile z/x/y, as stored by viewset vector tiles endpoint"""
+    prefix = viewset.view_cache_key() if hasattr(viewset, "view_cache_key") else ""
+    language = viewset.get_cache_language(vector_tiles=True, language=language)
+    return prefix + get_tile_cache_key(model, language, z, x, y)
+
+
+def cache_tile(lookup, content):
+    """Store tile content in layers cache, like vector tiles endpoints do"""
+    entry = make_content_entry(content, "application/vnd.mapbox-vector-tile")
+    get_layers_cache().set(lookup, entry)
+    return entry
+
+
+def get_tile(model, language, z, x, y, request=None):
+    """Return content of tile z/x/y of model, from layers cache or rendered"""
+    viewset = get_tile_viewset(model)
+    viewset.request = request
+    lookup = get_tile_lookup(viewset, model, language, z, x, y)
+    entry = get_content_entry(lookup)
+    if entry is None:
+        entry = cache_tile(lookup, viewset.get_layer_tiles(z, x, y))
+    return entry["content"]
+
+
+def render_tiles(model_label, language, tiles):
+    """Render tiles of model, return list of (z, x, y, content)"""
+    model = apps.get_model(model_label)
+    viewset = get_tile_viewset(model)
+    with translation.override(language):
+        return [(z, x, y, bytes(viewset.get_layer_tiles(z, x, y))) for z, x, y in tiles]
+
+
+def get_children_in_bbox(tiles, bbox):
+    """Return children (z, x, y) of tiles which intersect bbox"""
+    west, south, east, north = bbox
+    children = []
+    for z, x, y in tiles:
+        for child in mercantile.children(x, y, z):
+            bounds = mercantile.bounds(child)
+            if (
+                bounds.west <= east
+                and bounds.east >= west
+                and bounds.south <= north
+                and bounds.north >= south
+            ):
+                children.append((child.z, child.x, child.y))
+    return children
+
+
+def get_archive_path(model, language, fmt="mbtiles"):
+    """Default path of model tiles archive"""
+    directory = app_settings["MVT_ARCHIVES_DIR"] or os.path.join(
+        app_settings["TEMP_DIR"], "mvt_archives"
+    )
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{model._meta.label_lower}-{language}.{fmt}")
+
+
+def get_temporary_path(path):
+    """Unique path next to path, to write a file replaced atomically afterwards"""
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+class MBTilesArchive:
+    """
+    MBTiles archive of vector tiles.
+
+    Besides the standard ``metadata`` and ``tiles`` tables, the version of every
+    exported tile is kept, so that an export can only render tiles changed since.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            for statement in MBTILES_SCHEMA:
+                self.connection.execute(statement)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def get_versions(self):
+        """Return {(z, x, y): (version, empty)} of exported tiles"""
+        rows = self.connection.execute(
+            "SELECT zoom_level, tile_column, tile_row, version, empty "
+            "FROM mapentity_tiles"
+        )
+        return {
+            (z, x, (1 << z) - 1 - tms_y): (version, bool(empty))
+            for z, x, tms_y, version, empty in rows
+        }
+
+    def set_metadata(self, metadata):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+            [(name, str(value)) for name, value in metadata.items()],
+        )
+
+    def write(self, z, x, y, version, content, run):
+        tms_y = (1 << z) - 1 - y
+        if content:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO tiles "
+                "(zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                (z, x, tms_y, gzip.compress(content, mtime=0)),
+            )
+        else:
+            self.connection.execute(
+                "DELETE FROM tiles "
+                "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, tms_y),
+            )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO mapentity_tiles "
+            "(zoom_level, tile_column, tile_row, version, empty, run) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (z, x, tms_y, version, not content, run),
+        )
+
+    def keep(self, z, x, y, run):
+        self.connection.execute(
+            "UPDATE mapentity_tiles SET run = ? "
+            "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (run, z, x, (1 << z) - 1 - y),
+        )
+
+    def prune(self, run):
+        """Remove tiles not exported by run"""
+        self.connection.execute(
+            "DELETE FROM tiles WHERE EXISTS (SELECT 1 FROM mapentity_tiles t "
+            "WHERE t.run != ? AND t.zoom_level = tiles.zoom_level "
+            "AND t.tile_column = tiles.tile_column AND t.tile_row = tiles.tile_row)",
+            (run,),
+        )
+        self.connection.execute("DELETE FROM mapentity_tiles WHERE run != ?", (run,))
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+
+def export_mbtiles(
+    model,
+    path,
+    language,
+    bbox,
+    zooms,
+    processes=1,
+    chunk_size=64,
+    full=False,
+):
+    """
+    Export vector tiles of model into MBTiles archive at path.
+
+    Tiles are rendered from lower to higher zoom levels, and children of empty tiles
+    are skipped. Unless ``full`` is set, tiles whose version did not change since
+    the previous export of the archive are not rendered again.
+
+    Return (rendered, reused) numbers of tiles.
+    """
+    viewset = get_tile_viewset(model)
+    layers = viewset.get_layers()
+    layers_min_zoom = min(layer.get_min_zoom() for layer in layers)
+    zooms = list(zooms)
+
+    # Archive is updated in a copy, then replaced atomically: it is never read half
+    # written, and concurrent exports do not write into the same file
+    tmp_path = get_temporary_path(path)
+    if not full and os.path.exists(path):
+        shutil.copyfile(path, tmp_path)
+    archive = MBTilesArchive(tmp_path)
+    previous = archive.get_versions()
+    done = False
+    run = time.time_ns()
+    rendered = reused = 0
+
+    executor = None
+    if processes > 1:
+        # Database connections can not be shared with worker processes
+        connections.close_all()
+        executor = ProcessPoolExecutor(processes, initializer=init_worker)
+    try:
+        level = [(t.z, t.x, t.y) for t in mercantile.tiles(*bbox, zooms[:1])]
+        for z in zooms:
+            parents, to_render, versions = [], [], {}
+            for tile in level:
+                version = get_tile_version(model, *tile)
+                stored = previous.get(tile)
+                if stored and stored[0] == version:
+                    archive.keep(*tile, run)
+                    reused += 1
+                    if not stored[1]:
+                        parents.append(tile)
+                else:
+                    to_render.append(tile)
+                    versions[tile] = version
+            chunks = [
+                to_render[i : i + chunk_size]
+                for i in range(0, len(to_render), chunk_size)
+            ]
+            label = model._meta.label_lower
+            if executor is None:
+                results = (render_tiles(label, language, chunk) for chunk in chunks)
+            else:
+                results = executor.map(
+                    render_tiles,
+                    [label] * len(chunks),
+                    [language] * len(chunks),
+                    chunks,
+                )
+            for result in results:
+                for tz, tx, ty, content in result:
+                    archive.write(tz, tx, ty, versions[tz, tx, ty], content, run)
+                    rendered += 1
+                    if content:
+                        parents.append((tz, tx, ty))
+            if z < layers_min_zoom:
+                # Layers are not visible yet, tiles are empty but children may not
+                parents = level
+            level = get_children_in_bbox(parents, bbox)
+        archive.prune(run)
+        archive.set_metadata(
+            {
+                "name": str(model._meta.verbose_name_plural),
+                "format": "pbf",
+                "type": "overlay",
+                "minzoom": zooms[0],
+                "maxzoom": zooms[-1],
+                "bounds": ",".join(str(v) for v in bbox),
+                "json": json.dumps(
+                    {
+                        "vector_layers": [
+                            layer.get_tilejson_vector_layer() for layer in layers
+                        ]
+                    }
+                ),
+                "language": language,
+            }
+        )
+        done = True
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        archive.close()
+        if done:
+            os.replace(tmp_path, path)
+        else:
+            os.remove(tmp_path)
+    return rendered, reused
+
+
+def export_pmtiles(mbtiles_path, path):
+    """Convert MBTiles archive into a PMTiles archive, replaced atomically"""
+    archive = MBTilesArchive(mbtiles_path)
+    try:
+        if not archive.count():
+            msg = f"No tiles in {mbtiles_path}"
+            raise ValueError(msg)
+    finally:
+        archive.close()
+    tmp_path = get_temporary_path(path)
+    try:
+        mbtiles_to_pmtiles(mbtiles_path, tmp_path, None)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -4,7 +4,16 @@ from django.views.i18n import JavaScriptCatalog
 
 from .registry import registry
 from .settings import app_settings
-from .views import Convert, JSSettings, ServeAttachment, history_delete, map_screenshot
+from .views import (
+    CompositeMVT,
+    Convert,
+    ExportJobDownload,
+    ExportJobStatus,
+    JSSettings,
+    ServeAttachment,
+    history_delete,
+    map_screenshot,
+)
 
 if app_settings["ACTION_HISTORY_ENABLED"]:
     from .models import LogEntry
@@ -27,6 +36,17 @@ urlpatterns = [
     # See default value in app_settings.JS_SETTINGS.
     # Will be overriden, most probably.
     path("api/settings.json", JSSettings.as_view(), name="js_settings"),
+    path(
+        "api/mvt/<int:z>/<int:x>/<int:y>",
+        CompositeMVT.as_view(),
+        name="mvt_composite",
+    ),
+    path("exports/<int:pk>/", ExportJobStatus.as_view(), name="export_job"),
+    path(
+        "exports/<int:pk>/download/",
+        ExportJobDownload.as_view(),
+        name="export_job_download",
+    ),
 ]
 
 
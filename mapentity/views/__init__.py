@@ -1,5 +1,8 @@
 from .api import MapEntityViewSet
 from .base import (
+    CompositeMVT,
+    ExportJobDownload,
+    ExportJobStatus,
     JSSettings,
     ServeAttachment,
     history_delete,
@@ -76,6 +79,9 @@ __all__ = [
     "MAPENTITY_GENERIC_VIEWS",
     "ServeAttachment",
     "JSSettings",
+    "CompositeMVT",
+    "ExportJobStatus",
+    "ExportJobDownload",
     "map_screenshot",
     "history_delete",
     "LogEntryList",
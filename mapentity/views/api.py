@@ -1,30 +1,62 @@
 import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
 
 from django.conf import settings
 from django.contrib.gis.db.models.functions import Transform
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template import loader
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
 from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import renderers, viewsets
+from rest_framework import renderers, serializers, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework_datatables.filters import DatatablesFilterBackend
 from rest_framework_datatables.renderers import DatatablesRenderer
 from vectortiles import VectorLayer
 from vectortiles.mixins import BaseTileJSONView, BaseVectorTileView
 from vectortiles.rest_framework.renderers import MVTRenderer
 
 from .. import serializers as mapentity_serializers
+from ..cache import get_filters_cache_key, get_layers_cache, get_model_generation
 from ..decorators import mvt_etag, view_cache_latest, view_cache_response_content
-from ..filters import MapEntityFilterSet
+from ..filters import MapEntityDatatablesFilterBackend, MapEntityFilterSet
+from ..helpers import (
+    encode_pk_ranges,
+    get_file_range_response,
+    get_translated_fields,
+    has_integer_pk,
+)
+from ..layers import ClusteredVectorLayerMixin, GeneralizedVectorLayerMixin
+from ..models import MapEntitySelectionPermissions, Tombstone
 from ..pagination import MapentityDatatablePagination
-from ..renderers import GeoJSONRenderer
-from ..settings import API_SRID
+from ..querysets import get_serializer_paths, plan_queryset
+from ..registry import registry
+from ..renderers import FlatGeobufRenderer, GeoJSONRenderer
+from ..selections import PrimaryKeys, create_selection
+from ..settings import API_SRID, app_settings
 
 logger = logging.getLogger(__name__)
 
+# Language of cached layers which are the same in every language
+SHARED_LANGUAGE = "all"
+
+# Formats of primary keys in filter_infos responses
+PK_ENCODINGS = ("list", "ranges", "count")
+
+# Origin of delta layers versions, which are nanoseconds timestamps
+VERSION_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
 
 class MapEntityViewSet(BaseTileJSONView, BaseVectorTileView, viewsets.ModelViewSet):
     model = None
@@ -32,27 +64,121 @@ class MapEntityViewSet(BaseTileJSONView, BaseVectorTileView, viewsets.ModelViewS
         DatatablesRenderer,
         renderers.JSONRenderer,
         GeoJSONRenderer,
+        FlatGeobufRenderer,
         renderers.BrowsableAPIRenderer,
     ]
     geojson_serializer_class = None
     pagination_class = MapentityDatatablePagination
-    filter_backends = [DatatablesFilterBackend, DjangoFilterBackend]
+    filter_backends = [MapEntityDatatablesFilterBackend, DjangoFilterBackend]
     filterset_class = MapEntityFilterSet
     vector_tiles_fields = ("name", "id")
+    vector_tiles_generalization = None
+    vector_tiles_cluster_max_zoom = None
+    vector_tiles_cluster_size = None
+    geojson_streaming = None
+    geojson_database_rendering = None
 
     def get_layer_classes(self):
         classes = []
         if self.model is None:
             return classes
 
-        class MapentityVectorLayer(VectorLayer):
+        class MapentityVectorLayer(
+            ClusteredVectorLayerMixin, GeneralizedVectorLayerMixin, VectorLayer
+        ):
             model = self.model
             id = f"{self.model.__name__.lower()}"  # id for data layer in vector tile
             geom_field = self.model.main_geom_field  # geom field to consider in qs
             tile_fields = self.vector_tiles_fields
+            generalization = self.get_vector_tiles_option("vector_tiles_generalization")
+            cluster_max_zoom = self.get_vector_tiles_option(
+                "vector_tiles_cluster_max_zoom"
+            )
+            cluster_size = (
+                self.get_vector_tiles_option("vector_tiles_cluster_size")
+                or ClusteredVectorLayerMixin.cluster_size
+            )
 
         return [MapentityVectorLayer]
 
+    def get_vector_tiles_option(self, name):
+        """Vector tiles layer option, from viewset or model registry options"""
+        value = getattr(self, name)
+        if value is not None:
+            return value
+        options = registry.registry.get(self.model)
+        return getattr(options, name, None)
+
+    def is_geojson_translated(self):
+        """
+        Whether GeoJSON layer may change with language, i.e. whether some of its
+        properties are not read as is from untranslated model fields.
+        """
+        if self.geojson_serializer_class is None:
+            # Default serializer has identifiers and geometries only
+            return False
+        try:
+            serializer = self.geojson_serializer_class()
+            fields = serializer.fields
+        except Exception:
+            # Serializer needs a request, properties can not be known in advance
+            logger.debug("Can not inspect %s", self.geojson_serializer_class)
+            return True
+        translated_fields = get_translated_fields(self.model)
+        model_fields = {field.name for field in self.model._meta.get_fields()}
+        for name, field in fields.items():
+            if name == serializer.Meta.geo_field or field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                return True
+            if isinstance(field, serializers.RelatedField) and not isinstance(
+                field, serializers.PrimaryKeyRelatedField
+            ):
+                return True
+            # Nested, dotted, whole object or non field sources (properties,
+            # choices display...) may hold translations
+            if (
+                len(field.source_attrs) != 1
+                or field.source_attrs[0] not in model_fields
+                or isinstance(field, serializers.BaseSerializer)
+            ):
+                return True
+            if field.source_attrs[0] in translated_fields:
+                return True
+        return False
+
+    def is_vector_tiles_translated(self):
+        """Whether vector tiles may change with language, see ``is_geojson_translated``"""
+        translated_fields = get_translated_fields(self.model)
+        for layer_class in self.get_layer_classes():
+            model = getattr(layer_class, "model", None) or self.model
+            model_fields = {field.name for field in model._meta.get_fields()}
+            for name in layer_class.tile_fields:
+                # Annotations are not known in advance
+                if name not in model_fields or name in translated_fields:
+                    return True
+        return False
+
+    def get_cache_language(self, vector_tiles=False, language=None):
+        """
+        Language of cached layer, shared by all languages if the layer does not
+        hold any translated value.
+        """
+        options = registry.registry.get(self.model)
+        if options is not None and options.rest_viewset is type(self):
+            # Detected once at registry time
+            if vector_tiles:
+                translated = options.vector_tiles_translated
+            else:
+                translated = options.geojson_translated
+        elif vector_tiles:
+            translated = self.is_vector_tiles_translated()
+        else:
+            translated = self.is_geojson_translated()
+        if not translated:
+            return SHARED_LANGUAGE
+        return language or self.request.LANGUAGE_CODE
+
     def get_view_perm(self):
         """use by view_permission_required decorator"""
         return self.model.get_permission_codename("layer")
@@ -60,7 +186,8 @@ class MapEntityViewSet(BaseTileJSONView, BaseVectorTileView, viewsets.ModelViewS
     def get_serializer_class(self):
         """Use specific Serializer for GeoJSON"""
         renderer, media_type = self.perform_content_negotiation(self.request)
-        if getattr(renderer, "format") == "geojson":
+        # FlatGeobuf files hold the same features as GeoJSON layers
+        if getattr(renderer, "format") in ("geojson", "fgb"):
             if self.geojson_serializer_class:
                 return self.geojson_serializer_class
             else:
@@ -105,29 +232,249 @@ class MapEntityViewSet(BaseTileJSONView, BaseVectorTileView, viewsets.ModelViewS
         """Transform projection for geojson"""
         renderer, media_type = self.perform_content_negotiation(self.request)
         qs = super().get_queryset()
-        if getattr(renderer, "format") == "geojson":
+        if getattr(renderer, "format") in ("geojson", "fgb"):
             return qs.annotate(api_geom=Transform("geom", API_SRID)).defer("geom")
         return qs
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, "action", None) in ("filter_infos", "selection"):
+            # Objects are not serialized, only their primary keys are read
+            return queryset
+        return self.plan_queryset(queryset)
+
+    def plan_queryset(self, queryset):
+        """Join or prefetch relations read by serializer of requested format"""
+        # With context, as serializers may read the request to build their fields
+        serializer = self.get_serializer()
+        return plan_queryset(queryset, get_serializer_paths(serializer))
+
     def get_filter_count_infos(self, qs):
         """Override this method to change count info in List dropdown menu"""
         return qs.count()
 
     @action(detail=False, methods=["get"])
     def filter_infos(self, request, *args, **kwargs):
-        """List of all object primary keys according filters"""
-        qs = self.get_queryset()
-        qs = self.filter_queryset(qs)
-        return Response(
-            {
-                "pk_list": qs.values_list("pk", flat=True),
-                "count": self.get_filter_count_infos(qs),
-            }
+        """
+        Count and primary keys of objects according filters. ``pk_encoding``
+        parameter sets primary keys format: ``list`` (default, ``pk_list``),
+        ``ranges`` (``pk_ranges``, see ``encode_pk_ranges``, or ``pk_list`` for
+        models without integer primary key) or ``count`` for count only.
+        Responses are cached per model generation and filters.
+        """
+        encoding = request.query_params.get("pk_encoding") or "list"
+        if encoding not in PK_ENCODINGS:
+            msg = f"Must be one of {', '.join(PK_ENCODINGS)}"
+            raise ValidationError({"pk_encoding": msg})
+        if encoding == "ranges" and not has_integer_pk(self.model):
+            # Only integer keys have ranges
+            encoding = "list"
+
+        lookup = None
+        filters_key = get_filters_cache_key(self)
+        if filters_key is not None:
+            generation = get_model_generation(self.model)
+            lookup = (
+                f"mapentity_filter_infos_{self.model._meta.label_lower}_{generation}"
+                f"_{filters_key or 'all'}_{encoding}"
+            )
+            if hasattr(self, "view_cache_key"):
+                lookup = self.view_cache_key() + lookup
+            data = get_layers_cache().get(lookup)
+            if data is not None:
+                return Response(data)
+
+        qs = self.filter_queryset(self.get_queryset())
+        data = {"count": self.get_filter_count_infos(qs)}
+        chunk_size = app_settings["GEOJSON_STREAMING_CHUNK_SIZE"]
+        if encoding == "ranges":
+            pks = qs.order_by("pk").values_list("pk", flat=True)
+            data["pk_ranges"] = encode_pk_ranges(pks.iterator(chunk_size=chunk_size))
+        elif encoding == "list":
+            pks = qs.values_list("pk", flat=True)
+            data["pk_list"] = list(pks.iterator(chunk_size=chunk_size))
+        if lookup is not None:
+            get_layers_cache().set(lookup, data)
+        return Response(data)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        permission_classes=[MapEntitySelectionPermissions],
+    )
+    def selection(self, request, *args, **kwargs):
+        """
+        Store a selection of objects for multiple objects actions and exports, and
+        return its ``token`` and ``count``. Objects are given by ``pks`` (comma
+        separated primary keys, empty for no object), or else by filters as in
+        filter_infos, stored as such.
+        """
+        qs = self.filter_queryset(self.get_queryset())
+        if "pks" in request.data:
+            pks = request.data["pks"]
+            if not isinstance(pks, str):
+                msg = _("Enter comma separated primary keys.")
+                raise ValidationError({"pks": [msg]})
+            try:
+                pks = [self.model._meta.pk.to_python(pk) for pk in pks.split(",") if pk]
+            except DjangoValidationError as exc:
+                raise ValidationError({"pks": exc.messages}) from exc
+            token, count = create_selection(
+                qs.filter(pk__in=PrimaryKeys(self.model, pks)), request.user
+            )
+        else:
+            # Filters are applied again when the selection is used
+            token, count = create_selection(
+                qs, request.user, filters=request.GET.urlencode()
+            )
+        return Response({"token": token, "count": count})
+
+    def get_geojson_option(self, name):
+        """GeoJSON list option, from viewset or settings, disabled for other formats"""
+        if getattr(self.request.accepted_renderer, "format", None) != "geojson":
+            return False
+        value = getattr(self, name)
+        if value is not None:
+            return value
+        return app_settings[name.upper()]
+
+    def get_flatgeobuf_response(self):
+        """
+        FlatGeobuf file of GeoJSON layer features, written from a server side cursor
+        and kept on disk per layer freshness and filters. Bytes ranges can be
+        requested, to read features of an area through the file spatial index.
+        """
+        filters_key = get_filters_cache_key(self)
+        queryset = self.filter_queryset(self.get_queryset())
+        version = None
+        if filters_key is not None:
+            version = get_model_generation(self.model)
+        language = self.get_cache_language()
+        path = mapentity_serializers.get_flatgeobuf_path(
+            self.model, language, filters_key, version or uuid.uuid4().hex
+        )
+        etag = quote_etag(os.path.basename(path))
+        if version:
+            response = get_conditional_response(self.request, etag=etag)
+            if response is not None:
+                return response
+        cached = False
+        if version:
+            try:
+                # Most recently used files are kept
+                os.utime(path)
+                cached = True
+            except FileNotFoundError:
+                pass
+        if not cached:
+            serializer = self.get_serializer(queryset, many=True)
+            mapentity_serializers.write_flatgeobuf(
+                path,
+                (
+                    serializer.child.to_representation(obj)
+                    for obj in queryset.iterator(
+                        chunk_size=app_settings["GEOJSON_STREAMING_CHUNK_SIZE"]
+                    )
+                ),
+                mapentity_serializers.get_flatgeobuf_geom_type(self.model),
+                {
+                    name: mapentity_serializers.get_flatgeobuf_property_type(field)
+                    for name, field in serializer.child.fields.items()
+                    if name != serializer.child.Meta.geo_field and not field.write_only
+                },
+            )
+            if version:
+                mapentity_serializers.remove_outdated_flatgeobuf(path)
+        response = get_file_range_response(
+            self.request, path, FlatGeobufRenderer.media_type
+        )
+        if version:
+            response["ETag"] = etag
+        else:
+            # Not cached, file is kept open by response only
+            os.remove(path)
+        return response
+
+    def get_delta_since(self):
+        """
+        Date of ``since`` parameter (layer version or ISO 8601 date), or None if
+        the whole layer has to be sent.
+        """
+        since = self.request.GET.get("since")
+        if not since:
+            return None
+        try:
+            if since.isdigit():
+                # Layer version, a nanoseconds timestamp
+                since = VERSION_EPOCH + timedelta(microseconds=int(since) // 1000)
+            else:
+                since = parse_datetime(since)
+        except (ValueError, OverflowError):
+            since = None
+        if since is None:
+            msg = _("Enter a layer version or a valid date.")
+            raise ValidationError({"since": msg})
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        max_age = timedelta(seconds=app_settings["GEOJSON_DELTA_MAX_AGE"])
+        if since < timezone.now() - max_age:
+            # Deleted objects may have been forgotten
+            return None
+        try:
+            self.model._meta.get_field(app_settings["DATE_UPDATE_FIELD_NAME"])
+        except FieldDoesNotExist:
+            return None
+        return since
+
+    def get_delta_response(self, since):
+        """
+        Features created or updated since date, primary keys of objects deleted
+        since, and layer version to use as next ``since`` parameter.
+
+        Dates of changes are set when objects are saved, from the clock of the
+        host, and may be committed later: the version is the date of the request,
+        minus ``GEOJSON_DELTA_MARGIN`` which covers transactions durations and
+        clocks differences. Next delta overlaps this one rather than misses
+        changes committed meanwhile.
+        """
+        margin = timedelta(seconds=app_settings["GEOJSON_DELTA_MARGIN"])
+        version = (
+            (timezone.now() - margin - VERSION_EPOCH)
+            // timedelta(microseconds=1)
+            * 1000
         )
+        date_field = app_settings["DATE_UPDATE_FIELD_NAME"]
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.filter(**{f"{date_field}__gt": since})
+        data = self.get_serializer(queryset, many=True).data
+        data["deleted"] = Tombstone.get_deleted_ids(self.model, since)
+        data["version"] = str(version)
+        return Response(data)
 
     @view_cache_latest()
     @view_cache_response_content()
     def list(self, request, *args, **kwargs):
+        if kwargs.get("format") == "fgb":
+            return self.get_flatgeobuf_response()
+        if kwargs.get("format") == "geojson":
+            since = self.get_delta_since()
+            if since is not None:
+                return self.get_delta_response(since)
+        if self.get_geojson_option("geojson_database_rendering"):
+            queryset = self.filter_queryset(self.get_queryset())
+            serializer = self.get_serializer(queryset, many=True)
+            content = mapentity_serializers.render_database_geojson_collection(
+                serializer, queryset
+            )
+            if content is not None:
+                return HttpResponse(content, content_type="application/json")
+        if self.get_geojson_option("geojson_streaming"):
+            queryset = self.filter_queryset(self.get_queryset())
+            serializer = self.get_serializer(queryset, many=True)
+            content = mapentity_serializers.iter_geojson_collection(
+                serializer, queryset, app_settings["GEOJSON_STREAMING_CHUNK_SIZE"]
+            )
+            return StreamingHttpResponse(content, content_type="application/json")
         return super().list(request, *args, **kwargs)
 
     @action(
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import mimetypes
@@ -9,10 +10,13 @@ from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.gis.db.models import GeometryField
 from django.core.exceptions import PermissionDenied
-from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
 from django.utils.translation import get_language
 from django.views import View, static
 from django.views.decorators.csrf import csrf_exempt
@@ -23,10 +27,13 @@ from paperclip.settings import get_attachment_model, get_attachment_permission
 
 from mapentity import models as mapentity_models
 
+from ..cache import get_tile_version
 from ..decorators import view_permission_required
-from ..helpers import capture_image
+from ..exports import get_export_job_status
+from ..helpers import capture_image, user_has_perm
 from ..registry import registry
 from ..settings import app_settings
+from ..tiles import get_tile
 from ..tokens import TokenManager
 from .mixins import FilterListMixin, JSONResponseMixin, ModelViewMixin
 
@@ -82,6 +89,86 @@ class ServeAttachment(View):
         return response
 
 
+class ExportJobStatus(View):
+    """Status of a background export of the user, see exports.py"""
+
+    @method_decorator(login_required)
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+
+    def get_job(self):
+        return get_object_or_404(
+            mapentity_models.ExportJob, pk=self.kwargs["pk"], user=self.request.user
+        )
+
+    def get(self, request, *args, **kwargs):
+        status = get_export_job_status(self.get_job())
+        return HttpResponse(json.dumps(status), content_type="application/json")
+
+
+class ExportJobDownload(ExportJobStatus):
+    """File of a finished background export of the user"""
+
+    def get(self, request, *args, **kwargs):
+        job = self.get_job()
+        if job.status != mapentity_models.ExportJob.DONE or not job.file:
+            raise Http404
+        return FileResponse(
+            job.file.open("rb"),
+            as_attachment=True,
+            filename=os.path.basename(job.file.name),
+        )
+
+
+class CompositeMVT(View):
+    """
+    Vector tile of several registered layers, with one tile layer per model.
+
+    Layers are selected with ``layers`` parameter (comma separated models names),
+    among the layers the user can read, all of them by default. Each model tile
+    shares its cache entry with the model own vector tiles endpoint.
+    """
+
+    def get_models(self):
+        names = self.request.GET.get("layers")
+        names = set(names.split(",")) if names else None
+        models = []
+        for model, options in registry.registry.items():
+            if model._meta.app_label == "mapentity" or not options.layer:
+                continue
+            if names is not None and model._meta.model_name not in names:
+                continue
+            perm = model.get_permission_codename(
+                mapentity_models.ENTITY_PERMISSION_READ
+            )
+            if user_has_perm(self.request.user, perm):
+                models.append(model)
+        return sorted(models, key=lambda model: model._meta.label)
+
+    def get_etag(self, models, language, z, x, y):
+        """Compose tiles freshness of every layer, from cache only"""
+        raw = ";".join(
+            f"{model._meta.label}:{get_tile_version(model, z, x, y)}"
+            for model in models
+        )
+        return hashlib.md5(f"{language}|{raw}".encode()).hexdigest()
+
+    def get(self, request, z, x, y):
+        models = self.get_models()
+        language = get_language()
+        etag = quote_etag(self.get_etag(models, language, z, x, y))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content = b"".join(
+                get_tile(model, language, z, x, y, request=request) for model in models
+            )
+            response = HttpResponse(
+                content, content_type="application/vnd.mapbox-vector-tile"
+            )
+        response["ETag"] = etag
+        return response
+
+
 # API settings
 class JSSettings(JSONResponseMixin, TemplateView):
     """
@@ -121,6 +208,9 @@ class JSSettings(JSONResponseMixin, TemplateView):
         dictsettings["urls"]["layer"] = options.model.get_layer_url()
         dictsettings["urls"]["mvt"] = options.model.get_mvt_url()
         dictsettings["urls"]["tilejson"] = options.model.get_tilejson_url()
+        dictsettings["urls"]["mvt_composite"] = reverse(
+            "mapentity:mvt_composite", kwargs={"z": 0, "x": 0, "y": 0}
+        ).replace("0/0/0", "{z}/{x}/{y}")
         dictsettings["urls"]["detail"] = f"{root_url}modelname/0/"
         dictsettings["urls"]["popup"] = "/api/modelname/drf/modelnames/0/popup-content"
         dictsettings["urls"]["format_list"] = (
@@ -3,6 +3,7 @@ import json
 import logging
 import os
 import re
+import uuid
 from datetime import datetime
 from importlib import import_module
 from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
@@ -13,16 +14,24 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.staticfiles.storage import staticfiles_storage
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied
 from django.core.files.storage import default_storage
 from django.db import models
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
 from django.template.defaultfilters import slugify
 from django.template.exceptions import TemplateDoesNotExist
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.utils.encoding import force_str
 from django.utils.html import escape
-from django.utils.translation import gettext
+from django.utils.translation import get_language, gettext
 from django.utils.translation import gettext_lazy as _
 from django.views import static
 from django.views.generic import View
@@ -37,7 +46,9 @@ from mapentity.tokens import TokenManager
 
 from .. import models as mapentity_models
 from .. import serializers as mapentity_serializers
+from ..cache import get_filter_params, invalidate_layer
 from ..decorators import save_history, view_permission_required
+from ..exports import create_export_job, get_export_job_status
 from ..forms import AttachmentForm, BaseMultiUpdateForm
 from ..helpers import (
     convertit_url,
@@ -48,17 +59,25 @@ from ..helpers import (
     user_has_perm,
 )
 from ..models import ADDITION, CHANGE, DELETION, LogEntry
+from ..querysets import plan_queryset
+from ..selections import get_selection, get_selection_q
 from ..settings import app_settings
+from ..signals import bulk_deletion
+from ..tiles import get_archive_path
 from .base import BaseListView, history_delete
 from .mixins import (
     FilterListMixin,
     FormViewMixin,
+    HttpJSONResponse,
     ModelViewMixin,
     MultiObjectActionMixin,
 )
 
 logger = logging.getLogger(__name__)
 
+# Query string values of boolean parameters, such as ``?async=1``
+TRUE_VALUES = ("1", "true", "yes", "on")
+
 
 def log_action(request, object, action_flag):
     if not app_settings["ACTION_HISTORY_ENABLED"]:
@@ -123,19 +142,39 @@ class MapEntityFormat(BaseListView, ListView):
     """Export the list to a particular format."""
 
     DEFAULT_FORMAT = "csv"
+    # Formats which can be exported in background with ``?async=1``, see exports.py
+    background_formats = ("csv", "shp", "gpx", "gpkg")
+    # Whether files of background exports are reused for other users
+    share_background_exports = True
 
     @classmethod
     def get_entity_kind(cls):
         return mapentity_models.ENTITY_FORMAT_LIST
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        token = self.request.GET.get("selection")
+        if token:
+            # Objects of a stored selection, see MapEntityViewSet.selection
+            selection = get_selection(token, self.get_model(), self.request.user)
+            if selection is None:
+                msg = "Selection does not exist or has expired"
+                raise Http404(msg)
+            queryset = queryset.filter(get_selection_q(selection, self.request))
+        # Relations of exported columns are read for every object
+        return plan_queryset(queryset, self.get_columns())
+
     def render_to_response(self, context, **response_kwargs):
         """Delegate to the fmt view function found at dispatch time"""
         formats = {
             "csv": self.csv_view,
             "shp": self.shape_view,
             "gpx": self.gpx_view,
+            "fgb": self.flatgeobuf_view,
+            "gpkg": self.geopackage_view,
+            "mbtiles": self.tiles_archive_view,
+            "pmtiles": self.tiles_archive_view,
         }
-        extensions = {"shp": "zip"}
         fmt_str = self.request.GET.get("format", self.DEFAULT_FORMAT)
         formatter = formats.get(fmt_str)
         if not formatter:
@@ -143,38 +182,48 @@ class MapEntityFormat(BaseListView, ListView):
             logger.warning(msg)
             return HttpResponseBadRequest()
 
+        run_async = self.request.GET.get("async", "").lower() in TRUE_VALUES
+        if fmt_str in self.background_formats and run_async:
+            job = create_export_job(self, fmt_str)
+            return HttpJSONResponse(json.dumps(get_export_job_status(job)), status=202)
+
+        filename = self.get_export_filename(fmt_str)
+        response = formatter(request=self.request, context=context, **response_kwargs)
+        response["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
+
+    def get_export_filename(self, fmt):
+        extensions = {"shp": "zip"}
         filename = "{}-{}-list".format(
             datetime.now().strftime("%Y%m%d-%H%M"),
             str(slugify(str(self.get_model()._meta.verbose_name))),
         )
-        filename += f".{extensions.get(fmt_str, fmt_str)}"
-        response = formatter(request=self.request, context=context, **response_kwargs)
-        response["Content-Disposition"] = f"attachment; filename={filename}"
-        return response
+        return f"{filename}.{extensions.get(fmt, fmt)}"
 
     def csv_view(self, request, context, **kwargs):
         serializer = mapentity_serializers.CSVSerializer()
-        response = HttpResponse(content_type="text/csv")
-        serializer.serialize(
-            queryset=self.get_queryset(),
-            stream=response,
-            model=self.get_model(),
-            fields=self.get_columns(),
-            ensure_ascii=True,
+        # Rows are sent as they are read, whatever the number of objects
+        return StreamingHttpResponse(
+            serializer.iter_chunks(
+                queryset=self.get_queryset(),
+                model=self.get_model(),
+                fields=self.get_columns(),
+                ensure_ascii=True,
+            ),
+            content_type="text/csv",
         )
-        return response
 
     def shape_view(self, request, context, **kwargs):
         serializer = mapentity_serializers.ZipShapeSerializer()
-        response = HttpResponse(content_type="application/zip")
-        serializer.serialize(
-            queryset=self.get_queryset(),
-            model=self.get_model(),
-            stream=response,
-            fields=self.get_columns(),
+        # Archive is sent layer after layer, its length is unknown beforehand
+        return StreamingHttpResponse(
+            serializer.iter_zip(
+                queryset=self.get_queryset(),
+                model=self.get_model(),
+                columns=self.get_columns(),
+            ),
+            content_type="application/zip",
         )
-        response["Content-length"] = str(len(response.content))
-        return response
 
     def gpx_view(self, request, context, **kwargs):
         serializer = mapentity_serializers.GPXSerializer()
@@ -187,6 +236,60 @@ class MapEntityFormat(BaseListView, ListView):
         )
         return response
 
+    def flatgeobuf_view(self, request, context, **kwargs):
+        serializer = mapentity_serializers.FlatGeobufSerializer()
+        path = os.path.join(app_settings["TEMP_DIR"], f"{uuid.uuid4().hex}.fgb")
+        serializer.serialize(
+            queryset=self.get_queryset(),
+            model=self.get_model(),
+            path=path,
+            fields=self.get_columns(),
+        )
+        response = FileResponse(open(path, "rb"), content_type="application/flatgeobuf")
+        # File is kept open by response only
+        os.remove(path)
+        return response
+
+    def geopackage_view(self, request, context, **kwargs):
+        serializer = mapentity_serializers.GeoPackageSerializer()
+        path = os.path.join(app_settings["TEMP_DIR"], f"{uuid.uuid4().hex}.gpkg")
+        try:
+            serializer.serialize(
+                queryset=self.get_queryset(),
+                model=self.get_model(),
+                path=path,
+                fields=self.get_columns(),
+            )
+            response = FileResponse(
+                open(path, "rb"), content_type="application/geopackage+sqlite3"
+            )
+        finally:
+            # File is kept open by response only
+            if os.path.exists(path):
+                os.remove(path)
+        return response
+
+    def tiles_archive_view(self, request, context, **kwargs):
+        """
+        Vector tiles archive of the whole layer, built beforehand by the
+        ``export_mvt_tiles`` command: rendering it would not fit in a request
+        """
+        if get_filter_params(request.GET):
+            # Archives are not filtered
+            return HttpResponseBadRequest()
+        fmt = request.GET.get("format")
+        path = get_archive_path(self.get_model(), get_language(), fmt)
+        try:
+            archive = open(path, "rb")
+        except FileNotFoundError as exc:
+            msg = "Archive was not exported (export_mvt_tiles command)"
+            raise Http404(msg) from exc
+        content_types = {
+            "mbtiles": "application/vnd.sqlite3",
+            "pmtiles": "application/vnd.pmtiles",
+        }
+        return FileResponse(archive, content_type=content_types[fmt])
+
     def get_filterset_class(self):
         return self.get_full_filterset()
 
@@ -420,15 +523,6 @@ class DocumentConvert(Convert, DetailView):
 
 
 class MapEntityMultiDelete(ModelViewMixin, MultiObjectActionMixin, ListView):
-    def get_pks(self):
-        pks = self.request.GET.get("pks", None)
-        if pks:
-            return pks.split(",")
-        return None
-
-    def get_queryset(self):
-        return self.model.objects.filter(pk__in=self.get_pks())
-
     @classmethod
     def get_entity_kind(cls):
         return mapentity_models.ENTITY_MULTI_DELETE
@@ -444,7 +538,9 @@ class MapEntityMultiDelete(ModelViewMixin, MultiObjectActionMixin, ListView):
 
     def post(self, request, *args, **kwargs):
         queryset = self.get_queryset()
-        queryset.delete()
+        # Tombstones recorded and layers invalidated once, not per object
+        with bulk_deletion():
+            queryset.delete()
         messages.success(
             self.request,
             _("%(count)d items deleted") % {"count": self.get_queryset().count()},
@@ -462,15 +558,6 @@ class MapEntityMultiDelete(ModelViewMixin, MultiObjectActionMixin, ListView):
 
 
 class MapEntityMultiUpdate(ModelViewMixin, MultiObjectActionMixin, FormMixin, ListView):
-    def get_pks(self):
-        pks = self.request.GET.get("pks", None)
-        if pks:
-            return pks.split(",")
-        return None
-
-    def get_queryset(self):
-        return self.model.objects.filter(pk__in=self.get_pks())
-
     @classmethod
     def get_entity_kind(cls):
         return mapentity_models.ENTITY_MULTI_UPDATE
@@ -495,9 +582,19 @@ class MapEntityMultiUpdate(ModelViewMixin, MultiObjectActionMixin, FormMixin, Li
     def form_valid(self, form):
         queryset = self.get_queryset()
 
-        cleaned_data = form.cleaned_data
+        cleaned_data = dict(form.cleaned_data)
+        date_field = app_settings["DATE_UPDATE_FIELD_NAME"]
+        try:
+            self.get_model()._meta.get_field(date_field)
+        except FieldDoesNotExist:
+            pass
+        else:
+            # Not set by queryset updates, but read by delta layers
+            cleaned_data[date_field] = timezone.now()
 
         modified_rows = queryset.update(**cleaned_data)
+        # Signals are not sent by queryset updates
+        invalidate_layer(self.get_model())
         messages.success(
             self.request, _("%(count)d items updated") % {"count": modified_rows}
         )
@@ -9,7 +9,6 @@ from django.contrib.contenttypes.fields import (
 )
 from django.contrib.gis.db.models import GeometryField
 from django.core.paginator import Paginator
-from django.db.models import Q
 from django.db.models.fields.files import FileField
 from django.http import HttpResponse, HttpResponseNotFound, HttpResponseRedirect
 from django.utils.translation import gettext_lazy as _
@@ -21,6 +20,8 @@ from rest_framework.response import Response
 from ..filters import MapEntityFilterSet
 from ..forms import MapEntityForm
 from ..registry import registry
+from ..search import get_search_backend
+from ..selections import get_selection, get_selection_q
 from ..serializers import json_django_dumps
 
 logger = logging.getLogger(__name__)
@@ -188,11 +189,31 @@ class FilterListMixin:
 
 class MultiObjectActionMixin:
     """
-    Perform data validation before performing an action on multiple items
+    Perform data validation before performing an action on multiple items.
+    Items are given by a stored ``selection`` token, or by ``pks``.
     """
 
+    def get_pks(self):
+        pks = self.request.GET.get("pks", None)
+        if pks:
+            return pks.split(",")
+        return None
+
+    def get_selection(self):
+        """Stored selection of ``selection`` parameter, or None"""
+        token = self.request.GET.get("selection")
+        if not token:
+            return None
+        return get_selection(token, self.get_model(), self.request.user)
+
+    def get_queryset(self):
+        selection = self.get_selection()
+        if selection is not None:
+            return self.model.objects.filter(get_selection_q(selection, self.request))
+        return self.model.objects.filter(pk__in=self.get_pks())
+
     def get(self, request, *args, **kwargs):
-        if not self.get_pks():
+        if self.get_selection() is None and not self.get_pks():
             messages.warning(self.request, _("At least one object must be selected"))
             return HttpResponseRedirect(self.get_success_url())
 
@@ -204,10 +225,7 @@ class AutocompleteMixin:
     serializer_autocomplete_class = None
 
     def _get_filters(self, q):
-        filters = Q()
-        for field in self.autocomplete_search_fields:
-            filters |= Q(**{f"{field}__icontains": q})
-        return filters
+        return get_search_backend().get_q(self.autocomplete_search_fields, q)
 
     def paginate_autocomplete(self, request, queryset):
         try:
@@ -44,6 +44,7 @@ setup(
         'gpxpy',
         'lxml',
         'paperclip',
+        'pmtiles',
         'requests',
         'weasyprint',
     ],
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.11 on 2026-10-18 10:12
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("test_app", "0032_road_tag"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="city",
+            name="geom_simplified",
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                default=None, editable=False, null=True, srid=2154
+            ),
+        ),
+    ]
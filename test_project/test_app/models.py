@@ -132,7 +132,11 @@ class ManikinModel(MapEntityMixin, models.Model):
 
 class City(MapEntityMixin, models.Model):
     geom = models.PolygonField(null=True, default=None, srid=2154)
+    geom_simplified = models.PolygonField(
+        null=True, default=None, srid=2154, editable=False
+    )
     name = models.CharField(max_length=100, verbose_name=_("Name"))
+    generalized_geom_fields = {"geom_simplified": 500}
 
     def __str__(self):
         return self.name
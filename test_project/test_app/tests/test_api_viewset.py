@@ -1,11 +1,28 @@
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework.serializers import ModelSerializer
 from rest_framework.test import APIRequestFactory
 
+from mapentity.cache import get_layers_cache
+from mapentity.pagination import (
+    MapentityDatatablePagination,
+    get_keyset_ordering,
+    get_queryset_count,
+)
 from mapentity.serializers.datatables import MapentityDatatableSerializer
+from mapentity.settings import app_settings
+from mapentity.tests.factories import SuperUserFactory
 from mapentity.views.api import MapEntityViewSet
-from test_project.test_app.models import DummyModel
-from test_project.test_app.tests.factories import DummyModelFactory
+from test_project.test_app.models import ComplexModel, DummyModel
+from test_project.test_app.tests.factories import (
+    ComplexModelFactory,
+    DummyModelFactory,
+    TagFactory,
+)
 
 
 class MapEntityViewSetQuerysetPropertyTestCase(TestCase):
@@ -106,3 +123,163 @@ class FilterInfosResponseTestCase(TestCase):
         self.assertIn("pk_list", data)
         self.assertIn("count", data)
         self.assertNotIn("attributes", data)
+
+
+class FilterInfosEncodingTestCase(TestCase):
+    url = "/api/dummymodel/drf/dummymodels/filter_infos.json"
+
+    def setUp(self):
+        get_layers_cache().clear()
+        self.client.force_login(SuperUserFactory.create())
+        self.objs = DummyModelFactory.create_batch(3)
+
+    def test_pk_ranges(self):
+        DummyModel.objects.filter(pk=self.objs[1].pk).delete()
+        response = self.client.get(self.url, {"pk_encoding": "ranges"})
+        self.assertEqual(response.status_code, 200)
+        first, last = self.objs[0].pk, self.objs[2].pk
+        self.assertEqual(
+            response.json(), {"count": 2, "pk_ranges": [first, 1, last - first, 1]}
+        )
+
+    def test_count_only(self):
+        response = self.client.get(self.url, {"pk_encoding": "count"})
+        self.assertEqual(response.json(), {"count": 3})
+
+    def test_unknown_encoding(self):
+        response = self.client.get(self.url, {"pk_encoding": "bitmap"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_response_is_cached_until_objects_change(self):
+        self.client.get(self.url, {"pk_encoding": "count"})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"pk_encoding": "count"})
+        self.assertEqual(response.json(), {"count": 3})
+        table = DummyModel._meta.db_table
+        self.assertFalse([query for query in queries if table in query["sql"]])
+        DummyModelFactory.create()
+        response = self.client.get(self.url, {"pk_encoding": "count"})
+        self.assertEqual(response.json(), {"count": 4})
+
+
+class DatatablesCountTestCase(TestCase):
+    def setUp(self):
+        get_layers_cache().clear()
+        DummyModelFactory.create_batch(3)
+
+    def test_exact_count(self):
+        self.assertEqual(get_queryset_count(DummyModel.objects.all()), (3, False))
+
+    def test_cached_count_changes_with_objects(self):
+        queryset = DummyModel.objects.all()
+        self.assertEqual(get_queryset_count(queryset, "cached"), (3, False))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_queryset_count(queryset, "cached"), (3, False))
+        DummyModelFactory.create()
+        self.assertEqual(get_queryset_count(queryset, "cached"), (4, False))
+
+    def test_cached_count_is_kept_per_query(self):
+        get_queryset_count(DummyModel.objects.all(), "cached")
+        queryset = DummyModel.objects.filter(pk__lt=0)
+        self.assertEqual(get_queryset_count(queryset, "cached"), (0, False))
+
+    def test_cached_count_follows_related_models(self):
+        obj = ComplexModelFactory.create()
+        queryset = ComplexModel.objects.filter(road__name="foo")
+        self.assertEqual(get_queryset_count(queryset, "cached"), (0, False))
+        obj.road.name = "foo"
+        obj.road.save()
+        self.assertEqual(get_queryset_count(queryset, "cached"), (1, False))
+
+    def test_cached_count_reading_untracked_models_expires(self):
+        tag = TagFactory.create(label="foo")
+        DummyModel.objects.first().tags.add(tag)
+        queryset = DummyModel.objects.filter(tags__label="bar")
+        with mock.patch.dict(app_settings, {"DATATABLES_COUNT_CACHE_TIMEOUT": 0}):
+            self.assertEqual(get_queryset_count(queryset, "cached"), (0, False))
+            # Tag is not a MapEntity model, its changes do not bump generations
+            tag.label = "bar"
+            tag.save()
+            self.assertEqual(get_queryset_count(queryset, "cached"), (1, False))
+
+    def test_estimate_falls_back_to_exact_count(self):
+        # Planner estimates are only read from PostgreSQL
+        queryset = DummyModel.objects.all()
+        self.assertEqual(get_queryset_count(queryset, "estimate"), (3, False))
+
+    def test_unknown_strategy_raises(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_queryset_count(DummyModel.objects.all(), "guess")
+
+    @mock.patch("mapentity.pagination.get_estimated_count", return_value=500000)
+    def test_approximate_count_is_told_to_datatables(self, estimate):
+        self.client.force_login(SuperUserFactory.create())
+        url = "/api/dummymodel/drf/dummymodels.datatables"
+        response = self.client.get(url)
+        self.assertNotIn("recordsApproximate", response.json())
+        with mock.patch.dict(app_settings, {"DATATABLES_COUNT_STRATEGY": "estimate"}):
+            response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(data["recordsTotal"], 500000)
+        self.assertEqual(data["recordsFiltered"], 500000)
+        self.assertTrue(data["recordsApproximate"])
+        self.assertEqual(len(data["data"]), 3)
+
+
+class DatatablesKeysetPaginationTestCase(TestCase):
+    url = "/api/dummymodel/drf/dummymodels.datatables"
+
+    def setUp(self):
+        self.objs = DummyModelFactory.create_batch(5)
+        self.client.force_login(SuperUserFactory.create())
+        keyset = mock.patch.dict(app_settings, {"DATATABLES_KEYSET_PAGINATION": True})
+        keyset.start()
+        self.addCleanup(keyset.stop)
+
+    def get_page(self, start, cursor=None):
+        params = {"start": start, "length": 2}
+        if cursor:
+            params["cursor"] = cursor
+        return self.client.get(self.url, params).json()
+
+    def test_keyset_ordering(self):
+        pk = DummyModel._meta.pk
+        date_update = DummyModel._meta.get_field("date_update")
+        queryset = DummyModel.objects.all()
+        self.assertEqual(get_keyset_ordering(queryset), (pk, False))
+        self.assertEqual(get_keyset_ordering(queryset.order_by("-pk")), (pk, True))
+        self.assertEqual(
+            get_keyset_ordering(queryset.order_by("-date_update", "-id")),
+            (date_update, True),
+        )
+        # Not indexed, or mixed directions
+        self.assertIsNone(get_keyset_ordering(queryset.order_by("name")))
+        self.assertIsNone(get_keyset_ordering(queryset.order_by("date_update", "-id")))
+
+    def test_pages_are_sought_from_cursors(self):
+        pks = [obj.pk for obj in self.objs]
+        first = self.get_page(0)
+        self.assertEqual([row["id"] for row in first["data"]], pks[:2])
+        self.assertNotIn("previousCursor", first)
+        second = self.get_page(2, first["nextCursor"])
+        self.assertEqual([row["id"] for row in second["data"]], pks[2:4])
+        self.assertEqual(second["recordsFiltered"], 5)
+        last = self.get_page(4, second["nextCursor"])
+        self.assertEqual([row["id"] for row in last["data"]], pks[4:])
+        self.assertNotIn("nextCursor", last)
+        previous = self.get_page(2, last["previousCursor"])
+        self.assertEqual([row["id"] for row in previous["data"]], pks[2:4])
+
+    def test_cursor_of_another_page_is_ignored(self):
+        pks = [obj.pk for obj in self.objs]
+        first = self.get_page(0)
+        page = self.get_page(4, first["nextCursor"])
+        self.assertEqual([row["id"] for row in page["data"]], pks[4:])
+        page = self.get_page(2, "invalid")
+        self.assertEqual([row["id"] for row in page["data"]], pks[2:4])
+
+    def test_without_page_size(self):
+        with mock.patch.object(MapentityDatatablePagination, "page_size", None):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["data"]), 5)
@@ -1,7 +1,10 @@
+from unittest import mock
+
 from django.core.checks import Warning
 from django.test import TestCase, override_settings
 
-from mapentity.checks import check_old_config
+from mapentity.checks import check_layers_cache, check_old_config
+from mapentity.settings import app_settings
 
 
 class OldConfigCheckTestCase(TestCase):
@@ -24,3 +27,15 @@ class OldConfigCheckTestCase(TestCase):
         self.assertEqual(result[0].id, "mapentity.W001")
         self.assertIn("LEAFLET_CONFIG", result[0].msg)
         self.assertIn("MAPLIBRE_CONFIG", result[0].msg)
+
+
+class LayersCacheCheckTestCase(TestCase):
+    def test_no_warning_with_shared_cache(self):
+        with mock.patch.dict(app_settings, {"GEOJSON_LAYERS_CACHE_BACKEND": "files"}):
+            self.assertEqual(check_layers_cache(None), [])
+
+    def test_warning_with_process_local_cache(self):
+        with mock.patch.dict(app_settings, {"GEOJSON_LAYERS_CACHE_BACKEND": "default"}):
+            result = check_layers_cache(None)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].id, "mapentity.W003")
@@ -0,0 +1,238 @@
+import gzip
+from unittest import mock, skipIf
+
+from django.contrib.gis.geos import LineString, Point
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from mapentity.cache import (
+    ContentEntryBuilder,
+    brotli,
+    bump_geometry_tiles,
+    bump_model_generation,
+    get_content_entry_response,
+    get_filters_cache_key,
+    get_geometry_tile_ranges,
+    get_layers_cache,
+    get_model_generation,
+    get_model_last_modified,
+    get_tile_version,
+    index_tile,
+    invalidate_layer,
+    iter_content_entry,
+    make_content_entry,
+)
+from mapentity.settings import app_settings
+from test_project.test_app.models import DummyModel, MushroomSpot
+from test_project.test_app.tests.factories import DummyModelFactory, TagFactory
+from test_project.test_app.views import DummyViewSet
+
+
+class TileIndexTest(TestCase):
+    def setUp(self):
+        get_layers_cache().clear()
+
+    def test_tiles_above_max_zoom_use_parent_tile(self):
+        max_zoom = app_settings["MVT_TILE_INDEX_MAX_ZOOM"]
+        self.assertEqual(index_tile(max_zoom + 2, 9, 13), (max_zoom, 2, 3))
+        self.assertEqual(index_tile(3, 1, 2), (3, 1, 2))
+
+    def test_geometry_tile_ranges_cover_all_index_zooms(self):
+        ranges = get_geometry_tile_ranges(Point(0, 0, srid=4326))
+        self.assertEqual(len(ranges), app_settings["MVT_TILE_INDEX_MAX_ZOOM"] + 1)
+        self.assertEqual(ranges[0], (0, 0, 0, 0, 0))
+
+    def test_empty_geometry_has_no_tiles(self):
+        self.assertEqual(get_geometry_tile_ranges(None), [])
+
+    def test_version_is_stable_without_changes(self):
+        version = get_tile_version(DummyModel, 10, 512, 512)
+        self.assertEqual(version, get_tile_version(DummyModel, 10, 512, 512))
+
+    def test_save_bumps_only_covered_tiles(self):
+        obj = DummyModelFactory.create(geom=Point(0, 0, srid=4326))
+        inside = get_tile_version(DummyModel, 10, 512, 512)
+        outside = get_tile_version(DummyModel, 10, 520, 512)
+        obj.name = "changed"
+        obj.save()
+        self.assertNotEqual(inside, get_tile_version(DummyModel, 10, 512, 512))
+        self.assertEqual(outside, get_tile_version(DummyModel, 10, 520, 512))
+
+    def test_save_bumps_tiles_of_previous_geometry(self):
+        obj = DummyModelFactory.create(geom=Point(0, 0, srid=4326))
+        previous = get_tile_version(DummyModel, 10, 512, 512)
+        obj.geom = Point(10, 10, srid=4326)
+        obj.save()
+        self.assertNotEqual(previous, get_tile_version(DummyModel, 10, 512, 512))
+
+    def test_delete_bumps_tiles(self):
+        obj = DummyModelFactory.create(geom=Point(0, 0, srid=4326))
+        previous = get_tile_version(DummyModel, 10, 512, 512)
+        obj.delete()
+        self.assertNotEqual(previous, get_tile_version(DummyModel, 10, 512, 512))
+
+    def test_large_geometry_invalidates_all_model_tiles(self):
+        max_tiles = app_settings["MVT_TILE_INDEX_MAX_TILES"]
+        app_settings["MVT_TILE_INDEX_MAX_TILES"] = 20
+        try:
+            far = get_tile_version(DummyModel, 10, 100, 100)
+            bump_geometry_tiles(DummyModel, [Point(0, 0, srid=4326)])
+            self.assertEqual(far, get_tile_version(DummyModel, 10, 100, 100))
+            bump_geometry_tiles(DummyModel, [LineString((0, 0), (10, 10), srid=4326)])
+            self.assertNotEqual(far, get_tile_version(DummyModel, 10, 100, 100))
+        finally:
+            app_settings["MVT_TILE_INDEX_MAX_TILES"] = max_tiles
+
+    def test_model_without_geometry_field_invalidates_all_tiles(self):
+        previous = get_tile_version(MushroomSpot, 10, 512, 512)
+        MushroomSpot.objects.create(serialized="SRID=4326;POINT(0 0)")
+        self.assertNotEqual(previous, get_tile_version(MushroomSpot, 10, 512, 512))
+
+
+class FiltersCacheKeyTest(TestCase):
+    def get_key(self, query_string):
+        request = Request(APIRequestFactory().get(f"/?{query_string}"))
+        view = DummyViewSet(request=request, format_kwarg="geojson")
+        return get_filters_cache_key(view)
+
+    def test_no_filters(self):
+        self.assertEqual(self.get_key(""), "")
+        self.assertEqual(self.get_key("_=123&name="), "")
+
+    def test_equivalent_filters_share_key(self):
+        tags = TagFactory.create_batch(2)
+        key = self.get_key(f"name=toto&tags={tags[0].pk}&tags={tags[1].pk}")
+        self.assertTrue(key)
+        self.assertEqual(
+            key, self.get_key(f"tags={tags[1].pk}&_=1&tags={tags[0].pk}&name=toto")
+        )
+        self.assertNotEqual(key, self.get_key(f"name=toto&tags={tags[0].pk}"))
+
+    def test_unknown_parameters_change_key(self):
+        self.assertNotEqual(self.get_key("name=toto"), self.get_key("name=toto&a=1"))
+
+    def test_parameters_prefixed_by_filter_name_change_key(self):
+        self.assertNotEqual(
+            self.get_key("name=toto"), self.get_key("name=toto&name_foo=1")
+        )
+
+    def test_invalid_filters(self):
+        self.assertIsNone(self.get_key("tags=999999"))
+
+
+class ModelGenerationTest(TestCase):
+    def setUp(self):
+        get_layers_cache().clear()
+        self.obj = DummyModelFactory.create()
+        self.generation = get_model_generation(DummyModel)
+
+    def test_generation_is_read_from_cache(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(get_model_generation(DummyModel), self.generation)
+            get_model_last_modified(DummyModel)
+
+    def test_save_bumps_generation(self):
+        self.obj.save()
+        self.assertGreater(get_model_generation(DummyModel), self.generation)
+
+    def test_bumps_are_increments(self):
+        bump_model_generation(DummyModel)
+        bump_model_generation(DummyModel)
+        self.assertEqual(get_model_generation(DummyModel), self.generation + 2)
+
+    def test_save_changes_last_modified(self):
+        last_modified = get_model_last_modified(DummyModel)
+        self.obj.save()
+        self.assertGreater(get_model_last_modified(DummyModel), last_modified)
+
+    def test_delete_bumps_generation(self):
+        self.obj.delete()
+        self.assertGreater(get_model_generation(DummyModel), self.generation)
+
+    def test_m2m_change_bumps_generation(self):
+        self.obj.tags.add(TagFactory.create())
+        self.assertGreater(get_model_generation(DummyModel), self.generation)
+
+    def test_queryset_update_does_not_bump_generation(self):
+        DummyModel.objects.update(public=True)
+        self.assertEqual(get_model_generation(DummyModel), self.generation)
+        invalidate_layer(DummyModel)
+        self.assertGreater(get_model_generation(DummyModel), self.generation)
+
+
+class ContentEntryTest(SimpleTestCase):
+    def setUp(self):
+        self.entry = make_content_entry(
+            b'{"type": "FeatureCollection"}', "application/json"
+        )
+
+    def get_response(self, accept_encoding=None):
+        headers = {"Accept-Encoding": accept_encoding} if accept_encoding else {}
+        request = RequestFactory().get("/", headers=headers)
+        return get_content_entry_response(request, self.entry)
+
+    def test_entry_holds_compressed_variants(self):
+        self.assertEqual(gzip.decompress(self.entry["gzip"]), self.entry["content"])
+
+    @skipIf(brotli is None, "brotli is not installed")
+    def test_entry_holds_brotli_variant(self):
+        self.assertEqual(brotli.decompress(self.entry["br"]), self.entry["content"])
+
+    def test_uncompressed_response(self):
+        response = self.get_response()
+        self.assertEqual(response.content, self.entry["content"])
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response["ETag"], f'W/"{self.entry["etag"]}"')
+
+    @skipIf(brotli is None, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        response = self.get_response("gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response.content, self.entry["br"])
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_gzip_response(self):
+        response = self.get_response("gzip, br;q=0")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response.content, self.entry["gzip"])
+
+    def test_refused_encodings(self):
+        for accept_encoding in ("gzip;q=0.00, br;q=0", "gzip; Q=0, br;q=invalid"):
+            response = self.get_response(accept_encoding)
+            self.assertNotIn("Content-Encoding", response)
+            self.assertEqual(response.content, self.entry["content"])
+
+
+class StreamedContentEntryTest(SimpleTestCase):
+    chunks = [b'{"type": "FeatureCollection", ', b'"features": []}']
+
+    def setUp(self):
+        get_layers_cache().delete("streamed")
+
+    def test_chunks_are_compressed_as_they_come(self):
+        builder = ContentEntryBuilder("application/json")
+        for chunk in self.chunks:
+            builder.write(chunk)
+        entry = builder.finish()
+        expected = make_content_entry(b"".join(self.chunks), "application/json")
+        self.assertEqual(entry["content"], expected["content"])
+        self.assertEqual(entry["etag"], expected["etag"])
+        self.assertEqual(gzip.decompress(entry["gzip"]), expected["content"])
+        if brotli is not None:
+            self.assertEqual(brotli.decompress(entry["br"]), expected["content"])
+
+    def test_streamed_content_is_stored_once_sent(self):
+        content = iter_content_entry("streamed", iter(self.chunks), "application/json")
+        self.assertEqual(list(content), self.chunks)
+        entry = get_layers_cache().get("streamed")
+        self.assertEqual(entry["content"], b"".join(self.chunks))
+
+    def test_large_streamed_content_is_not_stored(self):
+        with mock.patch.dict(app_settings, {"GEOJSON_STREAMING_CACHE_MAX_SIZE": 20}):
+            content = iter_content_entry(
+                "streamed", iter(self.chunks), "application/json"
+            )
+            self.assertEqual(list(content), self.chunks)
+        self.assertIsNone(get_layers_cache().get("streamed"))
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+from contextlib import closing
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from mapentity.cache import get_layers_cache, get_tile_cache_key
+from mapentity.tiles import get_tile_viewset
+from test_project.test_app.models import DummyModel
+from test_project.test_app.tests.factories import DummyModelFactory
+
+
+class SeedMVTTilesCommandTest(TestCase):
+    def setUp(self):
+        self.cache = get_layers_cache()
+        self.cache.clear()
+
+    def call_seed(self, **options):
+        out = StringIO()
+        kwargs = {
+            "models": ["test_app.dummymodel"],
+            "bbox": "-1,-1,1,1",
+            "max_zoom": 1,
+            "processes": 1,
+            "languages": ["en"],
+        }
+        kwargs.update(options)
+        call_command("seed_mvt_tiles", stdout=out, stderr=StringIO(), **kwargs)
+        return out.getvalue()
+
+    def test_non_empty_tiles_are_cached(self):
+        DummyModelFactory.create(geom=Point(0.5, 0.5, srid=4326))
+        output = self.call_seed()
+        self.assertIn("2 tiles cached, 3 empty tiles skipped", output)
+        self.assertIsNotNone(
+            self.cache.get(get_tile_cache_key(DummyModel, "en", 0, 0, 0))
+        )
+        self.assertIsNotNone(
+            self.cache.get(get_tile_cache_key(DummyModel, "en", 1, 1, 0))
+        )
+        self.assertIsNone(self.cache.get(get_tile_cache_key(DummyModel, "en", 1, 0, 1)))
+
+    def test_seeded_tiles_are_invalidated_by_changes(self):
+        obj = DummyModelFactory.create(geom=Point(0.5, 0.5, srid=4326))
+        self.call_seed()
+        obj.save()
+        self.assertIsNone(self.cache.get(get_tile_cache_key(DummyModel, "en", 0, 0, 0)))
+
+    def test_tiles_changed_while_rendered_are_not_kept(self):
+        obj = DummyModelFactory.create(geom=Point(0.5, 0.5, srid=4326))
+        viewset = get_tile_viewset(DummyModel)
+        render = viewset.get_layer_tiles
+
+        def render_and_change(z, x, y):
+            content = render(z, x, y)
+            obj.save()
+            return content
+
+        with mock.patch.object(viewset, "get_layer_tiles", render_and_change):
+            with mock.patch(
+                "mapentity.management.commands.seed_mvt_tiles.get_tile_viewset",
+                return_value=viewset,
+            ):
+                self.call_seed(max_zoom=0)
+        self.assertIsNone(self.cache.get(get_tile_cache_key(DummyModel, "en", 0, 0, 0)))
+
+    def test_untranslated_tiles_are_seeded_once(self):
+        output = self.call_seed(models=["test_app.city"], languages=["en", "fr"])
+        self.assertIn("0 tiles cached, 5 empty tiles skipped", output)
+
+    def test_unknown_model_raises(self):
+        with self.assertRaises(CommandError):
+            self.call_seed(models=["test_app.weatherstation"])
+
+    def test_invalid_bbox_raises(self):
+        with self.assertRaises(CommandError):
+            self.call_seed(bbox="1,2,3")
+
+    def test_invalid_zoom_range_raises(self):
+        with self.assertRaises(CommandError):
+            self.call_seed(min_zoom=4)
+
+
+class ExportMVTTilesCommandTest(TestCase):
+    def setUp(self):
+        get_layers_cache().clear()
+        self.output_dir = TemporaryDirectory()
+        self.addCleanup(self.output_dir.cleanup)
+        DummyModelFactory.create(geom=Point(0.5, 0.5, srid=4326))
+
+    def call_export(self, **options):
+        out = StringIO()
+        kwargs = {
+            "models": ["test_app.dummymodel"],
+            "bbox": "-1,-1,1,1",
+            "max_zoom": 3,
+            "processes": 1,
+            "languages": ["en"],
+            "output_dir": self.output_dir.name,
+        }
+        kwargs.update(options)
+        call_command("export_mvt_tiles", stdout=out, stderr=StringIO(), **kwargs)
+        return out.getvalue()
+
+    def get_path(self, fmt="mbtiles"):
+        return os.path.join(self.output_dir.name, f"test_app.dummymodel-en.{fmt}")
+
+    def count_tiles(self):
+        with closing(sqlite3.connect(self.get_path())) as connection:
+            return connection.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def test_non_empty_tiles_are_exported(self):
+        output = self.call_export()
+        # One tile per zoom level, empty tiles and their children are skipped
+        self.assertIn("7 tiles rendered, 0 unchanged tiles kept", output)
+        self.assertEqual(self.count_tiles(), 4)
+
+    def test_only_changed_tiles_are_rendered_again(self):
+        self.call_export()
+        self.assertIn("0 tiles rendered, 7 unchanged tiles kept", self.call_export())
+        DummyModelFactory.create(geom=Point(-0.5, -0.5, srid=4326))
+        output = self.call_export()
+        self.assertIn("4 tiles rendered, 5 unchanged tiles kept", output)
+        self.assertEqual(self.count_tiles(), 7)
+
+    def test_archive_is_replaced_once_complete(self):
+        self.call_export()
+        with mock.patch(
+            "mapentity.tiles.MBTilesArchive.prune", side_effect=ValueError("Broken")
+        ):
+            with self.assertRaises(ValueError):
+                self.call_export(full=True)
+        # Previous archive is kept, temporary copy was removed
+        self.assertEqual(self.count_tiles(), 4)
+        self.assertEqual(
+            os.listdir(self.output_dir.name), ["test_app.dummymodel-en.mbtiles"]
+        )
+
+    def test_full_export(self):
+        self.call_export()
+        self.assertIn("7 tiles rendered", self.call_export(full=True))
+
+    def test_pmtiles_export(self):
+        self.call_export(format="pmtiles")
+        with open(self.get_path("pmtiles"), "rb") as f:
+            self.assertEqual(f.read(7), b"PMTiles")
+
+    def test_invalid_zoom_range_raises(self):
+        with self.assertRaises(CommandError):
+            self.call_export(min_zoom=4)
@@ -0,0 +1,149 @@
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from mapentity.cache import get_layers_cache
+from mapentity.exports import (
+    claim_export_jobs,
+    heartbeat_export_jobs,
+    run_export_job,
+    touch_export_jobs,
+)
+from mapentity.models import ExportJob
+from mapentity.tests.factories import SuperUserFactory
+from test_project.test_app.models import DummyModel
+from test_project.test_app.tests.factories import DummyModelFactory
+
+
+class ExportJobTest(TestCase):
+    def setUp(self):
+        get_layers_cache().clear()
+        self.user = SuperUserFactory.create()
+        self.client.force_login(self.user)
+        self.objs = DummyModelFactory.create_batch(3)
+        self.url = DummyModel.get_format_list_url()
+
+    def request_export(self, **params):
+        params = {"format": "csv", "async": "1", **params}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_export_is_enqueued(self):
+        status = self.request_export(name="foo")
+        self.assertEqual(status["status"], ExportJob.PENDING)
+        self.assertIsNone(status["download_url"])
+        job = ExportJob.objects.get(pk=status["id"])
+        self.assertEqual(job.user, self.user)
+        self.assertEqual(job.query_string, "name=foo")
+        self.assertEqual(job.format, "csv")
+
+    def test_async_is_parsed_as_boolean(self):
+        response = self.client.get(self.url, {"format": "csv", "async": "0"})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertEqual(self.request_export(**{"async": "true"})["status"], "pending")
+
+    def test_export_is_run_by_worker(self):
+        status = self.request_export()
+        self.assertEqual(claim_export_jobs(10), [status["id"]])
+        self.assertEqual(run_export_job(status["id"]), ExportJob.DONE)
+        status = self.client.get(status["url"]).json()
+        self.assertEqual(status["status"], ExportJob.DONE)
+        response = self.client.get(status["download_url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.getvalue().splitlines()), 4)
+
+    def test_export_is_reused_until_objects_change(self):
+        first = self.request_export()
+        run_export_job(first["id"])
+        self.client.force_login(SuperUserFactory.create())
+        second = self.request_export()
+        self.assertEqual(second["status"], ExportJob.DONE)
+        self.assertEqual(
+            ExportJob.objects.get(pk=second["id"]).file.name,
+            ExportJob.objects.get(pk=first["id"]).file.name,
+        )
+        self.objs[0].save()
+        third = self.request_export()
+        self.assertEqual(third["status"], ExportJob.PENDING)
+
+    def test_export_is_not_reused_with_other_filters(self):
+        run_export_job(self.request_export()["id"])
+        self.assertEqual(self.request_export(name="foo")["status"], ExportJob.PENDING)
+
+    def test_export_of_another_user(self):
+        status = self.request_export()
+        self.client.force_login(SuperUserFactory.create())
+        self.assertEqual(self.client.get(status["url"]).status_code, 404)
+
+    def test_pending_export_cannot_be_downloaded(self):
+        status = self.request_export()
+        url = reverse("mapentity:export_job_download", args=[status["id"]])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_failed_export(self):
+        status = self.request_export()
+        with mock.patch(
+            "mapentity.serializers.CSVSerializer.iter_chunks",
+            side_effect=ValueError("Broken"),
+        ):
+            self.assertEqual(run_export_job(status["id"]), ExportJob.FAILED)
+        status = self.client.get(status["url"]).json()
+        self.assertEqual(status["status"], ExportJob.FAILED)
+
+    def test_worker_command(self):
+        status = self.request_export()
+        output = StringIO()
+        call_command("run_export_worker", "--once", "--processes=0", stdout=output)
+        self.assertIn(f"Export job {status['id']}: done", output.getvalue())
+
+    def test_worker_fails_jobs_of_broken_pool(self):
+        status = self.request_export()
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        output = StringIO()
+        with mock.patch(
+            "mapentity.management.commands.run_export_worker.ProcessPoolExecutor"
+        ) as executor_class:
+            executor_class.return_value.submit.return_value = future
+            call_command("run_export_worker", "--once", stdout=output)
+        self.assertIn(f"Export job {status['id']}: failed", output.getvalue())
+        self.assertEqual(
+            ExportJob.objects.get(pk=status["id"]).status, ExportJob.FAILED
+        )
+        # Pool was created again
+        self.assertEqual(executor_class.call_count, 2)
+
+    def test_inline_jobs_are_touched_while_running(self):
+        with mock.patch("mapentity.exports.touch_export_jobs") as touch:
+            with heartbeat_export_jobs([1], 0.01):
+                time.sleep(0.1)
+        touch.assert_called_with([1])
+
+    def test_stale_running_jobs_are_claimed_again(self):
+        status = self.request_export()
+        self.assertEqual(claim_export_jobs(10), [status["id"]])
+        self.assertEqual(claim_export_jobs(10), [])
+        ExportJob.objects.update(date_update=timezone.now() - timedelta(hours=2))
+        touch_export_jobs([status["id"]])
+        self.assertEqual(claim_export_jobs(10), [])
+        ExportJob.objects.update(date_update=timezone.now() - timedelta(hours=2))
+        self.assertEqual(claim_export_jobs(10), [status["id"]])
+
+    def test_outdated_jobs_are_purged(self):
+        status = self.request_export()
+        run_export_job(status["id"])
+        job = ExportJob.objects.get(pk=status["id"])
+        ExportJob.objects.update(date_insert=timezone.now() - timedelta(days=2))
+        ExportJob.purge()
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertFalse(job.file.storage.exists(job.file.name))
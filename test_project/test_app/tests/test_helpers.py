@@ -8,6 +8,7 @@ from mapentity.helpers import (
     capture_url,
     convertit_url,
     download_content,
+    encode_pk_ranges,
     user_has_perm,
 )
 from mapentity.registry import app_settings
@@ -78,6 +79,15 @@ class MapEntityConvertHelpersTest(TestCase):
         self.assertIn("from=application/%23bb", url)
 
 
+class EncodePkRangesTest(TestCase):
+    def test_consecutive_keys_are_grouped(self):
+        self.assertEqual(encode_pk_ranges([1, 2, 3, 7, 9, 10]), [1, 3, 4, 1, 2, 2])
+
+    def test_single_and_no_keys(self):
+        self.assertEqual(encode_pk_ranges([42]), [42, 1])
+        self.assertEqual(encode_pk_ranges(iter([])), [])
+
+
 class UserHasPermTest(TestCase):
     def setUp(self):
         self.user = mock.MagicMock()
@@ -0,0 +1,112 @@
+import mapbox_vector_tile
+from django.contrib.gis.geos import LineString, Polygon
+from django.test import TestCase
+from django.urls import reverse
+
+from mapentity.cache import get_layers_cache
+from mapentity.layers import ClusteredVectorLayerMixin, GeneralizedVectorLayerMixin
+from mapentity.registry import registry
+from mapentity.tests.factories import SuperUserFactory
+from test_project.test_app.models import City, Road
+from test_project.test_app.tests.factories import CityFactory, RoadFactory
+
+
+class VectorLayerTestMixin:
+    model = None
+
+    def setUp(self):
+        get_layers_cache().clear()
+        self.client.force_login(SuperUserFactory.create())
+        self.options = registry.registry[self.model]
+
+    def get_tile_features(self, z, x, y):
+        url = reverse(
+            f"test_app:{self.model._meta.model_name}-drf-mvt",
+            kwargs={"z": z, "x": x, "y": y},
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if not response.content:
+            return []
+        layer = self.model._meta.model_name
+        return mapbox_vector_tile.decode(response.content)[layer]["features"]
+
+
+class GeneralizedVectorLayerTest(VectorLayerTestMixin, TestCase):
+    model = City
+
+    def setUp(self):
+        super().setUp()
+        geom = Polygon.from_bbox((0.1, 45.1, 0.2, 45.2))
+        geom.srid = 4326
+        self.city = CityFactory.create(geom=geom)
+
+    def tearDown(self):
+        self.options.__dict__.pop("vector_tiles_generalization", None)
+
+    def test_generalization_applies_until_next_zoom(self):
+        layer = GeneralizedVectorLayerMixin()
+        layer.generalization = {0: 1000, 8: "geom_simplified", 14: None}
+        self.assertEqual(layer.get_generalization(0), 1000)
+        self.assertEqual(layer.get_generalization(7), 1000)
+        self.assertEqual(layer.get_generalization(8), "geom_simplified")
+        self.assertIsNone(layer.get_generalization(15))
+
+    def test_no_generalization_by_default(self):
+        self.assertIsNone(GeneralizedVectorLayerMixin().get_generalization(5))
+
+    def test_generalized_geometries_are_updated_on_save(self):
+        self.assertIsNotNone(self.city.geom_simplified)
+        self.assertEqual(self.city.geom_simplified.srid, 2154)
+        self.city.geom = None
+        self.city.save()
+        self.assertIsNone(self.city.geom_simplified)
+
+    def test_refresh_generalized_geometries(self):
+        City.objects.update(geom_simplified=None)
+        self.assertEqual(City.refresh_generalized_geometries(), 1)
+        self.city.refresh_from_db()
+        self.assertIsNotNone(self.city.geom_simplified)
+
+    def test_tiles_are_simplified_on_the_fly(self):
+        self.options.vector_tiles_generalization = {0: 10000}
+        features = self.get_tile_features(0, 0, 0)
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]["properties"]["id"], self.city.pk)
+
+    def test_tiles_use_precomputed_geometries(self):
+        self.options.vector_tiles_generalization = {0: "geom_simplified"}
+        features = self.get_tile_features(0, 0, 0)
+        self.assertEqual(len(features), 1)
+
+
+class ClusteredVectorLayerTest(VectorLayerTestMixin, TestCase):
+    model = Road
+
+    def setUp(self):
+        super().setUp()
+        self.options.vector_tiles_cluster_max_zoom = 5
+        RoadFactory.create(geom=LineString((0.5, 45.5), (0.51, 45.51), srid=4326))
+        RoadFactory.create(geom=LineString((0.52, 45.5), (0.53, 45.51), srid=4326))
+
+    def tearDown(self):
+        del self.options.vector_tiles_cluster_max_zoom
+
+    def test_clustering_is_disabled_by_default(self):
+        layer = ClusteredVectorLayerMixin()
+        self.assertFalse(layer.is_clustered(0))
+        layer.cluster_max_zoom = 5
+        self.assertTrue(layer.is_clustered(5))
+        self.assertFalse(layer.is_clustered(6))
+
+    def test_close_features_are_clustered_at_low_zoom(self):
+        RoadFactory.create(geom=LineString((-1, 43), (-1.1, 43.1), srid=4326))
+        features = self.get_tile_features(0, 0, 0)
+        self.assertEqual(
+            sorted(feature["properties"]["count"] for feature in features), [1, 2]
+        )
+
+    def test_features_are_not_clustered_above_max_zoom(self):
+        features = self.get_tile_features(6, 32, 22)
+        self.assertEqual(len(features), 2)
+        self.assertNotIn("count", features[0]["properties"])
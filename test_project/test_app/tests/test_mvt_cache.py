@@ -6,6 +6,7 @@ from django.test import TestCase
 from django.urls import reverse
 
 from mapentity.settings import app_settings
+from test_project.test_app.models import DummyModel
 from test_project.test_app.tests.factories import DummyModelFactory
 
 
@@ -69,6 +70,18 @@ class MVTCacheTest(TestCase):
         )
         self.assertNotEqual(response4["ETag"], etag_initial)
 
+    def test_mvt_with_parameters_is_cached_per_filters(self):
+        DummyModelFactory.create(geom=Point(0, 0, srid=4326))
+        url = reverse("test_app:dummymodel-drf-mvt", kwargs={"z": 0, "x": 0, "y": 0})
+        self.assertTrue(self.client.get(url).content)
+        self.assertTrue(self.client.get(url, {"name": "foo"}).content)
+        # Bypass save() so that tile version does not change
+        DummyModel.objects.update(geom=None)
+        # Tiles are served from cache, each for its own filters
+        self.assertTrue(self.client.get(url).content)
+        self.assertTrue(self.client.get(url, {"name": "foo", "_": "1"}).content)
+        self.assertFalse(self.client.get(url, {"name": "bar"}).content)
+
     def test_mvt_cache_key_includes_coords(self):
         """Test if different tiles have different cache entries"""
         # Zoom 1 has 4 tiles. (0,0,1), (1,0,1), (0,1,1), (1,1,1)
@@ -0,0 +1,60 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from mapentity.querysets import (
+    get_related_lookups,
+    get_serializer_paths,
+    plan_queryset,
+)
+from mapentity.tests.factories import SuperUserFactory
+from test_project.test_app.models import DummyModel, Road, Tag
+from test_project.test_app.serializers import DummySerializer, RoadSerializer
+from test_project.test_app.tests.factories import DummyModelFactory
+from test_project.test_app.views import DummyViewSet
+
+
+class RelatedLookupsTest(TestCase):
+    def test_foreign_keys_are_joined(self):
+        self.assertEqual(
+            get_related_lookups(Road, ["id", "name", "tag", "tag__label"]),
+            (["tag"], []),
+        )
+
+    def test_many_relations_are_prefetched(self):
+        self.assertEqual(
+            get_related_lookups(DummyModel, ["tags", "attachments"]),
+            ([], ["attachments", "tags"]),
+        )
+
+    def test_reverse_relations_are_read_from_accessor(self):
+        self.assertEqual(
+            get_related_lookups(Tag, ["road_set", "road", "unknown"]),
+            ([], ["road_set"]),
+        )
+
+    def test_serializer_paths(self):
+        self.assertIn("tag", get_serializer_paths(RoadSerializer()))
+        self.assertIn("tags", get_serializer_paths(DummySerializer(many=True)))
+
+    def test_planned_queryset_does_not_query_relations(self):
+        DummyModelFactory.create_batch(3)
+        queryset = plan_queryset(DummyModel.objects.all(), ["tags"])
+        with self.assertNumQueries(2):
+            for obj in queryset:
+                list(obj.tags.all())
+
+    def test_serializer_is_planned_with_its_context(self):
+        class RequestSerializer(DummySerializer):
+            def get_fields(self):
+                # Fields of some serializers depend on the request
+                self.context["request"]
+                return super().get_fields()
+
+        DummyModelFactory.create()
+        self.client.force_login(SuperUserFactory.create())
+        url = reverse("test_app:dummymodel-drf-list", kwargs={"format": "json"})
+        with mock.patch.object(DummyViewSet, "serializer_class", RequestSerializer):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,127 @@
+from io import StringIO
+from unittest import mock
+
+from django.core import checks
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from mapentity.search import (
+    SearchBackend,
+    TrigramSearchBackend,
+    get_missing_search_indexes,
+    get_search_columns,
+    get_search_paths,
+)
+from mapentity.settings import app_settings
+from mapentity.tests.factories import SuperUserFactory
+from test_project.test_app.models import MushroomSpot, Road, Tag
+from test_project.test_app.tests.factories import RoadFactory
+
+
+class RecordingSearchBackend(SearchBackend):
+    searches = []
+
+    def get_q(self, fields, value):
+        if value:
+            self.searches.append((list(fields), value))
+        return super().get_q(fields, value)
+
+
+class SearchColumnsTest(TestCase):
+    def test_translated_fields_are_searched_in_every_language(self):
+        columns = get_search_columns(Road, ["id", "name"])
+        self.assertEqual(
+            [field.name for field in columns[Road]],
+            ["id", "name_en", "name_fr", "name_zh_hant"],
+        )
+
+    def test_related_fields_are_searched_on_related_model(self):
+        columns = get_search_columns(Road, ["tag__label", "tag", "geom", "unknown"])
+        self.assertEqual(list(columns), [Tag])
+        self.assertEqual([field.name for field in columns[Tag]], ["label"])
+
+    def test_search_paths_of_registered_models(self):
+        self.assertEqual(get_search_paths(Road), ["id", "name"])
+        self.assertEqual(get_search_paths(MushroomSpot), ["id"])
+
+    def test_icontains_backend_has_no_index(self):
+        self.assertEqual(SearchBackend().get_indexes(Road, ["id", "name"]), [])
+
+    def test_trigram_indexes(self):
+        indexes = TrigramSearchBackend().get_indexes(Road, ["id", "name"])
+        names = [index.name for model, index in indexes]
+        self.assertEqual(len(names), 4)
+        self.assertEqual(len(set(names)), 4)
+        for name in names:
+            self.assertLessEqual(len(name), 30)
+            self.assertTrue(name.endswith("_trgm"))
+
+
+class SearchBackendTest(TestCase):
+    def setUp(self):
+        self.cahors = RoadFactory.create(name="Cahors")
+        self.toulouse = RoadFactory.create(name="Toulouse")
+        RecordingSearchBackend.searches = []
+        backend = mock.patch.dict(
+            app_settings,
+            {"SEARCH_BACKEND": f"{__name__}.RecordingSearchBackend"},
+        )
+        backend.start()
+        self.addCleanup(backend.stop)
+
+    def test_filter(self):
+        queryset = SearchBackend().filter(Road.objects.all(), ["name"], "HOR")
+        self.assertQuerySetEqual(queryset, [self.cahors])
+        self.assertEqual(
+            SearchBackend().filter(Road.objects.all(), ["name"], "").count(), 2
+        )
+
+    def test_autocomplete_uses_search_backend(self):
+        response = self.client.get(
+            reverse("test_app:road-drf-autocomplete"), {"q": "Tou"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]],
+            [self.toulouse.pk],
+        )
+        self.assertEqual(RecordingSearchBackend.searches, [(["name"], "Tou")])
+
+    def test_datatables_search_uses_search_backend(self):
+        self.client.force_login(SuperUserFactory.create())
+        params = {
+            "columns[0][data]": "id",
+            "columns[0][searchable]": "true",
+            "columns[1][data]": "name",
+            "columns[1][searchable]": "true",
+            "search[value]": "cah",
+            "search[regex]": "false",
+        }
+        response = self.client.get("/api/road/drf/roads.datatables", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row["id"] for row in response.json()["data"]], [self.cahors.pk]
+        )
+        self.assertEqual(
+            RecordingSearchBackend.searches, [(["id"], "cah"), (["name"], "cah")]
+        )
+
+
+class SearchIndexesTest(TestCase):
+    def setUp(self):
+        backend = mock.patch.dict(
+            app_settings, {"SEARCH_BACKEND": "mapentity.search.TrigramSearchBackend"}
+        )
+        backend.start()
+        self.addCleanup(backend.stop)
+
+    def test_indexes_are_not_checked_without_postgresql(self):
+        self.assertEqual(get_missing_search_indexes(), [])
+        errors = checks.run_checks(databases=["default"], tags=[checks.Tags.database])
+        self.assertFalse([error for error in errors if error.id == "mapentity.W002"])
+
+    def test_command_without_postgresql(self):
+        output = StringIO()
+        call_command("create_search_indexes", "--check", stdout=output)
+        self.assertIn("only supported with PostgreSQL", output.getvalue())
@@ -0,0 +1,181 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from mapentity.cache import get_layers_cache
+from mapentity.models import Tombstone
+from mapentity.selections import create_selection, get_selection, get_selection_q
+from mapentity.tests.factories import SuperUserFactory, UserFactory
+from test_project.test_app.models import ComplexModel, DummyModel
+from test_project.test_app.tests.factories import (
+    ComplexModelFactory,
+    DummyModelFactory,
+)
+
+
+class SelectionTest(TestCase):
+    def setUp(self):
+        get_layers_cache().clear()
+        self.user = SuperUserFactory.create()
+        self.objs = DummyModelFactory.create_batch(4)
+
+    def test_selection_is_stored_as_ranges(self):
+        queryset = DummyModel.objects.exclude(pk=self.objs[2].pk)
+        token, count = create_selection(queryset, self.user)
+        self.assertEqual(count, 3)
+        selection = get_selection(token, DummyModel, self.user)
+        first, last = self.objs[0].pk, self.objs[3].pk
+        self.assertEqual(selection["ranges"], [first, 2, last - first - 1, 1])
+        self.assertQuerySetEqual(
+            DummyModel.objects.filter(get_selection_q(selection)).order_by("pk"),
+            [self.objs[0], self.objs[1], self.objs[3]],
+        )
+
+    def test_empty_selection_matches_nothing(self):
+        token, count = create_selection(DummyModel.objects.none(), self.user)
+        self.assertEqual(count, 0)
+        selection = get_selection(token, DummyModel, self.user)
+        self.assertFalse(DummyModel.objects.filter(get_selection_q(selection)).exists())
+
+    def test_selection_is_bound_to_model_and_user(self):
+        token, count = create_selection(DummyModel.objects.all(), self.user)
+        self.assertIsNone(get_selection(token, ComplexModel, self.user))
+        self.assertIsNone(get_selection(token, DummyModel, UserFactory.create()))
+        self.assertIsNone(get_selection("unknown", DummyModel, self.user))
+
+    def test_selection_from_filters(self):
+        self.client.force_login(self.user)
+        url = reverse("test_app:dummymodel-drf-selection")
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 4)
+
+    def test_selection_from_filters_is_stored_as_filters(self):
+        DummyModel.objects.filter(pk=self.objs[0].pk).update(public=True)
+        self.client.force_login(self.user)
+        url = reverse("test_app:dummymodel-drf-selection")
+        token = self.client.post(f"{url}?public=true").json()["token"]
+        selection = get_selection(token, DummyModel, self.user)
+        self.assertEqual(selection["filters"], "public=true")
+        self.assertNotIn("ranges", selection)
+        response = self.client.get(
+            DummyModel.get_format_list_url(), {"format": "csv", "selection": token}
+        )
+        self.assertEqual(len(response.getvalue().splitlines()), 2)
+
+    def test_fragmented_selection_is_one_parameter(self):
+        pks = [obj.pk for obj in self.objs[::2]]
+        token, count = create_selection(DummyModel.objects.filter(pk__in=pks))
+        selection = get_selection(token, DummyModel)
+        queryset = DummyModel.objects.filter(get_selection_q(selection))
+        sql, params = queryset.query.sql_with_params()
+        self.assertEqual(len(params), 1)
+        self.assertEqual(sorted(queryset.values_list("pk", flat=True)), pks)
+
+    def test_export_of_selection(self):
+        self.client.force_login(self.user)
+        url = reverse("test_app:dummymodel-drf-selection")
+        pks = f"{self.objs[0].pk},{self.objs[1].pk}"
+        token = self.client.post(url, {"pks": pks}).json()["token"]
+        response = self.client.get(
+            DummyModel.get_format_list_url(), {"format": "csv", "selection": token}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.getvalue().splitlines()), 3)
+
+    def test_export_of_expired_selection(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            DummyModel.get_format_list_url(), {"format": "csv", "selection": "expired"}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_pks(self):
+        self.client.force_login(self.user)
+        url = reverse("test_app:dummymodel-drf-selection")
+        response = self.client.post(url, {"pks": "1,a"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_pks_select_nothing(self):
+        self.client.force_login(self.user)
+        url = reverse("test_app:dummymodel-drf-selection")
+        response = self.client.post(url, {"pks": ""})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 0)
+
+    def test_pks_must_be_a_string(self):
+        self.client.force_login(self.user)
+        url = reverse("test_app:dummymodel-drf-selection")
+        response = self.client.post(
+            url, {"pks": [self.objs[0].pk]}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class MultiObjectSelectionTest(TestCase):
+    def setUp(self):
+        get_layers_cache().clear()
+        self.user = SuperUserFactory.create()
+        self.client.force_login(self.user)
+        self.objs = ComplexModelFactory.create_batch(3)
+        url = reverse("test_app:complexmodel-drf-selection")
+        pks = f"{self.objs[0].pk},{self.objs[1].pk}"
+        self.token = self.client.post(url, {"pks": pks}).json()["token"]
+
+    def test_multi_delete(self):
+        url = ComplexModel.get_multi_delete_url()
+        response = self.client.get(url, {"selection": self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["nb_objects"], 2)
+        response = self.client.post(f"{url}?selection={self.token}")
+        self.assertEqual(response.status_code, 302)
+        self.assertQuerySetEqual(ComplexModel.objects.all(), [self.objs[2]])
+
+    def test_multi_delete_records_deletions_in_bulk(self):
+        url = ComplexModel.get_multi_delete_url()
+        with mock.patch("mapentity.signals.invalidate_layer") as invalidate_layer:
+            with mock.patch.object(Tombstone, "record") as record:
+                self.client.post(f"{url}?selection={self.token}")
+        record.assert_not_called()
+        invalidate_layer.assert_called_once_with(ComplexModel)
+        self.assertEqual(
+            sorted(Tombstone.objects.values_list("object_id", flat=True)),
+            sorted([str(self.objs[0].pk), str(self.objs[1].pk)]),
+        )
+
+    def test_multi_update_sets_date_update(self):
+        before = timezone.now() - timedelta(days=1)
+        ComplexModel.objects.update(date_update=before)
+        url = ComplexModel.get_multi_update_url()
+        data = {
+            "public_en": "true",
+            "public_fr": "nothing",
+            "public_zh_hant": "nothing",
+            "located_in": "nothing",
+            "road": "nothing",
+        }
+        self.client.post(f"{url}?selection={self.token}", data)
+        self.assertEqual(ComplexModel.objects.filter(date_update__gt=before).count(), 2)
+
+    def test_multi_update(self):
+        url = ComplexModel.get_multi_update_url()
+        data = {
+            "public_en": "true",
+            "public_fr": "nothing",
+            "public_zh_hant": "nothing",
+            "located_in": "nothing",
+            "road": "nothing",
+        }
+        response = self.client.post(f"{url}?selection={self.token}", data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ComplexModel.objects.filter(public_en=True).count(), 2)
+
+    def test_selection_of_another_user(self):
+        self.client.force_login(SuperUserFactory.create())
+        url = ComplexModel.get_multi_delete_url()
+        response = self.client.get(url, {"selection": self.token})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ComplexModel.objects.count(), 3)
@@ -1,23 +1,44 @@
 import os
-from io import StringIO
+import sqlite3
+import zipfile
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock, skipIf
 
+import fiona
 from django.conf import settings
 from django.contrib.gis import gdal
 from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import Transform
+from django.db import connection
 from django.http import HttpResponse
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.utils import translation
+from rest_framework import serializers
 
-from mapentity.serializers import CSVSerializer, ZipShapeSerializer
+from mapentity.serializers import (
+    CSVSerializer,
+    GeoPackageSerializer,
+    ZipShapeSerializer,
+    get_flatgeobuf_property_type,
+)
 from mapentity.serializers.datatables import MapentityDatatableSerializer
 from mapentity.serializers.fields import CommaSeparatedRelatedField
+from mapentity.serializers.geojson import (
+    get_database_geojson_columns,
+    get_database_geojson_sql,
+    render_database_geojson_collection,
+)
+from mapentity.serializers.geopackage import get_geopackage_property_type
 from test_project.test_app.models import (
     DummyModel,
     ManikinModel,
     MushroomSpot,
+    Road,
     Tag,
 )
+from test_project.test_app.serializers import DummyGeojsonSerializer
 
 
 class CommonShapefileSerializerMixin:
@@ -147,6 +168,57 @@ class MushroomShapefileSerializerTest(CommonShapefileSerializerMixin, TestCase):
         feature = l_point[0]
         self.assertEqual(feature["name"].value, self.point1.name)
 
+    def test_zip_is_streamed_layer_after_layer(self):
+        serializer = ZipShapeSerializer()
+        chunks = list(
+            serializer.iter_zip(
+                MushroomSpot.objects.all(), MushroomSpot, ["id", "name"]
+            )
+        )
+        # One chunk per file of each layer, then zip central directory
+        self.assertEqual(len(chunks), 6 * 5 + 1)
+        with zipfile.ZipFile(BytesIO(b"".join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            shapefiles = [name for name in archive.namelist() if name.endswith(".shp")]
+            compress_types = {info.compress_type for info in archive.infolist()}
+        self.assertEqual(len(shapefiles), 6)
+        self.assertEqual(compress_types, {zipfile.ZIP_DEFLATED})
+        self.assertFalse(os.path.exists(serializer.path_directory))
+
+    def test_layers_are_split_in_database(self):
+        for _ in range(3):
+            MushroomSpot.objects.create(
+                serialized=f"SRID={settings.SRID};GEOMETRYCOLLECTION(POINT(0 0), LINESTRING(0 0, 1 1))"
+            )
+        serializer = ZipShapeSerializer()
+        # One query per layer, whatever the number of geometry collections
+        with self.assertNumQueries(6):
+            content = b"".join(
+                serializer.iter_zip(
+                    MushroomSpot.objects.all(), MushroomSpot, ["id", "name"]
+                )
+            )
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            self.assertEqual(len(archive.namelist()), 6 * 5)
+
+    def test_empty_layers_are_skipped(self):
+        serializer = ZipShapeSerializer()
+        queryset = MushroomSpot.objects.filter(pk=self.point1.pk)
+        layers = list(serializer.get_layers(queryset, MushroomSpot))
+        self.assertEqual([layer[2] for layer in layers], ["Point"])
+
+    def test_nothing_is_written_on_disk_on_error(self):
+        serializer = ZipShapeSerializer()
+        with mock.patch(
+            "mapentity.serializers.shapefile.get_serialized_properties",
+            side_effect=ValueError("Broken"),
+        ):
+            with self.assertRaisesRegex(ValueError, "Broken"):
+                serializer.serialize(
+                    MushroomSpot.objects.all(), stream=HttpResponse(), fields=["id"]
+                )
+        self.assertFalse(os.path.exists(serializer.path_directory))
+
 
 class NoGeomShapefileSerializerTest(CommonShapefileSerializerMixin, TestCase):
     def setUp(self):
@@ -163,6 +235,102 @@ class NoGeomShapefileSerializerTest(CommonShapefileSerializerMixin, TestCase):
             )
 
 
+class FlatGeobufPropertyTypeTest(TestCase):
+    def test_types_from_serializer_fields(self):
+        self.assertEqual(
+            get_flatgeobuf_property_type(serializers.IntegerField()), "int"
+        )
+        self.assertEqual(
+            get_flatgeobuf_property_type(serializers.FloatField()), "float"
+        )
+        self.assertEqual(
+            get_flatgeobuf_property_type(serializers.BooleanField()), "bool"
+        )
+
+    def test_labels_are_strings(self):
+        self.assertEqual(
+            get_flatgeobuf_property_type(
+                serializers.CharField(source="get_status_display")
+            ),
+            "str",
+        )
+        self.assertEqual(
+            get_flatgeobuf_property_type(
+                serializers.SlugRelatedField(slug_field="label", read_only=True)
+            ),
+            "str",
+        )
+
+
+class GeoPackageSerializerTest(TestCase):
+    def setUp(self):
+        MushroomSpot.geomfield = GeometryField(name="geom", srid=settings.SRID)
+        self.point = MushroomSpot.objects.create(
+            serialized=f"SRID={settings.SRID};POINT(0 0)", number=3, size=1.5
+        )
+        self.point.tags.add(Tag.objects.create(label="Tag1"))
+        MushroomSpot.objects.create(
+            serialized=f"SRID={settings.SRID};LINESTRING(0 0, 10 0)"
+        )
+        MushroomSpot.objects.create(
+            serialized=f"SRID={settings.SRID};GEOMETRYCOLLECTION(POINT(0 0), POLYGON((1 1, 2 2, 1 2, 1 1)))"
+        )
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, "export.gpkg")
+        GeoPackageSerializer().serialize(
+            MushroomSpot.objects.all(),
+            path=self.path,
+            fields=["id", "name", "number", "size", "boolean", "tags"],
+        )
+
+    def test_one_layer_per_geometry_type(self):
+        self.assertEqual(
+            fiona.listlayers(self.path),
+            [
+                "mushroomspot_point",
+                "mushroomspot_linestring",
+                "mushroomspot_multipoint",
+                "mushroomspot_multipolygon",
+            ],
+        )
+
+    def test_columns_are_typed(self):
+        with fiona.open(self.path, layer="mushroomspot_point") as layer:
+            self.assertEqual(
+                dict(layer.schema["properties"]),
+                {
+                    "id": "int",
+                    "name": "str",
+                    "number": "int",
+                    "size": "float",
+                    "boolean": "bool",
+                    "tags": "str",
+                },
+            )
+            properties = next(iter(layer))["properties"]
+        self.assertEqual(properties["id"], self.point.pk)
+        self.assertEqual(properties["number"], 3)
+        self.assertEqual(properties["size"], 1.5)
+        self.assertIs(properties["boolean"], True)
+        self.assertEqual(properties["tags"], "Tag1")
+
+    def test_relations_and_choices_are_display_values(self):
+        self.assertEqual(get_geopackage_property_type(Road, "tag"), "str")
+        field = MushroomSpot._meta.get_field("number")
+        with mock.patch.object(field, "choices", [(3, "Three")]):
+            self.assertEqual(
+                get_geopackage_property_type(MushroomSpot, "number"), "str"
+            )
+
+    def test_layers_have_spatial_index(self):
+        with sqlite3.connect(self.path) as connection:
+            tables = connection.execute(
+                "SELECT table_name FROM gpkg_extensions WHERE extension_name = 'gpkg_rtree_index'"
+            ).fetchall()
+        self.assertEqual(len(tables), 4)
+
+
 class CSVSerializerTests(TestCase):
     def setUp(self):
         self.point = MushroomSpot.objects.create()
@@ -206,6 +374,19 @@ class CSVSerializerTests(TestCase):
                 ),
             )
 
+    def test_chunks(self):
+        MushroomSpot.objects.create().tags.add(*Tag.objects.all())
+        chunks = list(
+            self.serializer.iter_chunks(
+                MushroomSpot.objects.prefetch_related("tags"),
+                fields=["id", "tags"],
+                chunk_size=1,
+            )
+        )
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0], "ID,tags\r\n")
+        self.assertEqual(chunks[1], f'{self.point.pk},"Tag1,Tag2"\r\n')
+
 
 class DatatableSerializerTests(TestCase):
     """Test MapentityDatatableSerializer for related field handling"""
@@ -366,3 +547,45 @@ class CommaSeparatedRelatedFieldTests(TestCase):
         result = field.to_representation(dummy.tags)
 
         self.assertEqual(result, "")
+
+
+class DatabaseGeojsonSerializerTests(TestCase):
+    def setUp(self):
+        self.queryset = DummyModel.objects.annotate(api_geom=Transform("geom", 4326))
+
+    def get_serializer(self, serializer_class=DummyGeojsonSerializer):
+        return serializer_class(self.queryset, many=True)
+
+    def test_plain_columns_are_pushed_down(self):
+        serializer = self.get_serializer()
+        columns = get_database_geojson_columns(serializer.child, self.queryset)
+        self.assertEqual(columns, [("id", "id"), ("name", "name")])
+
+    def test_declared_fields_are_not_pushed_down(self):
+        class DeclaredFieldSerializer(DummyGeojsonSerializer):
+            name = serializers.SerializerMethodField()
+
+            class Meta(DummyGeojsonSerializer.Meta):
+                pass
+
+            def get_name(self, obj):
+                return obj.name.upper()
+
+        serializer = self.get_serializer(DeclaredFieldSerializer)
+        self.assertIsNone(get_database_geojson_sql(serializer, self.queryset))
+
+    def test_geometry_must_be_transformed(self):
+        serializer = self.get_serializer()
+        queryset = DummyModel.objects.all()
+        self.assertIsNone(get_database_geojson_columns(serializer.child, queryset))
+
+    def test_sql_aggregates_features(self):
+        serializer = self.get_serializer()
+        sql, params = get_database_geojson_sql(serializer, self.queryset)
+        self.assertIn("json_agg", sql)
+        self.assertEqual(params[:5], [15, "id", "name", "test_app.dummymodel", 4326])
+
+    @skipIf(connection.vendor == "postgresql", "Rendered by database")
+    def test_other_databases_fall_back(self):
+        serializer = self.get_serializer()
+        self.assertIsNone(render_database_geojson_collection(serializer, self.queryset))
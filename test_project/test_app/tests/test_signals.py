@@ -1,8 +1,12 @@
 from unittest import mock
 
+from django.db.models.deletion import Collector
 from django.test import TestCase, override_settings
 
+from mapentity.models import Tombstone
 from mapentity.signals import migrate_tiles
+from test_project.test_app.models import DollModel, DummyModel, ManikinModel
+from test_project.test_app.tests.factories import DummyModelFactory
 
 
 class MockBaseLayer:
@@ -149,3 +153,21 @@ class MigrateTilesTestCase(TestCase):
         self.assertEqual(len(bl.objects._created), 2)
         self.assertEqual(bl.objects._created[0]["order"], 0)
         self.assertEqual(bl.objects._created[1]["order"], 1)
+
+
+class LayerSignalsTestCase(TestCase):
+    def test_other_models_keep_fast_deletes(self):
+        collector = Collector(using="default")
+        self.assertTrue(collector.can_fast_delete(Tombstone.objects.all()))
+
+    def test_unregistered_models_do_not_invalidate_layers(self):
+        with mock.patch("mapentity.signals.invalidate_layer") as invalidate_layer:
+            ManikinModel.objects.create().delete()
+        invalidate_layer.assert_not_called()
+
+    def test_many_to_many_of_registered_model(self):
+        dummy = DummyModelFactory.create()
+        doll = DollModel.objects.create()
+        with mock.patch("mapentity.signals.invalidate_layer") as invalidate_layer:
+            doll.dummies.add(dummy)
+        invalidate_layer.assert_called_once_with(DummyModel)
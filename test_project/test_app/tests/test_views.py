@@ -1,17 +1,27 @@
+import gzip
 import json
 import os
+import zipfile
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
 from unittest import mock
 
 import django
 import factory
+import fiona
+import mapbox_vector_tile
 from bs4 import BeautifulSoup
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.gis.geos import LineString
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.management import call_command
+from django.db import connection
 from django.test import RequestFactory, TestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 from django.utils.encoding import force_str
 from django.utils.translation import get_language
@@ -19,22 +29,29 @@ from faker import Faker
 from faker.providers import geo
 from freezegun import freeze_time
 
-from mapentity.models import LogEntry
-from mapentity.registry import app_settings
+from mapentity.cache import get_layers_cache
+from mapentity.models import LogEntry, Tombstone
+from mapentity.registry import app_settings, registry
 from mapentity.tests import MapEntityLiveTest, MapEntityTest
 from mapentity.tests.factories import AttachmentFactory, SuperUserFactory, UserFactory
 from mapentity.views import Convert, JSSettings, ServeAttachment
 
-from ..models import City, ComplexModel, DummyModel, FileType
+from ..models import City, ComplexModel, DummyModel, FileType, Road
 from ..views import (
     ComplexModelMultiDelete,
     ComplexModelMultiUpdate,
     DummyDetail,
+    DummyFormat,
     DummyList,
     DummyModelFilter,
     RoadList,
 )
-from .factories import ComplexModelFactory, DummyModelFactory, RoadFactory
+from .factories import (
+    ComplexModelFactory,
+    DummyModelFactory,
+    RoadFactory,
+    TagFactory,
+)
 
 fake = Faker("en_US")
 fake.add_provider(geo)
@@ -315,6 +332,7 @@ class SettingsViewTest(BaseTest):
                 "layer": "/api/modelname/drf/modelnames.geojson",
                 "mvt": "/api/modelname/drf/modelnames/mvt/{z}/{x}/{y}",
                 "tilejson": "/api/modelname/drf/modelnames/tilejson",
+                "mvt_composite": "/api/mvt/{z}/{x}/{y}",
                 "screenshot": "/map_screenshot/",
                 "detail": "/modelname/0/",
                 "popup": "/api/modelname/drf/modelnames/0/popup-content",
@@ -417,6 +435,429 @@ class MapEntityLayerViewTest(BaseTest):
         response = self.client.get(DummyModel.get_geojson_list_url() + "?name=toto")
         self.assertEqual(len(response.json()["features"]), 1)
 
+    def test_geojson_layer_is_served_compressed(self):
+        self.login()
+        url = DummyModel.get_geojson_list_url()
+        for i in range(2):
+            # Cache miss, then cache hit
+            response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            content = json.loads(gzip.decompress(response.content))
+            self.assertEqual(len(content["features"]), 31)
+
+    def test_geojson_layer_can_be_streamed(self):
+        self.login()
+        url = DummyModel.get_geojson_list_url()
+        expected = self.client.get(url).json()
+        get_layers_cache().clear()
+        streaming = {"GEOJSON_STREAMING": True, "GEOJSON_STREAMING_CHUNK_SIZE": 7}
+        with mock.patch.dict(app_settings, streaming):
+            response = self.client.get(url)
+            self.assertTrue(response.streaming)
+            content = b"".join(response.streaming_content)
+            self.assertEqual(json.loads(content), expected)
+            # Streamed content was stored in cache
+            response = self.client.get(url)
+            self.assertFalse(response.streaming)
+            self.assertEqual(response.content, content)
+
+    def test_geojson_layer_database_rendering_falls_back(self):
+        self.login()
+        url = DummyModel.get_geojson_list_url()
+        expected = self.client.get(url).json()
+        get_layers_cache().clear()
+        with mock.patch.dict(app_settings, {"GEOJSON_DATABASE_RENDERING": True}):
+            response = self.client.get(url)
+        self.assertEqual(response.json(), expected)
+
+    def test_geojson_layer_with_parameters_is_cached_per_filters(self):
+        self.login()
+        url = DummyModel.get_geojson_list_url()
+        response = self.client.get(url + "?name=toto&_=1")
+        self.assertEqual(len(response.json()["features"]), 1)
+        # Bypass save() so that layer freshness does not change
+        DummyModel.objects.filter(name="toto").update(name="titi")
+        response = self.client.get(url + "?_=2&name=toto")
+        self.assertEqual(len(response.json()["features"]), 1)
+        response = self.client.get(url + "?name=titi")
+        self.assertEqual(len(response.json()["features"]), 1)
+
+
+class LayerLanguageCacheTest(BaseTest):
+    def setUp(self):
+        get_layers_cache().clear()
+        self.login_as_superuser()
+
+    def test_translated_layers_are_detected(self):
+        dummy_options = registry.registry[DummyModel]
+        self.assertTrue(dummy_options.geojson_translated)
+        # Tile fields are annotations, which may be translated
+        self.assertTrue(dummy_options.vector_tiles_translated)
+        road_options = registry.registry[Road]
+        # Default GeoJSON serializer has identifiers only
+        self.assertFalse(road_options.geojson_translated)
+        self.assertTrue(road_options.vector_tiles_translated)
+        city_options = registry.registry[City]
+        self.assertFalse(city_options.geojson_translated)
+        self.assertFalse(city_options.vector_tiles_translated)
+
+    def test_viewset_needing_request_is_considered_translated(self):
+        options = registry.registry[City]
+        with mock.patch.object(
+            options.rest_viewset,
+            "get_layer_classes",
+            lambda viewset: viewset.request.GET.get("layers"),
+        ):
+            self.assertTrue(options.is_translated("is_vector_tiles_translated"))
+        self.assertFalse(options.is_translated("is_vector_tiles_translated"))
+
+    def test_untranslated_layer_is_shared_between_languages(self):
+        road = RoadFactory.create()
+        url = Road.get_geojson_list_url()
+        expected = self.client.get(url, headers={"Accept-Language": "en"}).json()
+        # Bypass save() so that layer freshness does not change
+        moved = LineString((0, 0), (1, 1), srid=4326)
+        Road.objects.filter(pk=road.pk).update(geom=moved)
+        response = self.client.get(url, headers={"Accept-Language": "fr"})
+        self.assertEqual(response.json(), expected)
+
+    def test_translated_layer_is_cached_per_language(self):
+        obj = DummyModelFactory.create(name="toto")
+        url = DummyModel.get_geojson_list_url()
+        response = self.client.get(url, headers={"Accept-Language": "en"})
+        self.assertEqual(response.json()["features"][0]["properties"]["name"], "toto")
+        # Bypass save() so that layer freshness does not change
+        DummyModel.objects.filter(pk=obj.pk).update(name_fr="titi")
+        response = self.client.get(url, headers={"Accept-Language": "fr"})
+        self.assertEqual(response.json()["features"][0]["properties"]["name"], "titi")
+
+
+class QueryPlanningViewTest(BaseTest):
+    """Number of queries does not depend on the number of listed objects"""
+
+    def setUp(self):
+        get_layers_cache().clear()
+        self.login_as_superuser()
+
+    def create_roads(self, number):
+        for _ in range(number):
+            RoadFactory.create(tag=TagFactory.create())
+
+    def create_dummies(self, number):
+        # With a tag each
+        DummyModelFactory.create_batch(number)
+
+    def assertConstantQueries(self, create, url):
+        create(2)
+        # Warm up caches (content types, permissions...)
+        self.client.get(url).getvalue()
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url)
+            # Streamed content is read as it is sent
+            response.getvalue()
+        self.assertEqual(response.status_code, 200)
+        create(5)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+            response.getvalue()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(few), len(many))
+
+    def test_datatables_list_with_foreign_key(self):
+        self.assertConstantQueries(self.create_roads, Road.get_datatablelist_url())
+
+    def test_datatables_list_with_many_to_many(self):
+        url = DummyModel.get_datatablelist_url()
+        self.assertConstantQueries(self.create_dummies, url)
+
+    def test_json_list_with_many_to_many(self):
+        url = "/api/dummymodel/drf/dummymodels.json"
+        self.assertConstantQueries(self.create_dummies, url)
+
+    def test_csv_export_with_foreign_key(self):
+        url = Road.get_format_list_url() + "?format=csv"
+        self.assertConstantQueries(self.create_roads, url)
+
+    def test_csv_export_is_streamed(self):
+        self.create_roads(3)
+        response = self.client.get(Road.get_format_list_url() + "?format=csv")
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(response.getvalue().splitlines()), 4)
+
+    def test_csv_export_with_many_to_many(self):
+        url = DummyModel.get_format_list_url() + "?format=csv"
+        with mock.patch.object(DummyFormat, "columns", ["id", "name", "tags"]):
+            self.assertConstantQueries(self.create_dummies, url)
+
+    def test_shapefile_export_with_many_to_many(self):
+        url = DummyModel.get_format_list_url() + "?format=shp"
+        with mock.patch.object(DummyFormat, "columns", ["id", "name", "tags"]):
+            self.assertConstantQueries(self.create_dummies, url)
+
+    def test_shapefile_export_is_streamed(self):
+        self.create_dummies(3)
+        response = self.client.get(DummyModel.get_format_list_url() + "?format=shp")
+        self.assertTrue(response.streaming)
+        self.assertNotIn("Content-length", response)
+        with zipfile.ZipFile(BytesIO(response.getvalue())) as archive:
+            self.assertIn("Point.shp", archive.namelist())
+
+
+class DeltaLayerViewTest(BaseTest):
+    def setUp(self):
+        get_layers_cache().clear()
+        self.login_as_superuser()
+        with freeze_time("2026-01-01 10:00"):
+            self.objects = DummyModelFactory.create_batch(3)
+        self.url = DummyModel.get_geojson_list_url()
+
+    def test_changes_since_date(self):
+        with freeze_time("2026-01-01 11:00"):
+            self.objects[0].save()
+            deleted_pk = self.objects[1].pk
+            self.objects[1].delete()
+            response = self.client.get(self.url, {"since": "2026-01-01T10:30:00Z"})
+        self.assertEqual(response.status_code, 200)
+        content = response.json()
+        self.assertEqual(
+            [feature["properties"]["id"] for feature in content["features"]],
+            [self.objects[0].pk],
+        )
+        self.assertEqual(content["deleted"], [deleted_pk])
+        self.assertTrue(content["version"].isdigit())
+
+    def test_no_changes_since_version(self):
+        with freeze_time("2026-01-01 11:00"):
+            response = self.client.get(self.url, {"since": "2026-01-01T10:30:00Z"})
+            version = response.json()["version"]
+            response = self.client.get(self.url, {"since": version})
+        content = response.json()
+        self.assertEqual(content["features"], [])
+        self.assertEqual(content["deleted"], [])
+
+    def test_changes_committed_after_version_are_not_missed(self):
+        with freeze_time("2026-01-01 11:00"):
+            response = self.client.get(self.url, {"since": "2026-01-01T10:30:00Z"})
+            version = response.json()["version"]
+        # Saved before previous delta, committed after it
+        DummyModel.objects.filter(pk=self.objects[2].pk).update(
+            date_update=datetime(2026, 1, 1, 10, 59, 59, tzinfo=dt_timezone.utc)
+        )
+        with freeze_time("2026-01-01 11:01"):
+            response = self.client.get(self.url, {"since": version})
+        self.assertEqual(
+            [feature["properties"]["id"] for feature in response.json()["features"]],
+            [self.objects[2].pk],
+        )
+
+    def test_outdated_tombstones_are_purged(self):
+        with freeze_time("2026-01-01 11:00"):
+            self.objects[0].delete()
+        with freeze_time("2026-01-01 12:00"):
+            self.objects[1].delete()
+        with freeze_time("2026-01-08 11:30"):
+            call_command("purge_tombstones", stdout=StringIO())
+        self.assertEqual(Tombstone.objects.count(), 1)
+
+    def test_outdated_since_returns_whole_layer(self):
+        with freeze_time("2026-03-01 10:00"):
+            response = self.client.get(self.url, {"since": "2026-01-01T10:30:00Z"})
+        content = response.json()
+        self.assertEqual(len(content["features"]), 3)
+        self.assertNotIn("deleted", content)
+
+    def test_invalid_since(self):
+        response = self.client.get(self.url, {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+
+class FlatGeobufViewTest(BaseTest):
+    def setUp(self):
+        self.login_as_superuser()
+        RoadFactory.create_batch(3)
+        self.temp_dir = TemporaryDirectory()
+        patcher = mock.patch.dict(app_settings, {"TEMP_DIR": self.temp_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+        self.url = reverse("test_app:road-drf-list", kwargs={"format": "fgb"})
+
+    def read_features(self, content):
+        with fiona.io.MemoryFile(content) as memfile:
+            with memfile.open() as layer:
+                return list(layer)
+
+    def test_layer_features(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/flatgeobuf")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        features = self.read_features(b"".join(response.streaming_content))
+        self.assertEqual(len(features), 3)
+
+    def test_layer_file_is_cached_per_freshness(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        RoadFactory.create()
+        response = self.client.get(self.url)
+        self.assertNotEqual(response["ETag"], etag)
+        features = self.read_features(b"".join(response.streaming_content))
+        self.assertEqual(len(features), 4)
+        # Outdated file was removed
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.temp_dir.name, "flatgeobuf"))), 1
+        )
+
+    def test_least_recently_used_files_are_removed(self):
+        directory = os.path.join(self.temp_dir.name, "flatgeobuf")
+        os.makedirs(directory)
+        for i, name in enumerate(("old.fgb", "recent.fgb")):
+            with open(os.path.join(directory, name), "wb"):
+                pass
+            os.utime(os.path.join(directory, name), (i, i))
+        with mock.patch.dict(app_settings, {"FLATGEOBUF_CACHE_MAX_FILES": 2}):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        files = os.listdir(directory)
+        self.assertEqual(len(files), 2)
+        self.assertIn("recent.fgb", files)
+
+    def test_range_request(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=0-7"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b"fgb\x03fgb\x01")
+        self.assertTrue(response["Content-Range"].startswith("bytes 0-7/"))
+
+    def test_format_list_export(self):
+        response = self.client.get(Road.get_format_list_url() + "?format=fgb")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(".fgb", response["Content-Disposition"])
+        features = self.read_features(b"".join(response.streaming_content))
+        self.assertEqual(len(features), 3)
+
+
+class GeoPackageViewTest(BaseTest):
+    def setUp(self):
+        self.login_as_superuser()
+        DummyModelFactory.create_batch(3)
+        self.temp_dir = TemporaryDirectory()
+        patcher = mock.patch.dict(app_settings, {"TEMP_DIR": self.temp_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_format_list_export(self):
+        response = self.client.get(DummyModel.get_format_list_url() + "?format=gpkg")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/geopackage+sqlite3")
+        self.assertIn(".gpkg", response["Content-Disposition"])
+        # Temporary file is removed once opened by response
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+        path = os.path.join(self.temp_dir.name, "export.gpkg")
+        with open(path, "wb") as f:
+            f.write(response.getvalue())
+        self.assertEqual(fiona.listlayers(path), ["dummymodel_point"])
+        with fiona.open(path) as layer:
+            self.assertEqual(len(layer), 3)
+
+
+class TilesArchiveViewTest(BaseTest):
+    def setUp(self):
+        self.login_as_superuser()
+        DummyModelFactory.create(geom="SRID=4326;POINT(0.5 0.5)")
+        self.archives_dir = TemporaryDirectory()
+        patcher = mock.patch.dict(
+            app_settings, {"MVT_ARCHIVES_DIR": self.archives_dir.name}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.archives_dir.cleanup)
+
+    def export(self, fmt):
+        call_command(
+            "export_mvt_tiles",
+            models=["test_app.dummymodel"],
+            bbox="-1,-1,1,1",
+            max_zoom=2,
+            processes=1,
+            languages=["en"],
+            format=fmt,
+            stdout=StringIO(),
+        )
+
+    def get_archive(self, fmt, **params):
+        return self.client.get(
+            DummyModel.get_format_list_url(),
+            {"format": fmt, **params},
+            headers={"Accept-Language": "en"},
+        )
+
+    def test_mbtiles_archive(self):
+        self.export("mbtiles")
+        response = self.get_archive("mbtiles")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.sqlite3")
+        self.assertIn(".mbtiles", response["Content-Disposition"])
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"SQLite"))
+
+    def test_pmtiles_archive(self):
+        self.export("pmtiles")
+        response = self.get_archive("pmtiles")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.pmtiles")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"PMTiles"))
+
+    def test_archive_is_not_rendered_by_view(self):
+        response = self.get_archive("mbtiles")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(os.listdir(self.archives_dir.name), [])
+
+    def test_archive_can_not_be_filtered(self):
+        self.export("mbtiles")
+        response = self.get_archive("mbtiles", name="toto")
+        self.assertEqual(response.status_code, 400)
+
+
+class CompositeMVTViewTest(BaseTest):
+    def setUp(self):
+        self.dummy = DummyModelFactory.create(geom="SRID=4326;POINT(0.5 0.5)")
+        RoadFactory.create(geom="SRID=4326;LINESTRING(0.5 0.5, 0.6 0.6)")
+        self.url = reverse("mapentity:mvt_composite", kwargs={"z": 0, "x": 0, "y": 0})
+
+    def get_layers(self, response):
+        self.assertEqual(response.status_code, 200)
+        return (
+            set(mapbox_vector_tile.decode(response.content))
+            if response.content
+            else set()
+        )
+
+    def test_one_tile_layer_per_model(self):
+        self.login_as_superuser()
+        response = self.client.get(self.url, {"layers": "dummymodel,road"})
+        self.assertEqual(self.get_layers(response), {"dummymodel", "road"})
+
+    def test_layers_are_restricted_to_user_permissions(self):
+        self.login()
+        self.user.user_permissions.add(
+            Permission.objects.get(codename="read_dummymodel")
+        )
+        response = self.client.get(self.url, {"layers": "dummymodel,road"})
+        self.assertEqual(self.get_layers(response), {"dummymodel"})
+
+    def test_etag_changes_with_layers_content(self):
+        self.login_as_superuser()
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.dummy.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
 
 class DetailViewTest(BaseTest):
     def setUp(self):